@@ -0,0 +1,117 @@
+'''
+Measures what response compression saves on historical revision
+responses: bytes sent and CPU time per response for every available
+encoding, compressing on every request vs sending the stored
+pre-compressed body, and the stored size of compressed content at rest.
+
+  $ python -m benchmarks.compression_benchmark
+  $ python -m benchmarks.compression_benchmark --revisions 100 --content-size 20000
+'''
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from src.compression import available_encodings, compress
+from src.database_data_handlers import DatabaseManager
+from src.document_store_actions import DocumentStoreActions
+from src.helper_functions import to_epoch_microseconds
+from src.json_encoding import dumps_bytes
+from src.sqlite import SqliteDB
+from src.storage_engines import CompressedStorageEngine, FullCopyStorageEngine
+
+START_TIME = to_epoch_microseconds("2023-01-01 00:00:00")
+TITLE = "Compressed document"
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+def generate_content(random_generator, content_size):
+  words = []
+  size = 0
+  while size < content_size:
+    word = random_generator.choice(WORDS)
+    words.append(word)
+    size += len(word) + 1
+
+  return " ".join(words)
+
+def seed_database(database_name, storage_engine, revisions, content_size):
+  SqliteDB(database_name).database_setup()
+  random_generator = random.Random(42)
+
+  database_manager = DatabaseManager(database_name, storage_engine)
+  for revision in range(revisions):
+    database_manager.save_data_to_db(TITLE, START_TIME + revision * 60000000, generate_content(random_generator, content_size))
+
+  with database_manager.connection_pool.cursor() as cursor:
+    return cursor.execute("SELECT SUM(LENGTH(document_content)) FROM documents_data").fetchone()[0]
+
+def cpu_ms_per_call(function, arguments_list):
+  start = time.process_time()
+  for arguments in arguments_list:
+    function(*arguments)
+
+  return round((time.process_time() - start) / len(arguments_list) * 1000, 4)
+
+def run_benchmark(revisions, content_size):
+  results = {"revisions": revisions, "content_size": content_size}
+
+  with tempfile.TemporaryDirectory() as directory:
+    stored_bytes = {}
+    for name, storage_engine in [( "full_copy", FullCopyStorageEngine(), ), ( "zlib_at_rest", CompressedStorageEngine(), )]:
+      stored_bytes[name] = seed_database(os.path.join(directory, f"{name}.db"), storage_engine, revisions, content_size)
+    results["stored_content_bytes"] = stored_bytes
+
+    database_name = os.path.join(directory, "full_copy.db")
+    document_store_actions = DocumentStoreActions(database_name, precompress_historical=True)
+    # Every revision but the latest is historical
+    lookups = []
+    for revision in range(revisions - 1):
+      timestamp = START_TIME + revision * 60000000
+      document_id = document_store_actions.get_revision_info_at_a_given_timestamp(TITLE, timestamp)[3]
+      lookups.append(( TITLE, timestamp, document_id, ))
+
+    identity_bytes = sum(
+      len(dumps_bytes(document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)))
+      for title, timestamp, _ in lookups
+    )
+    results["identity"] = {
+      "bytes_per_response": identity_bytes // len(lookups),
+      "cpu_ms_per_response": cpu_ms_per_call(
+        lambda title, timestamp, _: dumps_bytes(document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)),
+        lookups
+      )
+    }
+
+    for encoding in available_encodings():
+      def compress_per_request(title, timestamp, _):
+        return compress(dumps_bytes(document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)), encoding)
+
+      def send_precompressed(title, timestamp, document_id):
+        return document_store_actions.get_encoded_historical_revision(title, timestamp, document_id, encoding)
+
+      compressed_bytes = sum(len(compress_per_request(*lookup)) for lookup in lookups)
+      # Fills precompressed_revisions before it is timed
+      for lookup in lookups:
+        send_precompressed(*lookup)
+
+      results[encoding] = {
+        "bytes_per_response": compressed_bytes // len(lookups),
+        "bandwidth_saved": round(1 - compressed_bytes / identity_bytes, 3),
+        "cpu_ms_per_response_compressed_per_request": cpu_ms_per_call(compress_per_request, lookups),
+        "cpu_ms_per_response_precompressed": cpu_ms_per_call(send_precompressed, lookups)
+      }
+
+    document_store_actions.connection_pool.close_all()
+
+  print(json.dumps(results))
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--revisions", type=int, default=200)
+  parser.add_argument("--content-size", type=int, default=10000)
+  args = parser.parse_args()
+
+  run_benchmark(args.revisions, args.content_size)
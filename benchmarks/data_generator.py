@@ -0,0 +1,91 @@
+'''
+Seeded generator of synthetic wiki data. Edits follow a Zipfian
+distribution over titles, so a few titles get most of the revisions as
+on a real wiki, and every revision rewrites a few words of the previous
+one. The same seed always produces the same documents.
+
+  $ python -m benchmarks.data_generator --titles 1000 --revisions-per-title 20 --output wiki.jsonl
+  $ python -m src.bulk_import wiki.jsonl
+'''
+import argparse
+import itertools
+import json
+import random
+import sys
+
+START_TIME = 1672531200000000
+WORDS = (
+  "the of and to in is was for on with as by at from his her an which or "
+  "planet river city history language music science species war empire "
+  "century population region university government system theory art"
+).split()
+
+def zipf_cumulative_weights(count, exponent):
+  '''
+  Cumulative weights giving the item of rank r a probability
+  proportional to 1 / r ** exponent, for random.choices.
+  '''
+  return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+def generate_content(random_generator, content_size):
+  words = []
+  size = 0
+  while size < content_size:
+    word = random_generator.choice(WORDS)
+    words.append(word)
+    size += len(word) + 1
+
+  return " ".join(words)
+
+def edit_content(random_generator, content, edits = 3):
+  words = content.split(" ")
+  for _ in range(edits):
+    words[random_generator.randrange(len(words))] = random_generator.choice(WORDS)
+
+  return " ".join(words)
+
+def title_name(index):
+  return f"Title {index}"
+
+def generate_documents(titles, revisions_per_title, zipf_exponent = 1.1, content_size = 2000, seed = 42):
+  '''
+  Yields {"title", "creation_timestamp", "content"} dicts in creation
+  order: one first revision per title and then titles * (revisions_per_title - 1)
+  edits spread over the titles with a Zipfian distribution, a minute apart.
+  '''
+  random_generator = random.Random(seed)
+  contents = {}
+  minute = 0
+
+  for index in range(titles):
+    contents[index] = generate_content(random_generator, content_size)
+    yield {"title": title_name(index), "creation_timestamp": START_TIME + minute * 60000000, "content": contents[index]}
+    minute += 1
+
+  cumulative_weights = zipf_cumulative_weights(titles, zipf_exponent)
+  for _ in range(titles * (revisions_per_title - 1)):
+    index = random_generator.choices(range(titles), cum_weights=cumulative_weights)[0]
+    contents[index] = edit_content(random_generator, contents[index])
+    yield {"title": title_name(index), "creation_timestamp": START_TIME + minute * 60000000, "content": contents[index]}
+    minute += 1
+
+def add_arguments(parser):
+  parser.add_argument("--titles", type=int, default=1000)
+  parser.add_argument("--revisions-per-title", type=int, default=10, help="average number of revisions per title")
+  parser.add_argument("--zipf-exponent", type=float, default=1.1, help="skew of edits towards popular titles, 0 spreads them evenly")
+  parser.add_argument("--content-size", type=int, default=2000, help="characters per document")
+  parser.add_argument("--seed", type=int, default=42)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  add_arguments(parser)
+  parser.add_argument("--output", help="JSON lines file to write, standard output by default")
+  args = parser.parse_args()
+
+  output = open(args.output, "w") if args.output else sys.stdout
+  try:
+    for document in generate_documents(args.titles, args.revisions_per_title, args.zipf_exponent, args.content_size, args.seed):
+      output.write(json.dumps(document) + "\n")
+  finally:
+    if args.output:
+      output.close()
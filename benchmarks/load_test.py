@@ -0,0 +1,169 @@
+'''
+Load test for the document API. Seeds a local SQLite file, starts the Flask
+app and, when uvicorn is installed, the ASGI app on it, then sends a mix of
+read requests from concurrent clients and reports requests per second and
+p50/p99 latency for each.
+
+  $ python -m benchmarks.load_test
+  $ python -m benchmarks.load_test --concurrency 32 --duration 20
+  $ python -m benchmarks.load_test --url http://127.0.0.1:8080
+'''
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from urllib.parse import quote, urlsplit
+
+from src.bulk_import import BulkImporter
+from src.sqlite import SqliteDB
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+  "flask": [sys.executable, "-c", "import sys, server; server.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"],
+  "asgi": [sys.executable, "-m", "uvicorn", "src.asgi_app:app", "--host", "127.0.0.1", "--log-level", "warning", "--port"]
+}
+
+def seed_database(database_name, titles, revisions_per_title):
+  SqliteDB(database_name).database_setup()
+  BulkImporter(database_name).import_documents(
+    {
+      "title": f"title {title}",
+      "creation_timestamp": 1672531200000000 + revision * 60000000,
+      "content": f"revision {revision} of title {title} " + "lorem ipsum " * 50
+    }
+    for title in range(titles)
+    for revision in range(revisions_per_title)
+  )
+
+def request_paths(titles, revisions_per_title, count, seed = 42):
+  random_generator = random.Random(seed)
+  paths = []
+
+  for _ in range(count):
+    title = quote(f"title {random_generator.randrange(titles)}")
+    choice = random_generator.random()
+    if choice < 0.5:
+      paths.append(f"/documents/{title}/latest")
+    elif choice < 0.8:
+      timestamp = quote(str(1672531200000000 + random_generator.randrange(revisions_per_title) * 60000000))
+      paths.append(f"/documents/{title}/{timestamp}")
+    elif choice < 0.95:
+      paths.append("/documents")
+    else:
+      paths.append(f"/documents/{title}")
+
+  return paths
+
+def run_load(base_url, paths, concurrency, duration):
+  url = urlsplit(base_url)
+  latencies = []
+  errors = [0]
+  lock = threading.Lock()
+  deadline = time.perf_counter() + duration
+
+  def client(client_index):
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    request_index = client_index
+
+    while time.perf_counter() < deadline:
+      start = time.perf_counter()
+      try:
+        connection.request("GET", paths[request_index % len(paths)])
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 500:
+          local_errors += 1
+      except (http.client.HTTPException, OSError):
+        local_errors += 1
+        connection.close()
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+      local_latencies.append(time.perf_counter() - start)
+      request_index += concurrency
+
+    with lock:
+      latencies.extend(local_latencies)
+      errors[0] += local_errors
+
+  threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+  start = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - start
+
+  latencies.sort()
+  return {
+    "requests": len(latencies),
+    "errors": errors[0],
+    "requests_per_second": round(len(latencies) / elapsed, 1),
+    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+    "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3)
+  }
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+def wait_for_server(port, timeout = 15):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    try:
+      with socket.create_connection(("127.0.0.1", port), timeout=1):
+        return
+    except OSError:
+      time.sleep(0.1)
+  raise RuntimeError(f"Server on port {port} did not start")
+
+def benchmark_server(name, directory, paths, concurrency, duration):
+  port = free_port()
+  environment = dict(os.environ, PYTHONPATH=REPOSITORY_ROOT)
+  process = subprocess.Popen(SERVERS[name] + [str(port)], cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  try:
+    wait_for_server(port)
+    return run_load(f"http://127.0.0.1:{port}", paths, concurrency, duration)
+  finally:
+    process.terminate()
+    process.wait()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--url", help="Load test an already running server instead of starting one")
+  parser.add_argument("--titles", type=int, default=1000)
+  parser.add_argument("--revisions-per-title", type=int, default=20)
+  parser.add_argument("--concurrency", type=int, default=16)
+  parser.add_argument("--duration", type=float, default=10)
+  args = parser.parse_args()
+
+  paths = request_paths(args.titles, args.revisions_per_title, 10000)
+
+  if args.url:
+    print(json.dumps({"server": args.url, **run_load(args.url, paths, args.concurrency, args.duration)}))
+    raise SystemExit()
+
+  with tempfile.TemporaryDirectory() as directory:
+    seed_database(os.path.join(directory, "wiki_documents_db.db"), args.titles, args.revisions_per_title)
+
+    for name in SERVERS:
+      if name == "asgi":
+        try:
+          import uvicorn
+        except ImportError:
+          print(json.dumps({"server": name, "skipped": "uvicorn is not installed"}))
+          continue
+
+      result = benchmark_server(name, directory, paths, args.concurrency, args.duration)
+      print(json.dumps({"server": name, **result}))
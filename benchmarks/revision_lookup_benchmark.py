@@ -0,0 +1,105 @@
+'''
+Measures point-in-time revision lookup latency as the number of stored
+revisions grows, with and without the revision lookup index.
+
+  $ python -m benchmarks.revision_lookup_benchmark
+  $ python -m benchmarks.revision_lookup_benchmark --sizes 1000 10000000
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+from src.connection_pool import get_connection_pool
+from src.document_store_actions import DocumentStoreActions
+from src.helper_functions import to_epoch_microseconds
+from src.sqlite import SqliteDB
+
+START_TIME = to_epoch_microseconds("2023-01-01 00:00:00")
+
+def revision_timestamp(minutes):
+  return START_TIME + minutes * 60000000
+
+def populate_database(database_name, revisions, revisions_per_title, batch_size = 50000):
+  SqliteDB(database_name).database_setup()
+  connection_pool = get_connection_pool(database_name)
+
+  titles_count = max(1, revisions // revisions_per_title)
+
+  with connection_pool.cursor() as cursor:
+    cursor.executemany(
+      "INSERT INTO titles (title_id, title) VALUES (?, ?)",
+      ( (index + 1, f"title {index}") for index in range(titles_count) )
+    )
+
+  for batch_start in range(0, revisions, batch_size):
+    metadata_rows = []
+    data_rows = []
+    for revision in range(batch_start, min(revisions, batch_start + batch_size)):
+      metadata_rows.append(( revision + 1, str(uuid.uuid4()), revision_timestamp(revision), revision % titles_count + 1, ))
+      data_rows.append(( revision + 1, f"revision {revision} " + "lorem ipsum " * 16, ))
+
+    with connection_pool.cursor() as cursor:
+      cursor.executemany("INSERT INTO documents_metadata (document_id, document_uuid, creation_timestamp, title_id) VALUES (?, ?, ?, ?)", metadata_rows)
+      cursor.executemany("INSERT INTO documents_data (document_id, document_content) VALUES (?, ?)", data_rows)
+
+  return titles_count
+
+def time_lookups(document_store_actions, titles_count, revisions, queries):
+  random_generator = random.Random(42)
+  latencies = []
+
+  for _ in range(queries):
+    title = f"title {random_generator.randrange(titles_count)}"
+    timestamp = revision_timestamp(random_generator.randrange(titles_count, revisions))
+
+    start = time.perf_counter()
+    document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)
+    latencies.append(time.perf_counter() - start)
+
+  latencies.sort()
+  return {
+    "p50_ms": round(statistics.median(latencies) * 1000, 4),
+    "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 4)
+  }
+
+def run_benchmark(sizes, revisions_per_title, queries, unindexed_limit):
+  results = []
+
+  with tempfile.TemporaryDirectory() as directory:
+    for revisions in sizes:
+      database_name = os.path.join(directory, f"revisions_{revisions}.db")
+      titles_count = populate_database(database_name, revisions, revisions_per_title)
+      document_store_actions = DocumentStoreActions(database_name)
+
+      result = {
+        "revisions": revisions,
+        "titles": titles_count,
+        "indexed": time_lookups(document_store_actions, titles_count, revisions, queries)
+      }
+
+      # Full scans get slow quickly, so only measure them on smaller tables
+      if revisions <= unindexed_limit:
+        with document_store_actions.connection_pool.cursor() as cursor:
+          cursor.execute("DROP INDEX documents_metadata_title_id_creation_timestamp")
+        result["unindexed"] = time_lookups(document_store_actions, titles_count, revisions, max(1, queries // 10))
+
+      document_store_actions.connection_pool.close_all()
+      results.append(result)
+      print(json.dumps(result))
+
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+  parser.add_argument("--revisions-per-title", type=int, default=100)
+  parser.add_argument("--queries", type=int, default=1000)
+  parser.add_argument("--unindexed-limit", type=int, default=1000000)
+  args = parser.parse_args()
+
+  run_benchmark(args.sizes, args.revisions_per_title, args.queries, args.unindexed_limit)
@@ -0,0 +1,81 @@
+'''
+Compares the old NumPy row-flattening path (numpy.concatenate followed by
+Flask's jsonify) with the Revision records and dumps_bytes encoder:
+latency and allocated bytes per request, and cold import time.
+The old path is only measured when NumPy is installed.
+
+  $ python -m benchmarks.serialization_benchmark
+'''
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from flask import Flask, jsonify
+
+from src.json_encoding import dumps_bytes
+from src.records import Revision
+
+def old_path(app, rows):
+  import numpy
+
+  with app.app_context():
+    return jsonify(list(numpy.concatenate(rows))).get_data()
+
+def new_path(app, rows):
+  return dumps_bytes(Revision(*rows[0]))
+
+def measure(function, app, rows, iterations):
+  function(app, rows)
+
+  start = time.perf_counter()
+  for _ in range(iterations):
+    function(app, rows)
+  latency = (time.perf_counter() - start) / iterations
+
+  tracemalloc.start()
+  for _ in range(100):
+    function(app, rows)
+  allocated_bytes = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return {
+    "latency_us": round(latency * 1000000, 2),
+    "peak_allocated_bytes": allocated_bytes
+  }
+
+def import_time(module):
+  code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+  result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+  if result.returncode != 0:
+    return None
+  return round(float(result.stdout) * 1000, 1)
+
+def run_benchmark(content_size, iterations):
+  app = Flask(__name__)
+  rows = [( "Earth", "2023-03-22 14:00:00.000000", "lorem ipsum " * (content_size // 12), )]
+  results = {"content_size": content_size}
+
+  try:
+    import numpy
+    results["numpy_concatenate_jsonify"] = measure(old_path, app, rows, iterations)
+    results["numpy_import_ms"] = import_time("numpy")
+  except ImportError:
+    results["numpy_concatenate_jsonify"] = "skipped, numpy is not installed"
+
+  results["revision_dumps_bytes"] = measure(new_path, app, rows, iterations)
+  results["document_store_actions_import_ms"] = import_time("src.document_store_actions")
+
+  print(json.dumps(results))
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--content-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+  parser.add_argument("--iterations", type=int, default=2000)
+  args = parser.parse_args()
+
+  for content_size in args.content_sizes:
+    run_benchmark(content_size, args.iterations)
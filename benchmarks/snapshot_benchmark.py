@@ -0,0 +1,115 @@
+'''
+Compares serving reads from the in-memory snapshot with reading the
+database file: latest revisions, historical revisions and the title
+summary, on their own and while another thread keeps writing, and how
+long a refresh of the snapshot takes.
+
+  $ python -m benchmarks.snapshot_benchmark
+  $ python -m benchmarks.snapshot_benchmark --titles 2000 --revisions-per-title 20
+'''
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.data_generator import START_TIME, generate_documents, title_name
+from src.bulk_import import BulkImporter
+from src.document_store_actions import DocumentStoreActions
+from src.helper_functions import format_timestamp
+from src.sqlite import SqliteDB
+
+def build_lookups(titles, revisions, count, seed = 42):
+  random_generator = random.Random(seed)
+  # Every title has its first revision by minute `titles`
+  last_minute = titles * revisions - 1
+  return [
+    ( title_name(random_generator.randrange(titles)), format_timestamp(START_TIME + random_generator.randint(titles, last_minute) * 60000000), )
+    for _ in range(count)
+  ]
+
+def ms_per_call(function, arguments_list):
+  start = time.perf_counter()
+  for arguments in arguments_list:
+    function(*arguments)
+
+  return round((time.perf_counter() - start) / len(arguments_list) * 1000, 4)
+
+def time_reads(document_store_actions, lookups):
+  # Each read skips the revision cache, which would hide the database
+  def read_latest(title, _):
+    document_store_actions.cache.clear()
+    document_store_actions.get_latest_document_revision(title)
+
+  def read_historical(title, timestamp):
+    document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)
+
+  return {
+    "latest_ms": ms_per_call(read_latest, lookups),
+    "historical_ms": ms_per_call(read_historical, lookups),
+    "title_summaries_ms": ms_per_call(lambda: document_store_actions.get_title_summaries("recent", 100), [()] * 50)
+  }
+
+def time_reads_under_writes(document_store_actions, writer, lookups, first_minute):
+  stop = threading.Event()
+  writes = 0
+
+  def write():
+    nonlocal writes
+    while not stop.is_set():
+      timestamp = format_timestamp(START_TIME + (first_minute + writes) * 60000000)
+      writer.post_new_document_revision(title_name(writes % 10), timestamp, f"Concurrent edit {writes}")
+      writes += 1
+
+  thread = threading.Thread(target=write)
+  thread.start()
+  try:
+    timings = time_reads(document_store_actions, lookups)
+  finally:
+    stop.set()
+    thread.join()
+
+  timings["concurrent_writes"] = writes
+  return timings
+
+def run_benchmark(titles, revisions_per_title, lookups_count):
+  results = {"titles": titles, "revisions_per_title": revisions_per_title, "lookups": lookups_count}
+  lookups = build_lookups(titles, revisions_per_title, lookups_count)
+
+  with tempfile.TemporaryDirectory() as directory:
+    database_name = os.path.join(directory, "wiki.db")
+    SqliteDB(database_name).database_setup()
+    BulkImporter(database_name).import_documents(generate_documents(titles, revisions_per_title))
+    results["database_bytes"] = os.path.getsize(database_name)
+
+    on_disk = DocumentStoreActions(database_name)
+    # The concurrent writes go through on_disk, so the snapshot only picks them up by refreshing
+    from_snapshot = DocumentStoreActions(database_name, snapshot=True, snapshot_refresh_interval=0.5)
+    refresh_start = time.perf_counter()
+    from_snapshot.read_pool.refresh(force=True)
+    results["refresh_ms"] = round((time.perf_counter() - refresh_start) * 1000, 2)
+
+    results["on_disk"] = time_reads(on_disk, lookups)
+    results["snapshot"] = time_reads(from_snapshot, lookups)
+    first_minute = titles * revisions_per_title
+    results["on_disk_under_writes"] = time_reads_under_writes(on_disk, on_disk, lookups, first_minute)
+    first_minute += results["on_disk_under_writes"]["concurrent_writes"]
+    results["snapshot_under_writes"] = time_reads_under_writes(from_snapshot, on_disk, lookups, first_minute)
+    results["snapshot_refreshes"] = from_snapshot.read_pool.stats()["refreshes"]
+
+    from_snapshot.read_pool.close_all()
+    on_disk.connection_pool.close_all()
+
+  print(json.dumps(results))
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--titles", type=int, default=1000)
+  parser.add_argument("--revisions-per-title", type=int, default=10)
+  parser.add_argument("--lookups", type=int, default=2000)
+  args = parser.parse_args()
+
+  run_benchmark(args.titles, args.revisions_per_title, args.lookups)
@@ -0,0 +1,102 @@
+'''
+Compares the full-copy and delta storage engines on a heavily edited
+document: stored content size and read latency for the latest revision
+and for random point-in-time lookups.
+
+  $ python -m benchmarks.storage_engine_benchmark
+  $ python -m benchmarks.storage_engine_benchmark --revisions 2000 --keyframe-intervals 8 32
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.database_data_handlers import DatabaseManager
+from src.document_store_actions import DocumentStoreActions
+from src.helper_functions import to_epoch_microseconds
+from src.sqlite import SqliteDB
+from src.storage_engines import DeltaStorageEngine, FullCopyStorageEngine
+
+START_TIME = to_epoch_microseconds("2023-01-01 00:00:00")
+TITLE = "Heavily edited document"
+
+def generate_revisions(revisions, lines, seed = 42):
+  random_generator = random.Random(seed)
+  document_lines = [f"Paragraph {line}: " + "lorem ipsum dolor sit amet " * 4 + "\n" for line in range(lines)]
+
+  for revision in range(revisions):
+    # Every edit rewrites a couple of lines and sometimes appends one
+    for _ in range(2):
+      document_lines[random_generator.randrange(len(document_lines))] = f"Edited in revision {revision}: " + "consectetur adipiscing elit " * 4 + "\n"
+    if random_generator.random() < 0.2:
+      document_lines.append(f"Appended in revision {revision}\n")
+
+    yield START_TIME + revision * 60000000, "".join(document_lines)
+
+def time_calls(function, arguments_list):
+  latencies = []
+  for arguments in arguments_list:
+    start = time.perf_counter()
+    function(*arguments)
+    latencies.append(time.perf_counter() - start)
+
+  latencies.sort()
+  return {
+    "p50_ms": round(statistics.median(latencies) * 1000, 4),
+    "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 4)
+  }
+
+def benchmark_engine(directory, name, storage_engine, revisions, lines, queries):
+  database_name = os.path.join(directory, f"{name}.db")
+  SqliteDB(database_name).database_setup()
+
+  database_manager = DatabaseManager(database_name, storage_engine)
+  start = time.perf_counter()
+  for creation_timestamp, content in generate_revisions(revisions, lines):
+    database_manager.save_data_to_db(TITLE, creation_timestamp, content)
+  write_seconds = time.perf_counter() - start
+
+  document_store_actions = DocumentStoreActions(database_name, storage_engine)
+  with document_store_actions.connection_pool.cursor() as cursor:
+    stored_bytes = cursor.execute("SELECT SUM(LENGTH(document_content)) FROM documents_data").fetchone()[0]
+
+  random_generator = random.Random(7)
+  timestamps = [( TITLE, START_TIME + random_generator.randrange(revisions) * 60000000, ) for _ in range(queries)]
+
+  result = {
+    "engine": name,
+    "stored_content_bytes": stored_bytes,
+    "write_ms_per_revision": round(write_seconds / revisions * 1000, 4),
+    "latest": time_calls(document_store_actions.get_latest_document_revision, [( TITLE, )] * queries),
+    "point_in_time": time_calls(document_store_actions.get_document_as_it_was_at_a_given_timestamp, timestamps)
+  }
+
+  document_store_actions.connection_pool.close_all()
+  return result
+
+def run_benchmark(revisions, lines, keyframe_intervals, queries):
+  results = []
+
+  with tempfile.TemporaryDirectory() as directory:
+    engines = [( "full_copy", FullCopyStorageEngine(), )]
+    engines += [( f"delta_k{interval}", DeltaStorageEngine(interval), ) for interval in keyframe_intervals]
+
+    for name, storage_engine in engines:
+      result = benchmark_engine(directory, name, storage_engine, revisions, lines, queries)
+      results.append(result)
+      print(json.dumps(result))
+
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--revisions", type=int, default=500)
+  parser.add_argument("--lines", type=int, default=200)
+  parser.add_argument("--keyframe-intervals", type=int, nargs="+", default=[4, 16, 64])
+  parser.add_argument("--queries", type=int, default=500)
+  args = parser.parse_args()
+
+  run_benchmark(args.revisions, args.lines, args.keyframe_intervals, args.queries)
@@ -0,0 +1,254 @@
+'''
+Benchmark suite for the document store. Seeds a temporary database with
+the synthetic wiki generator, then runs every DocumentStoreActions method
+and every route (through Flask's test client) and reports throughput,
+p50/p95/p99 latency and memory for each as one JSON document. Titles are
+picked with the same Zipfian popularity used to generate the edits.
+
+  $ python -m benchmarks.suite --output results.json
+  $ python -m benchmarks.suite --titles 10000 --operations 2000 --baseline results.json
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from urllib.parse import quote
+
+import server
+
+from benchmarks.data_generator import (
+  START_TIME,
+  WORDS,
+  add_arguments,
+  generate_documents,
+  title_name,
+  zipf_cumulative_weights
+)
+from src.bulk_import import BulkImporter
+from src.document_store_actions import DocumentStoreActions
+from src.sqlite import SqliteDB
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEMORY_SAMPLE_OPERATIONS = 100
+
+class Workload:
+  '''
+  Seeded source of the arguments each benchmarked operation is called with.
+  '''
+  def __init__(self, titles, revisions, zipf_exponent, seed):
+    self.titles = titles
+    self.revisions = revisions
+    self.random_generator = random.Random(seed)
+    self.cumulative_weights = zipf_cumulative_weights(titles, zipf_exponent)
+    self.edits = 0
+
+  def title_index(self):
+    return self.random_generator.choices(range(self.titles), cum_weights=self.cumulative_weights)[0]
+
+  def title(self):
+    return title_name(self.title_index())
+
+  def point_in_time(self):
+    '''
+    A title and a timestamp after its first revision, whose revision
+    was created at minute `index` by the generator.
+    '''
+    index = self.title_index()
+    return title_name(index), START_TIME + self.random_generator.randrange(index, self.revisions) * 60000000
+
+  def new_timestamp(self):
+    return START_TIME + (self.revisions + self.edits) * 60000000
+
+  def word(self):
+    return self.random_generator.choice(WORDS)
+
+  def prefix(self):
+    return self.title()[:8]
+
+  def new_content(self):
+    self.edits += 1
+    return f"Benchmark edit {self.edits} " + " ".join(self.word() for _ in range(50))
+
+def summarize(latencies, elapsed):
+  latencies = sorted(latencies)
+
+  def percentile(fraction):
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 4)
+
+  return {
+    "operations": len(latencies),
+    "throughput_per_second": round(len(latencies) / elapsed, 1),
+    "p50_ms": percentile(0.50),
+    "p95_ms": percentile(0.95),
+    "p99_ms": percentile(0.99)
+  }
+
+def run_scenario(operation, operations, warmup):
+  for _ in range(warmup):
+    operation()
+
+  latencies = []
+  start = time.perf_counter()
+  for _ in range(operations):
+    operation_start = time.perf_counter()
+    operation()
+    latencies.append(time.perf_counter() - operation_start)
+  result = summarize(latencies, time.perf_counter() - start)
+
+  # Measured separately because tracing allocations slows every call down
+  tracemalloc.start()
+  for _ in range(min(operations, MEMORY_SAMPLE_OPERATIONS)):
+    operation()
+  result["peak_allocated_bytes"] = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return result
+
+def method_scenarios(document_store_actions, workload):
+  def iter_documents():
+    for _ in document_store_actions.iter_documents(workload.title()):
+      pass
+
+  def post_document_revisions():
+    document_store_actions.post_document_revisions(
+      [{"title": workload.title(), "content": workload.new_content()} for _ in range(10)],
+      workload.new_timestamp()
+    )
+
+  return {
+    "get_titles": lambda: document_store_actions.get_titles(),
+    "get_title_summaries": lambda: document_store_actions.get_title_summaries("recent", limit=50),
+    "get_documents": lambda: document_store_actions.get_documents(workload.title(), limit=50),
+    "iter_documents": iter_documents,
+    "get_document_as_it_was_at_a_given_timestamp": lambda: document_store_actions.get_document_as_it_was_at_a_given_timestamp(*workload.point_in_time()),
+    "get_revision_info_at_a_given_timestamp": lambda: document_store_actions.get_revision_info_at_a_given_timestamp(*workload.point_in_time()),
+    "get_latest_document_revision": lambda: document_store_actions.get_latest_document_revision(workload.title()),
+    "get_revision_history": lambda: document_store_actions.get_revision_history(workload.title(), bucket="day"),
+    "get_changes": lambda: document_store_actions.get_changes(workload.point_in_time()[1], limit=50),
+    "get_revisions_for_titles": lambda: document_store_actions.get_revisions_for_titles([workload.title() for _ in range(20)]),
+    "search_documents": lambda: document_store_actions.search_documents(f"{workload.word()} {workload.word()}"),
+    "suggest_titles": lambda: document_store_actions.suggest_titles(workload.prefix()),
+    # Writes run last so every read sees the same data
+    "post_new_document_revision": lambda: document_store_actions.post_new_document_revision(workload.title(), workload.new_timestamp(), workload.new_content()),
+    "post_document_revisions": post_document_revisions
+  }
+
+def route_scenarios(client, workload):
+  def title():
+    return quote(workload.title())
+
+  def point_in_time_path():
+    title, timestamp = workload.point_in_time()
+    return f"/documents/{quote(title)}/{timestamp}"
+
+  return {
+    "GET /documents": lambda: client.get("/documents"),
+    "GET /documents?sort=recent&counts=true": lambda: client.get("/documents?sort=recent&counts=true&limit=50"),
+    "GET /documents/<title>": lambda: client.get(f"/documents/{title()}?limit=50"),
+    "GET /documents/<title>/<timestamp>": lambda: client.get(point_in_time_path()),
+    "GET /documents/<title>/latest": lambda: client.get(f"/documents/{title()}/latest"),
+    "GET /documents/<title>/history?bucket=day": lambda: client.get(f"/documents/{title()}/history?bucket=day"),
+    "GET /changes": lambda: client.get(f"/changes?since={workload.point_in_time()[1]}&limit=50"),
+    "GET /search": lambda: client.get(f"/search?q={workload.word()}"),
+    "GET /titles/suggest": lambda: client.get(f"/titles/suggest?prefix={quote(workload.prefix())}"),
+    "POST /documents:batch-get": lambda: client.post("/documents:batch-get", json={"titles": [workload.title() for _ in range(20)]}),
+    "POST /documents/<title>": lambda: client.post(f"/documents/{title()}", json={"content": workload.new_content()}),
+    "POST /documents:batch": lambda: client.post("/documents:batch", json=[
+      {"title": workload.title(), "content": workload.new_content()} for _ in range(10)
+    ])
+  }
+
+def git_commit():
+  try:
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def compare(results, baseline):
+  '''
+  Ratio of every scenario's p50 latency and throughput to the baseline's.
+  '''
+  comparison = {}
+  for name, result in results["results"].items():
+    baseline_result = baseline.get("results", {}).get(name)
+    if baseline_result is None:
+      continue
+    comparison[name] = {
+      "p50_ratio": round(result["p50_ms"] / baseline_result["p50_ms"], 3) if baseline_result["p50_ms"] else None,
+      "throughput_ratio": round(result["throughput_per_second"] / baseline_result["throughput_per_second"], 3)
+    }
+
+  return comparison
+
+def run_suite(titles, revisions_per_title, zipf_exponent, content_size, seed, operations, warmup):
+  results = {
+    "config": {
+      "titles": titles,
+      "revisions_per_title": revisions_per_title,
+      "zipf_exponent": zipf_exponent,
+      "content_size": content_size,
+      "seed": seed,
+      "operations": operations
+    },
+    "environment": {
+      "python": platform.python_version(),
+      "sqlite": sqlite3.sqlite_version,
+      "git_commit": git_commit()
+    },
+    "results": {}
+  }
+
+  with tempfile.TemporaryDirectory() as directory:
+    database_name = os.path.join(directory, "benchmark.db")
+    SqliteDB(database_name).database_setup()
+
+    start = time.perf_counter()
+    revisions, _ = BulkImporter(database_name).import_documents(
+      generate_documents(titles, revisions_per_title, zipf_exponent, content_size, seed)
+    )
+    results["seed_seconds"] = round(time.perf_counter() - start, 3)
+
+    document_store_actions = DocumentStoreActions(database_name)
+    workload = Workload(titles, revisions, zipf_exponent, seed)
+    for name, operation in method_scenarios(document_store_actions, workload).items():
+      results["results"][f"DocumentStoreActions.{name}"] = run_scenario(operation, operations, warmup)
+
+    # The routes get their own store, with the group commit the server uses
+    server.document_store_actions = DocumentStoreActions(database_name, group_commit=True)
+    client = server.app.test_client()
+    for name, operation in route_scenarios(client, workload).items():
+      results["results"][name] = run_scenario(operation, operations, warmup)
+
+    document_store_actions.connection_pool.close_all()
+
+  # Kilobytes on Linux
+  results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return results
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  add_arguments(parser)
+  parser.add_argument("--operations", type=int, default=500, help="timed calls per scenario")
+  parser.add_argument("--warmup", type=int, default=50, help="untimed calls before each scenario")
+  parser.add_argument("--output", help="also write the results to this JSON file")
+  parser.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+  args = parser.parse_args()
+
+  results = run_suite(args.titles, args.revisions_per_title, args.zipf_exponent, args.content_size, args.seed, args.operations, args.warmup)
+
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      results["comparison"] = compare(results, json.load(baseline_file))
+
+  if args.output:
+    with open(args.output, "w") as output_file:
+      json.dump(results, output_file, indent=2)
+  print(json.dumps(results, indent=2))
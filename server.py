@@ -1,18 +1,107 @@
 import os.path
 import json
+import logging
 
-from datetime import datetime
-from flask import Flask, request, jsonify, make_response
+from datetime import datetime, timezone
+from time import perf_counter
+from flask import Flask, Response, g, request
 
 from src.sqlite import SqliteDB
+from src.compression import choose_encoding, compress_body, encoded_etag
 from src.database_data_handlers import DatabaseManager
 from src.document_store_actions import DocumentStoreActions
+from src.exceptions import (
+  BatchTooLarge,
+  ConnectionPoolExhausted,
+  InvalidTimestamp,
+  NoDataInDatabase,
+  NoDocumentCreatedAtTimestamp,
+  TitleNotFound
+)
+from src.helper_functions import iter_json_array_chunks, to_epoch_microseconds
+from src.http_caching import (
+  REVALIDATE_CACHE_CONTROL,
+  body_etag,
+  is_not_modified,
+  revision_headers,
+  revision_info_headers
+)
+from src.json_encoding import dumps_bytes
+from src.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, http_request_duration, registry
+
+logger = logging.getLogger(__name__)
 
 data_handler = DatabaseManager()
-document_store_actions = DocumentStoreActions()
+# Concurrent single posts share transactions through a group commit queue
+document_store_actions = DocumentStoreActions(group_commit=True)
 
 app = Flask(__name__)
 
+def json_response(value, status = 200):
+  return Response(dumps_bytes(value), status=status, mimetype="application/json")
+
+def conditional_response(headers, build_response):
+  '''
+  Answers 304 Not Modified when the request's validators match headers,
+  otherwise sends the response built by build_response with headers.
+  '''
+  if is_not_modified(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since"), headers):
+    return Response(status=304, headers=headers)
+
+  res = build_response()
+  res.headers.update(headers)
+  return res
+
+def get_bool_arg(name):
+  return request.args.get(name, "false").lower() in ("true", "1", "yes")
+
+@app.before_request
+def start_request_timer():
+  g.request_start = perf_counter()
+
+# Registered before compress_response so it runs after it and times the compression too
+@app.after_request
+def record_request_metrics(res):
+  request_start = g.get("request_start")
+  if request_start is not None:
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    http_request_duration.observe(perf_counter() - request_start, request.method, route, str(res.status_code))
+  return res
+
+@app.after_request
+def compress_response(res):
+  '''
+  Compresses JSON bodies with the best encoding the client accepts.
+  Streamed and already encoded responses are sent as they are.
+  '''
+  if res.is_streamed or res.status_code != 200 or "Content-Encoding" in res.headers or res.mimetype != "application/json":
+    return res
+
+  body, headers = compress_body(res.get_data(), res.headers.get("ETag"), request.headers.get("Accept-Encoding"))
+  res.set_data(body)
+  res.headers.update(headers)
+  return res
+
+@app.errorhandler(InvalidTimestamp)
+def handle_invalid_timestamp(error):
+  return json_response({"message": str(error)}, 400)
+
+@app.errorhandler(BatchTooLarge)
+def handle_batch_too_large(error):
+  return json_response({"message": str(error)}, 413)
+
+@app.errorhandler(NoDataInDatabase)
+@app.errorhandler(NoDocumentCreatedAtTimestamp)
+@app.errorhandler(TitleNotFound)
+def handle_not_found(error):
+  return json_response({"message": str(error)}, 404)
+
+@app.errorhandler(ConnectionPoolExhausted)
+def handle_connection_pool_exhausted(error):
+  res = json_response({"message": "Server is busy, please retry later"}, 503)
+  res.headers["Retry-After"] = "1"
+  return res
+
 @app.route("/")
 def home():
     return "🚀 Welcome to My wikipedia! 🚀"
@@ -21,47 +110,192 @@ def home():
 def get_all_available_titles():
   '''
   This endpoint returns a list of all available titles
+    Optional query parameters:
+      sort: "title" for alphabetical order or "recent" for the most
+        recently edited titles first
+      counts: return [title, last_modified, revision_count] for every title
+      limit: maximum number of titles to return, with sort or counts
   '''
-  title_list = document_store_actions.get_titles()
+  sort = request.args.get("sort")
+  limit = request.args.get("limit", type=int)
+  if sort is None and limit is None and not get_bool_arg("counts"):
+    title_list = document_store_actions.get_titles()
+  else:
+    try:
+      title_summaries = document_store_actions.get_title_summaries(sort or "title", limit)
+    except ValueError as error:
+      return json_response({"message": str(error)}, 400)
+    title_list = title_summaries if get_bool_arg("counts") else [title_summary.title for title_summary in title_summaries]
 
-  return title_list
+  res = json_response(title_list)
+  headers = {"ETag": body_etag(res.get_data()), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+  return conditional_response(headers, lambda: res)
 
 @app.route("/documents/<title>", methods=["GET", "POST"])
 def manage_document_revisions_for_a_title(title):
   '''
   GET: This endpoint returns a list of all available revisions for a document.
+    Optional query parameters:
+      limit: maximum number of revisions to return
+      after: only return revisions created after this timestamp
+      cursor: continue from the X-Next-Cursor header of the previous page
+      metadata_only: return [title, timestamp, revision id] without content
+      stream: send the list as a chunked response
   POST: This endpoint allows a user to add new document revisions to titles
   '''
   if request.method == "GET":
-    documents_list = document_store_actions.get_documents(title)
+    limit = request.args.get("limit", type=int)
+    after = request.args.get("after")
+    documents_cursor = request.args.get("cursor")
+    include_content = not get_bool_arg("metadata_only")
+
+    try:
+      if get_bool_arg("stream"):
+        documents = document_store_actions.iter_documents(title, limit, after, include_content, documents_cursor)
+        return Response(iter_json_array_chunks(documents), mimetype="application/json")
+
+      documents_list, next_cursor = document_store_actions.get_documents_page(title, limit, after, include_content, documents_cursor)
+    except ValueError as error:
+      return json_response({"message": str(error)}, 400)
 
-    return documents_list
+    res = json_response(documents_list)
+    # Cursor for the next page
+    if next_cursor is not None:
+      res.headers["X-Next-Cursor"] = next_cursor
+    return res
   elif request.method == "POST":
     result = ""
     try:
       data = json.loads(request.data)
       new_content = data["content"]
-      timestamp = datetime.now()
+      timestamp = datetime.now(timezone.utc)
       result = document_store_actions.post_new_document_revision(title, timestamp, new_content)
+    except ConnectionPoolExhausted:
+      raise
     except Exception as error:
       result = error
-      print(error)
-    finally:
-      res = make_response(
-        jsonify({"message": str(result)})
-      )
-      res.headers["Content-Type"] = "application/json"
-      return res
-   
+      logger.info("Document revision for %r was not saved: %s", title, error)
+
+    return json_response({"message": str(result)})
+
+@app.route("/documents:batch", methods=["POST"])
+def post_document_revisions_in_a_batch():
+  '''
+  This endpoint saves many document revisions in a single transaction.
+  It receives a JSON array of {title, content, timestamp?} objects, new
+  titles are created and a missing timestamp defaults to now, a
+  microsecond apart for each revision without one. Returns
+  one {title, saved, message} result per revision, in order.
+  '''
+  revisions = request.get_json(silent=True)
+  if not isinstance(revisions, list):
+    return json_response({"message": "Expected a JSON array of {title, content, timestamp?} objects"}, 400)
+
+  results = document_store_actions.post_document_revisions(revisions, datetime.now(timezone.utc))
+
+  return json_response(results)
+
+@app.route("/documents:batch-get", methods=["POST"])
+def get_document_revisions_in_a_batch():
+  '''
+  This endpoint returns revisions of many titles at once. It receives
+  {titles: [...], timestamp?} and returns a {title: revision} object with
+  the latest revision of each title, or the revision as it was at
+  timestamp. Titles without such a revision map to null.
+  '''
+  data = request.get_json(silent=True)
+  titles = data.get("titles") if isinstance(data, dict) else None
+  if not isinstance(titles, list) or not all(isinstance(title, str) for title in titles):
+    return json_response({"message": "Expected a JSON object with a 'titles' array of strings"}, 400)
+
+  revisions = document_store_actions.get_revisions_for_titles(titles, data.get("timestamp"))
+
+  return json_response(revisions)
+
+@app.route("/documents/<title>/diff", methods=["GET"])
+def get_diff_between_document_revisions(title):
+  '''
+  This endpoint returns the changes between two revisions of a document
+  as a unified diff.
+    Query parameters:
+      from: the older revision is the one as it was at this timestamp
+      to: the newer revision is the one as it was at this timestamp
+      context: unchanged lines shown around each change (default 3,
+        at least 0)
+  Returns [title, from_timestamp, to_timestamp, hunks], each hunk being
+  [from_start, from_lines, to_start, to_lines, lines].
+  '''
+  from_timestamp = request.args.get("from")
+  to_timestamp = request.args.get("to")
+  if from_timestamp is None or to_timestamp is None:
+    return json_response({"message": "Both the 'from' and 'to' query parameters are required"}, 400)
+  context = request.args.get("context", 3, type=int)
+
+  try:
+    revision_diff = document_store_actions.get_revision_diff(title, from_timestamp, to_timestamp, context)
+  except ValueError as error:
+    return json_response({"message": str(error)}, 400)
+
+  res = json_response(revision_diff)
+  headers = {"ETag": body_etag(res.get_data()), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+  return conditional_response(headers, lambda: res)
+
+@app.route("/documents/<title>/history", methods=["GET"])
+def get_document_revision_history(title):
+  '''
+  This endpoint returns the revisions of a document created within a
+  time window, or statistics of its edits over that window.
+    Optional query parameters:
+      from: only return revisions created at or after this timestamp
+      to: only return revisions created at or before this timestamp
+      bucket: "hour", "day", "month" or "year" to return
+        [bucket_start, revision_count, min_length, average_length, max_length]
+        for every bucket with revisions instead of the revisions
+      metadata_only: return [title, timestamp, revision id] without content
+  '''
+  try:
+    history = document_store_actions.get_revision_history(
+      title,
+      request.args.get("from"),
+      request.args.get("to"),
+      request.args.get("bucket"),
+      not get_bool_arg("metadata_only")
+    )
+  except ValueError as error:
+    return json_response({"message": str(error)}, 400)
+
+  return json_response(history)
+
 @app.route("/documents/<title>/<timestamp>", methods=["GET"])
 def get_document_revision_at_a_given_timestamp(title, timestamp):
   '''
   This endpoint returns a document for a title
   as it was at a given timestamp.
   '''
+  timestamp = to_epoch_microseconds(timestamp)
+  revision_info = document_store_actions.get_revision_info_at_a_given_timestamp(title, timestamp)
+  is_historical = revision_info is not None and bool(revision_info[2])
+
+  # Revalidations are answered without loading the revision's content
+  if revision_info is not None:
+    headers = revision_info_headers(revision_info[0], revision_info[1])
+    if is_not_modified(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since"), headers):
+      return Response(status=304, headers=headers)
+
+    # Historical revisions can be sent from their stored compressed body
+    content_encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if is_historical and content_encoding is not None and document_store_actions.precompress_historical:
+      body = document_store_actions.get_encoded_historical_revision(title, timestamp, revision_info[3], content_encoding)
+      headers.update({
+        "ETag": encoded_etag(headers["ETag"], content_encoding),
+        "Content-Encoding": content_encoding,
+        "Vary": "Accept-Encoding"
+      })
+      return Response(body, mimetype="application/json", headers=headers)
+
   document_revision = document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)
 
-  return document_revision
+  return conditional_response(revision_headers(document_revision), lambda: json_response(document_revision))
 
 @app.route("/documents/<title>/latest", methods=["GET"])
 def get_document_latest_revision(title):
@@ -69,9 +303,105 @@ def get_document_latest_revision(title):
   This endpoint returns the latest revision
   of a document for a given title.
   '''
-  latest_document_revision = document_store_actions.get_latest_document_revision(title)
+  latest_document_revision, content_hash = document_store_actions.get_latest_document_revision_with_hash(title)
+
+  return conditional_response(
+    revision_headers(latest_document_revision, content_hash=content_hash),
+    lambda: json_response(latest_document_revision)
+  )
+
+@app.route("/titles/suggest", methods=["GET"])
+def suggest_titles():
+  '''
+  This endpoint autocompletes titles.
+    Query parameters:
+      prefix: start of the title, case insensitive
+      limit: maximum number of suggestions to return (default 10)
+  Returns the titles starting with prefix, the title matching prefix
+  ignoring case (or null) and, when nothing starts with prefix,
+  titles within two edits of it.
+  '''
+  prefix = request.args.get("prefix", "")
+  limit = request.args.get("limit", 10, type=int)
+
+  return json_response(document_store_actions.suggest_titles(prefix, limit))
+
+@app.route("/search", methods=["GET"])
+def search_documents():
+  '''
+  This endpoint returns the documents matching a full-text query,
+  best match first.
+    Query parameters:
+      q: words that must all appear in the title or the content,
+        a trailing * matches any word starting with it
+      limit: maximum number of results to return (default 20)
+      offset: number of results to skip
+  '''
+  query = request.args.get("q", "")
+  limit = request.args.get("limit", 20, type=int)
+  offset = request.args.get("offset", 0, type=int)
+
+  search_results = document_store_actions.search_documents(query, limit, offset)
+
+  return json_response(search_results)
+
+@app.route("/changes", methods=["GET"])
+def get_changes():
+  '''
+  This endpoint returns the feed of new revisions of every title, oldest
+  first, as [title, timestamp, revision id, content_length].
+    Optional query parameters:
+      since: only return revisions created at or after this timestamp
+      limit: maximum number of revisions to return (default 100)
+      cursor: continue from the page that returned this cursor in its
+        X-Next-Cursor header
+  '''
+  limit = request.args.get("limit", 100, type=int)
+
+  try:
+    changes, next_cursor = document_store_actions.get_changes(request.args.get("since"), limit, request.args.get("cursor"))
+  except ValueError as error:
+    return json_response({"message": str(error)}, 400)
 
-  return latest_document_revision
+  res = json_response(changes)
+  if next_cursor is not None:
+    res.headers["X-Next-Cursor"] = next_cursor
+  return res
+
+@app.route("/change-log", methods=["GET"])
+def get_change_log():
+  '''
+  This endpoint long-polls the change log, the append-only list of every
+  saved revision under an increasing sequence number, as
+  [sequence, title, timestamp, revision id, content_length].
+    Optional query parameters:
+      after: only return entries with a greater sequence number (default 0)
+      limit: maximum number of entries to return (default 100)
+      wait: when there are no such entries yet, seconds to wait for one
+        before returning an empty list (default 0, at most 30)
+  The X-Last-Sequence header holds the after value of the next request.
+  '''
+  after = request.args.get("after", 0, type=int)
+  limit = request.args.get("limit", 100, type=int)
+  wait = request.args.get("wait", 0, type=float)
+
+  try:
+    entries = document_store_actions.get_change_log(after, limit, wait)
+  except ValueError as error:
+    return json_response({"message": str(error)}, 400)
+
+  res = json_response(entries)
+  res.headers["X-Last-Sequence"] = str(entries[-1].sequence if entries else after)
+  res.headers["Cache-Control"] = "no-store"
+  return res
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+  '''
+  This endpoint returns the request, query and connection pool metrics
+  of this process in the Prometheus text format.
+  '''
+  return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 # Checking if a database file exists
 is_database_created = os.path.isfile("wiki_documents_db.db")
@@ -83,6 +413,8 @@ if __name__ == "__main__":
     data_handler.save_dummy_data_to_db()
   else:
      print("Database has already been created")
+     SqliteDB().migrate()
+  document_store_actions.title_index.load()
 
   app.run(
     host="127.0.0.1",
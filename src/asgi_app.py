@@ -0,0 +1,460 @@
+import asyncio
+import json
+import logging
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+from urllib.parse import parse_qs
+
+from src.change_log import CHANGE_LOG_POLL_INTERVAL, MAX_CHANGE_LOG_WAIT
+from src.compression import compress_body
+from src.document_store_actions import STREAM_PAGE_SIZE, DocumentStoreActions
+from src.exceptions import (
+  BatchTooLarge,
+  ConnectionPoolExhausted,
+  InvalidTimestamp,
+  NoDataInDatabase,
+  NoDocumentCreatedAtTimestamp,
+  TitleNotFound
+)
+from src.helper_functions import to_epoch_microseconds
+from src.http_caching import (
+  REVALIDATE_CACHE_CONTROL,
+  body_etag,
+  is_not_modified,
+  revision_headers,
+  revision_info_headers
+)
+from src.json_encoding import dumps_bytes
+from src.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, http_request_duration, registry
+
+logger = logging.getLogger(__name__)
+
+class Overloaded(Exception):
+  pass
+
+class BadRequest(Exception):
+  pass
+
+ERROR_STATUSES = {
+  BadRequest: 400,
+  BatchTooLarge: 413,
+  InvalidTimestamp: 400,
+  NoDataInDatabase: 404,
+  NoDocumentCreatedAtTimestamp: 404,
+  TitleNotFound: 404
+}
+
+ROUTES = [
+  ( re.compile(r"^/documents:batch$"), "batch" ),
+  ( re.compile(r"^/documents:batch-get$"), "batch-get" ),
+  ( re.compile(r"^/documents/(?P<title>[^/]+)/latest$"), "latest" ),
+  ( re.compile(r"^/documents/(?P<title>[^/]+)/diff$"), "diff" ),
+  ( re.compile(r"^/documents/(?P<title>[^/]+)/history$"), "history" ),
+  ( re.compile(r"^/documents/(?P<title>[^/]+)/(?P<timestamp>[^/]+)$"), "timestamp" ),
+  ( re.compile(r"^/documents/(?P<title>[^/]+)$"), "documents" ),
+  ( re.compile(r"^/documents$"), "titles" ),
+  ( re.compile(r"^/titles/suggest$"), "suggest" ),
+  ( re.compile(r"^/search$"), "search" ),
+  ( re.compile(r"^/changes$"), "changes" ),
+  ( re.compile(r"^/change-log$"), "change-log" ),
+  ( re.compile(r"^/metrics$"), "metrics" ),
+  ( re.compile(r"^/$"), "home" )
+]
+
+def match_route(path):
+  '''
+  Returns the name of the route matching path and its match, or
+  ( None, None, ) when there is none.
+  '''
+  for pattern, route in ROUTES:
+    match = pattern.match(path)
+    if match is not None:
+      return route, match
+
+  return None, None
+
+def get_query_number(query, name, default = None, number_type = int):
+  '''
+  Returns the query parameter name parsed with number_type, or default
+  when it is missing. Raises BadRequest when it isn't a number.
+  '''
+  if name not in query:
+    return default
+
+  try:
+    return number_type(query[name][0])
+  except ValueError:
+    raise BadRequest(f"The '{name}' query parameter must be a number")
+
+def get_query_bool(query, name):
+  return query.get(name, ["false"])[0].lower() in ("true", "1", "yes")
+
+class DocumentsASGIApp:
+  '''
+  ASGI version of the document API in server.py. Database calls run on a
+  bounded thread pool, at most max_concurrency of them at a time, and
+  requests are answered with 503 once max_pending are already waiting.
+  '''
+  def __init__(self, document_store_actions = None, max_concurrency = 8, max_pending = 256):
+    self.document_store_actions = document_store_actions or DocumentStoreActions()
+    self.max_concurrency = max_concurrency
+    self.max_pending = max_pending
+
+    self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="documents-db")
+    self.pending = 0
+    self._semaphore = None
+
+  async def run_in_executor(self, function, *arguments):
+    if self.pending >= self.max_pending:
+      raise Overloaded()
+
+    # The semaphore has to be created inside the running event loop
+    if self._semaphore is None:
+      self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    self.pending += 1
+    try:
+      async with self._semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *arguments)
+    finally:
+      self.pending -= 1
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] == "lifespan":
+      await self.handle_lifespan(receive, send)
+    elif scope["type"] == "http":
+      await self.handle_http(scope, receive, send)
+
+  async def handle_lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message["type"] == "lifespan.startup":
+        # Reads the titles on a database thread, off the event loop
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.document_store_actions.title_index.load)
+        await send({"type": "lifespan.startup.complete"})
+      elif message["type"] == "lifespan.shutdown":
+        self.executor.shutdown(wait=True)
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+
+  async def handle_http(self, scope, receive, send):
+    start = perf_counter()
+    status = await self.respond(scope, receive, send)
+    http_request_duration.observe(perf_counter() - start, scope["method"], match_route(scope["path"])[0] or "unmatched", str(status))
+
+  async def respond(self, scope, receive, send):
+    '''
+    Reads the request, sends the response and returns its status.
+    '''
+    body = b""
+    more_body = True
+    while more_body:
+      message = await receive()
+      body += message.get("body", b"")
+      more_body = message.get("more_body", False)
+
+    request_headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+    try:
+      query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+      status, payload, headers = await self.dispatch(scope["method"], scope["path"], body, query, request_headers)
+    except ( Overloaded, ConnectionPoolExhausted, ):
+      await self.send_response(send, 503, {"message": "Server is busy, please retry later"}, {"Retry-After": "1"})
+      return 503
+    except tuple(ERROR_STATUSES) as error:
+      status, payload, headers = ERROR_STATUSES[type(error)], {"message": str(error)}, {}
+
+    if status == 200 and "ETag" in headers and is_not_modified(
+      request_headers.get("if-none-match"), request_headers.get("if-modified-since"), headers
+    ):
+      status, payload = 304, None
+
+    await self.send_response(send, status, payload, headers, request_headers.get("accept-encoding"))
+    return status
+
+  async def dispatch(self, method, path, body, query = None, request_headers = None):
+    '''
+    Returns the status, payload and extra headers of the response.
+    '''
+    route, match = match_route(path)
+    if route is None:
+      return 404, {"message": "Not found"}, {}
+
+    parameters = match.groupdict()
+    query = query or {}
+    request_headers = request_headers or {}
+
+    if route == "home":
+      return 200, "🚀 Welcome to My wikipedia! 🚀", {}
+    if method == "POST" and route == "batch":
+      return await self.post_document_revisions(body)
+    if method == "POST" and route == "batch-get":
+      return await self.get_revisions_for_titles(body)
+    if method == "POST" and route == "documents":
+      return 200, await self.post_new_document_revision(parameters["title"], body), {}
+    if method != "GET":
+      return 405, {"message": "Method not allowed"}, {}
+
+    if route == "metrics":
+      return 200, registry.render(), {"Content-Type": METRICS_CONTENT_TYPE}
+    if route == "titles":
+      try:
+        titles = await self.get_titles(query)
+      except ValueError as error:
+        return 400, {"message": str(error)}, {}
+      return 200, titles, {"ETag": body_etag(dumps_bytes(titles)), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if route == "documents":
+      return await self.get_documents(parameters["title"], query)
+    if route == "suggest":
+      return 200, await self.run_in_executor(
+        self.document_store_actions.suggest_titles,
+        query.get("prefix", [""])[0],
+        get_query_number(query, "limit", 10)
+      ), {}
+    if route == "search":
+      return 200, await self.run_in_executor(
+        self.document_store_actions.search_documents,
+        query.get("q", [""])[0],
+        get_query_number(query, "limit", 20),
+        get_query_number(query, "offset", 0)
+      ), {}
+    if route == "diff":
+      if "from" not in query or "to" not in query:
+        return 400, {"message": "Both the 'from' and 'to' query parameters are required"}, {}
+      try:
+        revision_diff = await self.run_in_executor(
+          self.document_store_actions.get_revision_diff,
+          parameters["title"],
+          query["from"][0],
+          query["to"][0],
+          get_query_number(query, "context", 3)
+        )
+      except ValueError as error:
+        return 400, {"message": str(error)}, {}
+      return 200, revision_diff, {"ETag": body_etag(dumps_bytes(revision_diff)), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if route == "history":
+      try:
+        history = await self.run_in_executor(
+          self.document_store_actions.get_revision_history,
+          parameters["title"],
+          query.get("from", [None])[0],
+          query.get("to", [None])[0],
+          query.get("bucket", [None])[0],
+          not get_query_bool(query, "metadata_only")
+        )
+      except ValueError as error:
+        return 400, {"message": str(error)}, {}
+      return 200, history, {}
+    if route == "changes":
+      try:
+        changes, next_cursor = await self.run_in_executor(
+          self.document_store_actions.get_changes,
+          query.get("since", [None])[0],
+          get_query_number(query, "limit", 100),
+          query.get("cursor", [None])[0]
+        )
+      except ValueError as error:
+        return 400, {"message": str(error)}, {}
+      return 200, changes, {} if next_cursor is None else {"X-Next-Cursor": next_cursor}
+    if route == "change-log":
+      try:
+        return await self.get_change_log(query)
+      except ValueError as error:
+        return 400, {"message": str(error)}, {}
+    if route == "latest":
+      revision, content_hash = await self.run_in_executor(
+        self.document_store_actions.get_latest_document_revision_with_hash, parameters["title"]
+      )
+      return 200, revision, revision_headers(revision, content_hash=content_hash)
+
+    timestamp = to_epoch_microseconds(parameters["timestamp"])
+    revision_info = await self.run_in_executor(
+      self.document_store_actions.get_revision_info_at_a_given_timestamp, parameters["title"], timestamp
+    )
+
+    # Revalidations are answered without loading the revision's content
+    if revision_info is not None:
+      headers = revision_info_headers(revision_info[0], revision_info[1])
+      if is_not_modified(request_headers.get("if-none-match"), request_headers.get("if-modified-since"), headers):
+        return 304, None, headers
+
+    revision = await self.run_in_executor(
+      self.document_store_actions.get_document_as_it_was_at_a_given_timestamp, parameters["title"], timestamp
+    )
+    return 200, revision, revision_headers(revision)
+
+  async def get_documents(self, title, query):
+    # Same query parameters and X-Next-Cursor header as the Flask documents route
+    limit = get_query_number(query, "limit")
+    after = query.get("after", [None])[0]
+    documents_cursor = query.get("cursor", [None])[0]
+    include_content = not get_query_bool(query, "metadata_only")
+
+    try:
+      if get_query_bool(query, "stream"):
+        # The first page is read here, so an unknown title is still answered with 404
+        page_limit = STREAM_PAGE_SIZE if limit is None else min(limit, STREAM_PAGE_SIZE)
+        documents, next_cursor = await self.run_in_executor(
+          self.document_store_actions.get_documents_page, title, page_limit, after, include_content, documents_cursor
+        )
+        return 200, self.iter_document_chunks(title, limit, include_content, documents, next_cursor), {}
+
+      documents, next_cursor = await self.run_in_executor(
+        self.document_store_actions.get_documents_page, title, limit, after, include_content, documents_cursor
+      )
+    except ValueError as error:
+      return 400, {"message": str(error)}, {}
+
+    return 200, documents, {} if next_cursor is None else {"X-Next-Cursor": next_cursor}
+
+  async def iter_document_chunks(self, title, limit, include_content, documents, next_cursor):
+    '''
+    Yields a streamed revision listing as JSON array chunks. Revisions are
+    read STREAM_PAGE_SIZE at a time, each page with its own database call,
+    so no connection is held while the client reads.
+    '''
+    remaining = None if limit is None else limit - len(documents)
+    separator = b"["
+    while True:
+      for document in documents:
+        yield separator + dumps_bytes(document)
+        separator = b","
+
+      if next_cursor is None or remaining == 0:
+        break
+      page_limit = STREAM_PAGE_SIZE if remaining is None else min(remaining, STREAM_PAGE_SIZE)
+      documents, next_cursor = await self.run_in_executor(
+        self.document_store_actions.get_documents_page, title, page_limit, None, include_content, next_cursor
+      )
+      if remaining is not None:
+        remaining -= len(documents)
+
+    yield b"[]" if separator == b"[" else b"]"
+
+  async def get_titles(self, query):
+    # Same query parameters as the Flask titles route
+    sort = query.get("sort", [None])[0]
+    limit = get_query_number(query, "limit")
+    include_counts = get_query_bool(query, "counts")
+    if sort is None and limit is None and not include_counts:
+      return await self.run_in_executor(self.document_store_actions.get_titles)
+
+    title_summaries = await self.run_in_executor(self.document_store_actions.get_title_summaries, sort or "title", limit)
+    return title_summaries if include_counts else [title_summary.title for title_summary in title_summaries]
+
+  async def get_change_log(self, query):
+    # Same query parameters as the Flask change log route. The wait happens
+    # on the event loop, so a waiting request doesn't hold a database thread
+    after = get_query_number(query, "after", 0)
+    limit = get_query_number(query, "limit", 100)
+    deadline = perf_counter() + min(max(get_query_number(query, "wait", 0, float), 0), MAX_CHANGE_LOG_WAIT)
+
+    while True:
+      entries = await self.run_in_executor(self.document_store_actions.get_change_log, after, limit)
+      remaining = deadline - perf_counter()
+      if entries or remaining <= 0:
+        break
+      await asyncio.sleep(min(remaining, CHANGE_LOG_POLL_INTERVAL))
+
+    return 200, entries, {"X-Last-Sequence": str(entries[-1].sequence if entries else after), "Cache-Control": "no-store"}
+
+  async def post_new_document_revision(self, title, body):
+    # Same response contract as the Flask POST route
+    try:
+      new_content = json.loads(body)["content"]
+      result = await self.run_in_executor(
+        self.document_store_actions.post_new_document_revision, title, datetime.now(timezone.utc), new_content
+      )
+    except ( Overloaded, ConnectionPoolExhausted, ):
+      raise
+    except Exception as error:
+      result = error
+      logger.info("Document revision for %r was not saved: %s", title, error)
+
+    return {"message": str(result)}
+
+  async def post_document_revisions(self, body):
+    try:
+      revisions = json.loads(body)
+    except ValueError:
+      revisions = None
+    if not isinstance(revisions, list):
+      return 400, {"message": "Expected a JSON array of {title, content, timestamp?} objects"}, {}
+
+    return 200, await self.run_in_executor(self.document_store_actions.post_document_revisions, revisions, datetime.now(timezone.utc)), {}
+
+  async def get_revisions_for_titles(self, body):
+    try:
+      data = json.loads(body)
+    except ValueError:
+      data = None
+    titles = data.get("titles") if isinstance(data, dict) else None
+    if not isinstance(titles, list) or not all(isinstance(title, str) for title in titles):
+      return 400, {"message": "Expected a JSON object with a 'titles' array of strings"}, {}
+
+    return 200, await self.run_in_executor(self.document_store_actions.get_revisions_for_titles, titles, data.get("timestamp")), {}
+
+  async def send_response(self, send, status, payload, extra_headers = None, accept_encoding = None):
+    extra_headers = dict(extra_headers or {})
+
+    if hasattr(payload, "__aiter__"):
+      await self.send_streamed_response(send, status, payload, extra_headers)
+      return
+
+    if payload is None:
+      body = b""
+      content_type = []
+    elif isinstance(payload, str):
+      body = payload.encode("utf-8")
+      content_type = [] if "Content-Type" in extra_headers else [( b"content-type", b"text/html; charset=utf-8", )]
+    else:
+      body = dumps_bytes(payload)
+      content_type = [( b"content-type", b"application/json", )]
+      if status == 200:
+        body, encoding_headers = compress_body(body, extra_headers.get("ETag"), accept_encoding)
+        extra_headers.update(encoding_headers)
+
+    await send({
+      "type": "http.response.start",
+      "status": status,
+      "headers": [
+        *content_type,
+        ( b"content-length", str(len(body)).encode("ascii"), ),
+        *(
+          ( name.lower().encode("latin-1"), value.encode("latin-1"), )
+          for name, value in extra_headers.items()
+        )
+      ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+  async def send_streamed_response(self, send, status, chunks, extra_headers):
+    # Sent as it is read, without a length and uncompressed like Flask's streamed responses
+    await send({
+      "type": "http.response.start",
+      "status": status,
+      "headers": [
+        ( b"content-type", b"application/json", ),
+        *(
+          ( name.lower().encode("latin-1"), value.encode("latin-1"), )
+          for name, value in extra_headers.items()
+        )
+      ]
+    })
+    async for chunk in chunks:
+      await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+app = DocumentsASGIApp()
+
+if __name__ == "__main__":
+  try:
+    import uvicorn
+  except ImportError:
+    raise SystemExit("Serving the ASGI app needs an ASGI server, e.g. '$ pip install uvicorn' and then '$ uvicorn src.asgi_app:app --port 8080'")
+
+  uvicorn.run("src.asgi_app:app", host="127.0.0.1", port=8080)
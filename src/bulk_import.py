@@ -0,0 +1,203 @@
+import argparse
+import itertools
+import json
+import os.path
+import uuid
+
+from src.connection_pool import get_connection_pool
+from src.exceptions import TitleTooLongError
+from src.helper_functions import hash_content, to_epoch_microseconds
+from src.search_index import SearchIndex
+from src.sqlite import SqliteDB
+from src.title_heads import rebuild_title_heads
+
+CHUNK_SIZE = 1024 * 1024
+
+def iter_json_array(file, buffer = "", chunk_size = CHUNK_SIZE):
+  '''
+  Yields the items of a top level JSON array one at a time without
+  loading the whole file into memory. buffer holds any text already
+  read from the start of the file.
+  '''
+  decoder = json.JSONDecoder()
+  position = 0
+  started = False
+  end_of_file = False
+
+  while True:
+    # Skip whitespace and the separators between array items
+    while position < len(buffer) and buffer[position] in " \t\r\n,":
+      position += 1
+
+    if position < len(buffer):
+      if not started:
+        if buffer[position] != "[":
+          raise ValueError("Expected a JSON array")
+        started = True
+        position += 1
+        continue
+      if buffer[position] == "]":
+        return
+
+      try:
+        item, position = decoder.raw_decode(buffer, position)
+        yield item
+        continue
+      except json.JSONDecodeError:
+        if end_of_file:
+          raise
+
+    if end_of_file:
+      raise ValueError("Unexpected end of JSON array")
+
+    chunk = file.read(chunk_size)
+    end_of_file = chunk == ""
+    buffer = buffer[position:] + chunk
+    position = 0
+
+def iter_json_lines(lines):
+  for line in lines:
+    if line.strip():
+      yield json.loads(line)
+
+def iter_documents(file, chunk_size = CHUNK_SIZE):
+  '''
+  Yields documents from a JSON array or a JSON lines file.
+  '''
+  head = file.read(chunk_size)
+
+  if head.lstrip().startswith("["):
+    return iter_json_array(file, head, chunk_size)
+
+  # Complete the last line of the chunk before splitting it into lines
+  head += file.readline()
+  return iter_json_lines(itertools.chain(head.splitlines(), file))
+
+class BulkImporter:
+  '''
+  Loads many revisions at once. Rows are written with executemany in
+  large transactions, title ids are resolved in memory and the secondary
+  indexes and the search index are rebuilt once at the end instead of on
+  every insert. Revisions are stored as full copies.
+  '''
+  def __init__(self, database_name = "wiki_documents_db.db", batch_size = 10000):
+    self.database_name = database_name
+    self.batch_size = batch_size
+    self.connection_pool = get_connection_pool(database_name)
+
+  def _drop_indexes(self, cursor):
+    indexes = cursor.execute("""
+      SELECT name, sql FROM sqlite_master
+      WHERE type = 'index' AND sql IS NOT NULL
+      AND tbl_name IN ('documents_metadata', 'documents_data')
+    """).fetchall()
+
+    for name, _ in indexes:
+      cursor.execute(f"DROP INDEX {name}")
+
+    return [sql for _, sql in indexes]
+
+  def _write_batch(self, title_ids, new_titles, metadata_batch, data_batch):
+    with self.connection_pool.transaction() as cursor:
+      # Ids are handed out here, while the transaction holds the write lock
+      for title in new_titles:
+        cursor.execute("INSERT INTO titles (title) VALUES (?)", ( title, ))
+        title_ids[title] = cursor.lastrowid
+
+      first_document_id = cursor.execute("SELECT COALESCE(MAX(document_id), 0) + 1 FROM documents_metadata").fetchone()[0]
+      cursor.executemany("""
+        INSERT INTO documents_metadata (document_id, document_uuid, creation_timestamp, title_id, content_hash, content_length)
+        VALUES (?, ?, ?, ?, ?, ?)
+      """, (
+        ( first_document_id + offset, document_uuid, creation_timestamp, title_ids[title], content_hash, content_length, )
+        for offset, ( document_uuid, creation_timestamp, title, content_hash, content_length ) in enumerate(metadata_batch)
+      ))
+      cursor.executemany("""
+        INSERT INTO documents_data (document_id, document_content) VALUES (?, ?)
+      """, (
+        ( first_document_id + offset, document_content, )
+        for offset, document_content in enumerate(data_batch)
+      ))
+      # Logged in the order they were read, in the batch's transaction
+      cursor.execute("""
+        INSERT INTO change_log (document_id)
+        SELECT document_id FROM documents_metadata WHERE document_id >= ?
+        ORDER BY document_id
+      """, ( first_document_id, ))
+
+  def import_documents(self, documents):
+    '''
+    Saves an iterable of {"title", "creation_timestamp", "content"} dicts.
+    Returns the number of revisions and of new titles saved.
+    '''
+    with self.connection_pool.cursor() as cursor:
+      title_ids = dict(cursor.execute("SELECT title, title_id FROM titles"))
+
+    with self.connection_pool.transaction() as cursor:
+      index_statements = self._drop_indexes(cursor)
+
+    revisions_count = 0
+    titles_count = 0
+    new_titles = []
+    metadata_batch = []
+    data_batch = []
+
+    try:
+      for document in documents:
+        document_title = document["title"]
+        document_content = document["content"]
+
+        # New titles get their id when their batch is written
+        if document_title not in title_ids:
+          if len(document_title) > 50:
+            raise TitleTooLongError(f"Title: '{document_title}' Title is too long, max limit of 50 characters")
+
+          title_ids[document_title] = None
+          new_titles.append(document_title)
+
+        metadata_batch.append((
+          str(uuid.uuid4()),
+          to_epoch_microseconds(document["creation_timestamp"]),
+          document_title,
+          hash_content(document_content),
+          len(document_content),
+        ))
+        data_batch.append(document_content)
+
+        if len(metadata_batch) >= self.batch_size:
+          self._write_batch(title_ids, new_titles, metadata_batch, data_batch)
+          revisions_count += len(metadata_batch)
+          titles_count += len(new_titles)
+          new_titles, metadata_batch, data_batch = [], [], []
+
+      if metadata_batch:
+        self._write_batch(title_ids, new_titles, metadata_batch, data_batch)
+        revisions_count += len(metadata_batch)
+        titles_count += len(new_titles)
+    finally:
+      with self.connection_pool.transaction() as cursor:
+        for index_statement in index_statements:
+          cursor.execute(index_statement)
+        rebuild_title_heads(cursor)
+        SearchIndex().rebuild(cursor)
+
+    return revisions_count, titles_count
+
+  def import_file(self, file_path):
+    with open(file_path, "r") as file:
+      return self.import_documents(iter_documents(file))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Bulk import documents from a JSON array or JSON lines file")
+  parser.add_argument("file")
+  parser.add_argument("--database", default="wiki_documents_db.db")
+  parser.add_argument("--batch-size", type=int, default=10000)
+  args = parser.parse_args()
+
+  if os.path.isfile(args.database):
+    SqliteDB(args.database).migrate()
+  else:
+    SqliteDB(args.database).database_setup()
+
+  revisions_count, titles_count = BulkImporter(args.database, args.batch_size).import_file(args.file)
+  print(f"Imported {revisions_count} revisions and {titles_count} new titles into {args.database}")
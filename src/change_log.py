@@ -0,0 +1,55 @@
+from src.helper_functions import format_timestamp
+from src.records import ChangeLogEntry
+
+# Longest a change log request may wait for a new entry, in seconds
+MAX_CHANGE_LOG_WAIT = 30
+# How often a waiting request looks for entries written by other processes
+CHANGE_LOG_POLL_INTERVAL = 0.5
+
+def create_change_log_table(cursor):
+  # AUTOINCREMENT never hands out a sequence number twice, not even after a DELETE
+  cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+      sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+      document_id INTEGER NOT NULL
+    )
+  """)
+
+def rebuild_change_log(cursor):
+  '''
+  Logs every existing revision again, in creation order, after the
+  sequence numbers handed out before.
+  '''
+  create_change_log_table(cursor)
+  cursor.execute("DELETE FROM change_log")
+  cursor.execute("""
+    INSERT INTO change_log (document_id)
+    SELECT document_id FROM documents_metadata
+    ORDER BY creation_timestamp, document_id
+  """)
+
+def append_change(cursor, document_id):
+  '''
+  Logs a newly written revision. Runs in the caller's transaction, so the
+  entry is committed if and only if the revision is.
+  '''
+  cursor.execute("INSERT INTO change_log (document_id) VALUES (?)", ( document_id, ))
+
+def read_change_log(cursor, after, limit):
+  '''
+  Returns up to limit ChangeLogEntry records with a sequence number
+  greater than after, in sequence order.
+  '''
+  rows = cursor.execute("""
+    SELECT sequence, title, creation_timestamp, document_uuid, content_length FROM change_log
+    INNER JOIN documents_metadata ON documents_metadata.document_id = change_log.document_id
+    INNER JOIN titles ON titles.title_id = documents_metadata.title_id
+    WHERE sequence > ?
+    ORDER BY sequence LIMIT ?
+    """, ( after, limit, )
+  ).fetchall()
+
+  return [
+    ChangeLogEntry(sequence, title, format_timestamp(creation_timestamp), document_uuid, content_length)
+    for sequence, title, creation_timestamp, document_uuid, content_length in rows
+  ]
@@ -0,0 +1,110 @@
+import gzip
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# Bodies smaller than this are sent as they are
+MIN_COMPRESSED_SIZE = 512
+
+def available_encodings():
+  '''
+  Content codings this process can produce, most preferred first.
+  brotli and zstandard are used when their packages are installed.
+  '''
+  encodings = []
+  if zstandard is not None:
+    encodings.append("zstd")
+  if brotli is not None:
+    encodings.append("br")
+  encodings.append("gzip")
+
+  return encodings
+
+def compress(body, encoding):
+  if encoding == "zstd":
+    return zstandard.ZstdCompressor(level=10).compress(body)
+  if encoding == "br":
+    return brotli.compress(body, quality=9, mode=brotli.MODE_TEXT)
+  if encoding == "gzip":
+    # mtime=0 makes the output, and so its ETag, deterministic
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+  raise ValueError(f"Unsupported content encoding: {encoding}")
+
+def decompress(body, encoding):
+  if encoding == "zstd":
+    return zstandard.ZstdDecompressor().decompress(body)
+  if encoding == "br":
+    return brotli.decompress(body)
+  if encoding == "gzip":
+    return gzip.decompress(body)
+
+  raise ValueError(f"Unsupported content encoding: {encoding}")
+
+def choose_encoding(accept_encoding):
+  '''
+  Picks the content coding to answer an Accept-Encoding header with,
+  or None when the body should be sent as it is.
+  '''
+  if not accept_encoding:
+    return None
+
+  qualities = {}
+  for part in accept_encoding.split(","):
+    coding, _, parameters = part.strip().partition(";")
+    quality = 1.0
+    if parameters.strip().startswith("q="):
+      try:
+        quality = float(parameters.strip()[2:])
+      except ValueError:
+        quality = 0.0
+    qualities[coding.strip().lower()] = quality
+
+  candidates = [
+    encoding for encoding in available_encodings()
+    if qualities.get(encoding, qualities.get("*", 0.0)) > 0
+  ]
+  if not candidates:
+    return None
+
+  # Highest quality first, ties broken by our own preference order
+  return max(candidates, key=lambda encoding: qualities.get(encoding, qualities.get("*", 0.0)))
+
+def encoded_etag(etag, encoding):
+  '''
+  Each content coding is a different representation, so it gets its own
+  strong ETag: '"abc"' becomes '"abc-gzip"'.
+  '''
+  return f'{etag[:-1]}-{encoding}"'
+
+def strip_encoding_from_etag(etag):
+  for encoding in ( "zstd", "br", "gzip", ):
+    if etag.endswith(f'-{encoding}"'):
+      return etag[:-len(encoding) - 2] + '"'
+
+  return etag
+
+def compress_body(body, etag, accept_encoding):
+  '''
+  Compresses a response body for the client's Accept-Encoding. Returns
+  the body and the headers to set on the response, including the
+  response's ETag (or None) adjusted for the encoding.
+  '''
+  headers = {"Vary": "Accept-Encoding"}
+
+  encoding = choose_encoding(accept_encoding)
+  if encoding is None or len(body) < MIN_COMPRESSED_SIZE:
+    return body, headers
+
+  headers["Content-Encoding"] = encoding
+  if etag is not None:
+    headers["ETag"] = encoded_etag(etag, encoding)
+
+  return compress(body, encoding), headers
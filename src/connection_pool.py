@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+from time import perf_counter
+from urllib.parse import quote
+
+from src.exceptions import ConnectionPoolExhausted
+from src.metrics import sqlite_connection_acquire_duration
+from src.query_metrics import InstrumentedConnection
+
+DEFAULT_PRAGMAS = {
+  "journal_mode": "WAL",
+  "synchronous": "NORMAL",
+  "mmap_size": 268435456,
+  "cache_size": -64000
+}
+
+class ConnectionPool:
+  '''
+  Keeps up to max_connections long-lived SQLite connections to a database
+  file, created on first use with the configured pragmas applied. A thread
+  checks a connection out when it enters its outermost connection() block,
+  nested blocks on the same thread share it, and it goes back to the pool
+  when that block ends, so short-lived request threads reuse the same few
+  connections. Once max_connections are checked out, threads wait up to
+  acquire_timeout seconds for one to be returned and then raise
+  ConnectionPoolExhausted. A read_only pool opens its connections with mode=ro, so
+  they can never take the database write lock.
+  '''
+  def __init__(self, database_name = "wiki_documents_db.db", pragmas = None, read_only = False, max_connections = 32, acquire_timeout = 10):
+    self.database_name = database_name
+    self.read_only = read_only
+    self.max_connections = max_connections
+    self.acquire_timeout = acquire_timeout
+    self.pragmas = dict(DEFAULT_PRAGMAS)
+    if pragmas:
+      self.pragmas.update(pragmas)
+    if read_only:
+      # The journal mode is a property of the file, set by the writers
+      self.pragmas.pop("journal_mode", None)
+
+    self.hits = 0
+    self.misses = 0
+
+    self._lock = threading.Lock()
+    self._returned = threading.Condition(self._lock)
+    self._local = threading.local()
+    self._connections = []
+    # Connections not checked out by any thread, the last returned one last
+    self._idle = []
+    self._opening = 0
+    # PRAGMA data_version values are only comparable on the same connection
+    self._data_versions = {}
+    self._pid = os.getpid()
+
+  def _create_connection(self):
+    if self.read_only:
+      conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.database_name))}?mode=ro", uri=True, check_same_thread=False, factory=InstrumentedConnection)
+    else:
+      conn = sqlite3.connect(self.database_name, check_same_thread=False, factory=InstrumentedConnection)
+    for pragma, value in self.pragmas.items():
+      conn.execute(f"PRAGMA {pragma} = {value}")
+
+    return conn
+
+  def _acquire(self):
+    '''
+    Returns this thread's checked out connection, checking one out first
+    when the thread has none.
+    '''
+    # Connections must never be shared with a forked child process
+    if self._pid != os.getpid():
+      self._reset_after_fork()
+
+    state = self._local
+    if getattr(state, "depth", 0) > 0:
+      return state.conn
+
+    start = perf_counter()
+    with self._lock:
+      if not self._returned.wait_for(self._can_check_out, self.acquire_timeout):
+        raise ConnectionPoolExhausted(f"No connection to {self.database_name} was returned within {self.acquire_timeout} seconds")
+
+      if self._idle:
+        conn = self._idle.pop()
+        self.hits += 1
+      else:
+        conn = None
+        self.misses += 1
+        self._opening += 1
+
+    if conn is None:
+      try:
+        conn = self._create_connection()
+      finally:
+        with self._lock:
+          self._opening -= 1
+          if conn is not None:
+            self._connections.append(conn)
+          else:
+            self._returned.notify()
+      sqlite_connection_acquire_duration.observe(perf_counter() - start, "created")
+    else:
+      sqlite_connection_acquire_duration.observe(perf_counter() - start, "reused")
+
+    state.conn = conn
+    state.depth = 0
+    return conn
+
+  def _can_check_out(self):
+    return self._idle or len(self._connections) + self._opening < self.max_connections
+
+  def _release(self, state):
+    conn = state.conn
+    state.conn = None
+
+    with self._lock:
+      # Connections closed by close_all or left behind by a fork aren't reused
+      if conn in self._connections:
+        self._idle.append(conn)
+        self._returned.notify()
+
+  def _reset_after_fork(self):
+    with self._lock:
+      self._pid = os.getpid()
+      self._local = threading.local()
+      self._connections = []
+      self._idle = []
+      self._opening = 0
+      self._data_versions = {}
+
+  @contextmanager
+  def connection(self):
+    '''
+    Yields this thread's connection. The outermost block commits on success
+    and rolls back on error, nested blocks join the outer transaction.
+    '''
+    conn = self._acquire()
+    state = self._local
+    state.depth += 1
+    try:
+      yield conn
+    except BaseException:
+      state.depth -= 1
+      if state.depth == 0:
+        conn.rollback()
+        self._release(state)
+      raise
+    else:
+      state.depth -= 1
+      if state.depth == 0:
+        conn.commit()
+        self._release(state)
+
+  @contextmanager
+  def cursor(self):
+    with self.connection() as conn:
+      cursor = conn.cursor()
+      try:
+        yield cursor
+      finally:
+        cursor.close()
+
+  def has_external_changes(self):
+    '''
+    Returns True when another connection (possibly in another process) may
+    have committed to the database since this pool last asked, based on
+    PRAGMA data_version. Values are kept per connection, and the first
+    call made on each connection of the pool returns True.
+    '''
+    with self.connection() as conn:
+      data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+      with self._lock:
+        last_data_version = self._data_versions.get(conn)
+        self._data_versions[conn] = data_version
+
+    return data_version != last_data_version
+
+  @contextmanager
+  def transaction(self):
+    '''
+    Like cursor() but takes the database write lock up front with
+    BEGIN IMMEDIATE, so reads made inside the block can't go stale
+    before the writes that depend on them.
+    '''
+    with self.cursor() as cursor:
+      if not cursor.connection.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+      yield cursor
+
+  def stats(self):
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "open_connections": len(self._connections),
+        "idle_connections": len(self._idle)
+      }
+
+  def close_all(self):
+    with self._lock:
+      connections = self._connections
+      self._connections = []
+      self._idle = []
+      self._data_versions = {}
+      self._local = threading.local()
+
+    for conn in connections:
+      conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(database_name = "wiki_documents_db.db", read_only = False):
+  '''
+  Returns the shared ConnectionPool for database_name, creating it on first use.
+  '''
+  with _pools_lock:
+    pool = _pools.get(( database_name, read_only, ))
+    if pool is None:
+      pool = ConnectionPool(database_name, read_only=read_only)
+      _pools[( database_name, read_only, )] = pool
+
+  return pool
@@ -1,21 +1,78 @@
-import sqlite3
 import uuid
 
-from src.helper_functions import get_data_from_file
+from src.bulk_import import BulkImporter
+from src.change_log import append_change
+from src.connection_pool import get_connection_pool
+from src.helper_functions import hash_content, to_epoch_microseconds
 from src.exceptions import TitleTooLongError
+from src.search_index import SearchIndex
+from src.storage_engines import FullCopyStorageEngine
+from src.title_heads import update_title_head
 
 class DatabaseManager:
-  def __init__(self, database_name = "wiki_documents_db.db"):
+  def __init__(self, database_name = "wiki_documents_db.db", storage_engine = None, title_index = None):
     self.database_name = database_name
+    self.connection_pool = get_connection_pool(database_name)
+    self.storage_engine = storage_engine or FullCopyStorageEngine()
+    self.search_index = SearchIndex()
+    # Told about every new title saved through this manager
+    self.title_index = title_index
 
-  def db_connection(self):
-    try:
-      conn = sqlite3.connect(self.database_name)
-      cursor = conn.cursor()
-    except sqlite3.Error as error:
-      print(error)
+  def get_title_id(self, cursor, document_title):
+    title_id_from_db = cursor.execute("""
+      SELECT title_id FROM titles WHERE title = ?
+      """, ( document_title, )
+    ).fetchone()
+
+    if title_id_from_db == None:
+      return None
+    return title_id_from_db[0]
+
+  def insert_document_revision(
+    self,
+    cursor,
+    title_id,
+    creation_timestamp,
+    document_content_data
+  ):
+    '''
+    Writes one revision of an existing title using the given cursor,
+    so it becomes part of the caller's transaction, and adds it to the
+    title's head, the change log and the search index. Returns the revision's integer
+    document_id.
+    '''
+    content_hash = hash_content(document_content_data)
+
+    title, latest_timestamp = cursor.execute("""
+      SELECT title, creation_timestamp FROM titles
+      LEFT JOIN title_heads ON title_heads.title_id = titles.title_id
+      WHERE titles.title_id = ?
+      """, ( title_id, )
+    ).fetchone()
 
-    return conn, cursor
+    [stored_content, storage_format, base_document_id] = self.storage_engine.encode(
+      cursor, title_id, document_content_data
+    )
+
+    cursor.execute("""
+      INSERT INTO documents_metadata (document_uuid, creation_timestamp, title_id, content_hash, content_length)
+      VALUES (?, ?, ?, ?, ?)
+      """, ( str(uuid.uuid4()), creation_timestamp, title_id, content_hash, len(document_content_data), )
+    )
+    document_id = cursor.lastrowid
+
+    cursor.execute("""
+      INSERT INTO documents_data (document_id, document_content, storage_format, base_document_id)
+      VALUES (?, ?, ?, ?)
+      """, ( document_id, stored_content, storage_format, base_document_id, )
+    )
+
+    is_latest = latest_timestamp is None or creation_timestamp >= latest_timestamp
+    update_title_head(cursor, title_id, document_id, creation_timestamp, content_hash, is_latest)
+    append_change(cursor, document_id)
+    self.search_index.index_revision(cursor, title_id, title, document_id, document_content_data, is_latest)
+
+    return document_id
   
   def save_data_to_db(
     self,
@@ -25,50 +82,26 @@ class DatabaseManager:
   ):
     
     title_id = ""
-    document_id = str(uuid.uuid4())
+    creation_timestamp = to_epoch_microseconds(creation_timestamp)
 
     if not len(document_title) > 50:
 
-      [conn, cursor] = self.db_connection()
-
-      title_id_query = cursor.execute("""
-        SELECT title_id FROM titles WHERE title = ?
-      """, ( document_title, )
-      )
-
-      title_id_from_db = title_id_query.fetchone()
-
-      if title_id_from_db == None:
-        title_id = str(uuid.uuid4())
+      with self.connection_pool.transaction() as cursor:
+        title_id = self.get_title_id(cursor, document_title)
 
-        cursor.execute("INSERT INTO titles VALUES (?, ?)",
-          ( title_id, document_title, )
-        )
-      else:
-        title_id = title_id_from_db[0]
-      
-      cursor.execute("INSERT INTO documents_metadata VALUES (?, ?, ?)",
-        ( document_id, creation_timestamp, title_id, )
-      )
+        is_new_title = title_id == None
+        if is_new_title:
+          cursor.execute("INSERT INTO titles (title) VALUES (?)",
+            ( document_title, )
+          )
+          title_id = cursor.lastrowid
 
-      cursor.execute("INSERT INTO documents_data VALUES (?, ?)",
-       ( document_id, document_content_data, )
-      )
+        self.insert_document_revision(cursor, title_id, creation_timestamp, document_content_data)
 
-      conn.commit()
-      conn.close()
+      if is_new_title and self.title_index is not None:
+        self.title_index.add(document_title)
     else:
       raise TitleTooLongError(f"Title: '{document_title}' Title is too long, max limit of 50 characters")
   
   def save_dummy_data_to_db(self):
-    file_data = get_data_from_file("dummy_data.json")
-    for document in file_data:
-      document_title = document["title"]
-      creation_timestamp = document["creation_timestamp"]
-      document_content_data = document["content"]
-
-      self.save_data_to_db(
-        document_title,
-        creation_timestamp,
-        document_content_data
-      )
+    BulkImporter(self.database_name).import_file("dummy_data.json")
@@ -0,0 +1,203 @@
+from src.records import DiffHunk
+
+# Most diagonals the searches of one diff may visit, about a tenth of a
+# second of work. Past it the ranges left are diffed as whole blocks
+MAX_DIFF_STEPS = 200000
+
+def _middle_snake(a, a_low, a_high, b, b_low, b_high, budget):
+  '''
+  Finds the middle snake of a shortest edit script between
+  a[a_low:a_high] and b[b_low:b_high] by running Myers' search forwards
+  from the start and backwards from the end until the two meet. Returns
+  the snake's start and end as absolute ( a_start, b_start, a_end, b_end, ),
+  or None once the search has used up budget, a one item list holding
+  the number of diagonals it may still visit.
+  '''
+  n = a_high - a_low
+  m = b_high - b_low
+  delta = n - m
+  is_odd = delta % 2 == 1
+  max_d = (n + m + 1) // 2
+  offset = max_d + 1
+
+  # Furthest x reached on each diagonal k = x - y, the backward search
+  # runs on the reversed sequences
+  forward = [0] * (2 * max_d + 3)
+  backward = [0] * (2 * max_d + 3)
+
+  for d in range(max_d + 1):
+    # Both searches visit d + 1 diagonals
+    budget[0] -= 2 * (d + 1)
+    if budget[0] < 0:
+      return None
+
+    for k in range(-d, d + 1, 2):
+      if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+        x = forward[offset + k + 1]
+      else:
+        x = forward[offset + k - 1] + 1
+      y = x - k
+      x_start, y_start = x, y
+      while x < n and y < m and a[a_low + x] == b[b_low + y]:
+        x += 1
+        y += 1
+      forward[offset + k] = x
+
+      # The backward search on diagonal delta - k got d - 1 edits deep
+      if is_odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+        return a_low + x_start, b_low + y_start, a_low + x, b_low + y
+
+    for k in range(-d, d + 1, 2):
+      if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+        x = backward[offset + k + 1]
+      else:
+        x = backward[offset + k - 1] + 1
+      y = x - k
+      x_start, y_start = x, y
+      while x < n and y < m and a[a_high - 1 - x] == b[b_high - 1 - y]:
+        x += 1
+        y += 1
+      backward[offset + k] = x
+
+      if not is_odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+        return a_low + n - x, b_low + m - y, a_low + n - x_start, b_low + m - y_start
+
+  raise AssertionError("The forward and backward searches always meet")
+
+def matching_blocks(a, b, max_steps = MAX_DIFF_STEPS):
+  '''
+  Returns the ( a_index, b_index, size, ) runs of equal items shared by
+  the sequences a and b in a longest common subsequence, in order.
+  Uses the linear space variant of Myers' O((N + M) D) algorithm, so
+  the time grows with the number of differences D rather than with
+  the product of the lengths, and memory stays linear. Once the
+  searches have visited max_steps diagonals, the ranges still to compare
+  are left unmatched, so the runs are a common subsequence that may not
+  be the longest.
+  '''
+  budget = [max_steps]
+  blocks = []
+  # Explicit stack of ranges still to compare, the rightmost on top,
+  # as the recursion can get as deep as the number of differences
+  ranges = [( 0, len(a), 0, len(b), )]
+
+  while ranges:
+    a_low, a_high, b_low, b_high = ranges.pop()
+
+    # Common prefix and suffix need no search
+    prefix = 0
+    while a_low + prefix < a_high and b_low + prefix < b_high and a[a_low + prefix] == b[b_low + prefix]:
+      prefix += 1
+    if prefix:
+      blocks.append(( a_low, b_low, prefix, ))
+      a_low += prefix
+      b_low += prefix
+
+    suffix = 0
+    while a_low < a_high - suffix and b_low < b_high - suffix and a[a_high - 1 - suffix] == b[b_high - 1 - suffix]:
+      suffix += 1
+    if suffix:
+      blocks.append(( a_high - suffix, b_high - suffix, suffix, ))
+      a_high -= suffix
+      b_high -= suffix
+
+    if a_low == a_high or b_low == b_high:
+      continue
+
+    middle_snake = _middle_snake(a, a_low, a_high, b, b_low, b_high, budget)
+    if middle_snake is None:
+      # Replaced as a whole
+      continue
+
+    a_start, b_start, a_end, b_end = middle_snake
+    if a_end > a_start:
+      blocks.append(( a_start, b_start, a_end - a_start, ))
+    ranges.append(( a_end, a_high, b_end, b_high, ))
+    ranges.append(( a_low, a_start, b_low, b_start, ))
+
+  blocks.sort()
+  return blocks
+
+def matching_line_blocks(a, b):
+  '''
+  matching_blocks of two sequences of line ids, searched without the
+  lines only one of them holds. Those can't be part of a common
+  subsequence, and leaving them out keeps the search short when most
+  lines changed.
+  '''
+  shared_ids = set(a) & set(b)
+  a_positions = [index for index, line_id in enumerate(a) if line_id in shared_ids]
+  b_positions = [index for index, line_id in enumerate(b) if line_id in shared_ids]
+
+  # Runs of the shared lines are split where a left out line sat between them
+  blocks = []
+  for a_index, b_index, size in matching_blocks([a[index] for index in a_positions], [b[index] for index in b_positions]):
+    for offset in range(size):
+      a_position, b_position = a_positions[a_index + offset], b_positions[b_index + offset]
+      if blocks and blocks[-1][0] + blocks[-1][2] == a_position and blocks[-1][1] + blocks[-1][2] == b_position:
+        blocks[-1][2] += 1
+      else:
+        blocks.append([ a_position, b_position, 1 ])
+
+  return [tuple(block) for block in blocks]
+
+def diff_lines(from_lines, to_lines, context = 3):
+  '''
+  Unified diff of two lists of lines as a list of DiffHunk records,
+  each holding the changed lines prefixed with "-" or "+" and up to
+  context unchanged lines, prefixed with " ", around them. Hunk starts
+  are 1-based line numbers as in the unified diff format. Raises
+  ValueError when context is negative.
+  '''
+  if context < 0:
+    raise ValueError("The diff context must be at least 0")
+
+  # Compares lines as small integers instead of strings
+  line_ids = {}
+  a = [line_ids.setdefault(line, len(line_ids)) for line in from_lines]
+  b = [line_ids.setdefault(line, len(line_ids)) for line in to_lines]
+
+  # ( from_start, from_end, to_start, to_end, ) of every change
+  changes = []
+  from_index = to_index = 0
+  for a_index, b_index, size in matching_line_blocks(a, b) + [( len(a), len(b), 0, )]:
+    if from_index < a_index or to_index < b_index:
+      changes.append(( from_index, a_index, to_index, b_index, ))
+    from_index, to_index = a_index + size, b_index + size
+
+  # Changes with at most 2 * context unchanged lines between them share a hunk
+  groups = []
+  for change in changes:
+    if groups and change[0] - groups[-1][-1][1] <= 2 * context:
+      groups[-1].append(change)
+    else:
+      groups.append([change])
+
+  hunks = []
+  for group in groups:
+    from_start = max(group[0][0] - context, 0)
+    to_start = group[0][2] - (group[0][0] - from_start)
+    from_end = min(group[-1][1] + context, len(from_lines))
+    to_end = group[-1][3] + (from_end - group[-1][1])
+
+    lines = []
+    from_index = from_start
+    for change_from_start, change_from_end, change_to_start, change_to_end in group:
+      lines.extend(" " + line for line in from_lines[from_index:change_from_start])
+      lines.extend("-" + line for line in from_lines[change_from_start:change_from_end])
+      lines.extend("+" + line for line in to_lines[change_to_start:change_to_end])
+      from_index = change_from_end
+    lines.extend(" " + line for line in from_lines[from_index:from_end])
+
+    from_count = from_end - from_start
+    to_count = to_end - to_start
+    # As in unified diffs, an empty side starts at the line before it
+    hunks.append(DiffHunk(
+      from_start + 1 if from_count else from_start,
+      from_count,
+      to_start + 1 if to_count else to_start,
+      to_count,
+      lines
+    ))
+
+  return hunks
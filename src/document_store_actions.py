@@ -1,135 +1,896 @@
-import numpy
-import sqlite3
+import itertools
+import json
+import threading
 
+from time import monotonic
+
+from src.change_log import CHANGE_LOG_POLL_INTERVAL, MAX_CHANGE_LOG_WAIT, read_change_log
+from src.compression import compress
+from src.connection_pool import get_connection_pool
 from src.database_data_handlers import DatabaseManager
+from src.diff import diff_lines
+from src.helper_functions import format_timestamp, hash_content, to_epoch_microseconds
+from src.json_encoding import dumps_bytes
+from src.group_commit import GroupCommitQueue
+from src.lru_cache import LRUCache
+from src.records import Change, HistoryBucket, Revision, RevisionDiff, RevisionMetadata, TitleSummary
+from src.snapshot import SnapshotConnectionPool
+from src.storage_engines import DELTA_FORMAT, load_document_content, resolve_content
+from src.title_heads import get_title_head
+from src.title_index import TitleIndex
 from src.exceptions import (
+  BatchTooLarge,
+  InvalidTimestamp,
   NoChangesDetected,
   NoDataInDatabase,
   NoDocumentCreatedAtTimestamp,
-  TitleNotFound
+  TitleNotFound,
+  TitleTooLongError
 )
 
+MIN_TIMESTAMP = -2 ** 63
+MAX_TIMESTAMP = 2 ** 63 - 1
+
+# Revisions read per connection checkout by a streamed revision listing
+STREAM_PAGE_SIZE = 100
+# Most revisions a batch can save or titles a batch can read, so one
+# request can't hold the write lock or a connection for long
+MAX_BATCH_SIZE = 1000
+
+# strftime formats of the start of each history bucket
+HISTORY_BUCKETS = {
+  "hour": "%Y-%m-%d %H:00:00.000000",
+  "day": "%Y-%m-%d 00:00:00.000000",
+  "month": "%Y-%m-01 00:00:00.000000",
+  "year": "%Y-01-01 00:00:00.000000"
+}
+
+def encode_changes_cursor(creation_timestamp, document_id):
+  return f"{creation_timestamp}:{document_id}"
+
+def decode_changes_cursor(changes_cursor):
+  '''
+  Returns the ( creation_timestamp, document_id, ) position of the last
+  change a page of the feed ended with.
+  '''
+  try:
+    creation_timestamp, document_id = changes_cursor.split(":")
+    return int(creation_timestamp), int(document_id)
+  except ValueError:
+    raise ValueError(f"Invalid cursor: '{changes_cursor}'")
+
 class DocumentStoreActions:
-  def __init__(self, database_name = "wiki_documents_db.db"):
+  def __init__(
+    self,
+    database_name = "wiki_documents_db.db",
+    storage_engine = None,
+    cache_max_entries = 4096,
+    cache_max_bytes = 64 * 1024 * 1024,
+    read_only = False,
+    writer = None,
+    detect_external_writes = False,
+    precompress_historical = False,
+    group_commit = False,
+    diff_cache_max_entries = 256,
+    diff_cache_max_bytes = 16 * 1024 * 1024,
+    snapshot = False,
+    snapshot_refresh_interval = None
+  ):
+    '''
+    read_only: read through mode=ro connections
+    writer: object whose post_new_document_revision saves revisions
+      on this instance's behalf, e.g. a WriterClient
+    detect_external_writes: drop the cache whenever another connection
+      has committed, needed when other processes write to the database
+    precompress_historical: keep the compressed response body of every
+      historical revision served, see get_encoded_historical_revision
+    group_commit: save concurrent post_new_document_revision calls in
+      shared transactions through a GroupCommitQueue, whose one thread
+      also saves every post_document_revisions batch
+    diff_cache_max_entries, diff_cache_max_bytes: bounds of the cache
+      of diffs between historical revisions
+    snapshot: serve reads from an in-memory copy of the database, see
+      SnapshotConnectionPool. It is refreshed after this instance's
+      writes and, when the file has changed, every
+      snapshot_refresh_interval seconds
+    '''
     self.database_name = database_name
-    self.data_handler = DatabaseManager(database_name)
+    self.connection_pool = get_connection_pool(database_name, read_only)
+    self.read_pool = SnapshotConnectionPool(database_name, snapshot_refresh_interval) if snapshot else self.connection_pool
+    self.title_index = TitleIndex(self.read_pool)
+    self.data_handler = DatabaseManager(database_name, storage_engine, self.title_index)
+    self.search_index = self.data_handler.search_index
+    self.writer = writer
+    # Every refresh of the snapshot has to drop what was cached from the previous one
+    self.detect_external_writes = detect_external_writes or snapshot
+    self.precompress_historical = precompress_historical
+    self.group_commit = GroupCommitQueue(self._commit_writes) if group_commit else None
+    # Holds the title list and the latest revision of each title
+    self.cache = LRUCache(cache_max_entries, cache_max_bytes)
+    # Keyed by document ids, so it never needs invalidating
+    self.diff_cache = LRUCache(diff_cache_max_entries, diff_cache_max_bytes)
+    # Wakes change log readers waiting for this instance's next write
+    self._writes = 0
+    self._write_condition = threading.Condition()
+
+  def _check_external_writes(self):
+    if self.detect_external_writes and self.read_pool.has_external_changes():
+      self.cache.clear()
+      self.title_index.refresh()
+
+  def _notify_write(self):
+    # Reads from a snapshot only see this write once it is refreshed
+    if self.read_pool is not self.connection_pool:
+      self.read_pool.notify_write()
+
+    with self._write_condition:
+      self._writes += 1
+      self._write_condition.notify_all()
 
-  def db_connection(self):
-    try:
-      conn = sqlite3.connect(self.database_name)
-      cursor = conn.cursor()
-    except sqlite3.Error as error:
-      print(error)
+  def _get_cached(self, key):
+    self._check_external_writes()
 
-    return conn, cursor
+    return self.cache.get(key)
+
+  def _title_not_found(self, title):
+    message = f"Title: '{title}' not found, please check the provided title is correct. Please note that the tile is case sensitive and it needs to match exactly the title stored in the database."
+
+    # Spares the client a round trip to find the right title
+    suggestions = self.title_index.did_you_mean(title)
+    if suggestions:
+      message += " Did you mean: " + ", ".join(f"'{suggestion}'" for suggestion in suggestions) + "?"
+
+    return TitleNotFound(message)
+
+  def cache_stats(self):
+    return self.cache.stats()
   
+  def _build_revisions(self, cursor, rows):
+    resolved_contents = {}
+    return [
+      Revision(
+        title,
+        format_timestamp(creation_timestamp),
+        resolve_content(cursor, document_content, storage_format, base_document_id, resolved_contents)
+      )
+      for title, creation_timestamp, document_content, storage_format, base_document_id in rows
+    ]
+
   def get_titles(self):
 
-    [conn, cursor] = self.db_connection()
+    cached_titles_list = self._get_cached(("titles",))
+    if cached_titles_list is not None:
+      return list(cached_titles_list)
 
-    rows_query = cursor.execute("SELECT title FROM titles")
-    rows = rows_query.fetchall()
+    # Read before the database, see LRUCache.fill
+    cache_generation = self.cache.generation()
+    with self.read_pool.cursor() as cursor:
+      rows_query = cursor.execute("SELECT title FROM titles")
+      rows = rows_query.fetchall()
 
-    if len(rows) == 0:
-      raise NoDataInDatabase(f"Database has no data in it, make sure to load some data into {self.database_name} before trying to retrieve data from it.")
+      if len(rows) == 0:
+        raise NoDataInDatabase(f"Database has no data in it, make sure to load some data into {self.database_name} before trying to retrieve data from it.")
     
-    titles_list = list(numpy.concatenate(rows))
+      titles_list = [row[0] for row in rows]
 
-    conn.close()
+    self.cache.fill(("titles",), list(titles_list), cache_generation)
     return titles_list
   
-  def get_documents(self, title):
-    
-    [conn, cursor] = self.db_connection()
-
-    rows_query = cursor.execute("""
-      SELECT title, creation_timestamp, document_content FROM documents_metadata
-      INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
-      INNER JOIN titles ON documents_metadata.title_id = titles.title_id
-      WHERE
-        documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
-      """, ( title, )
-    )
+  def get_title_summaries(self, sort = "title", limit = None):
+    '''
+    Returns a TitleSummary with the latest revision's timestamp and the
+    number of revisions of every title, read from title_heads. sort is
+    "title" for alphabetical order or "recent" for the most recently
+    edited titles first.
+    '''
+    order_by = {
+      "title": "title",
+      "recent": "title_heads.creation_timestamp DESC"
+    }.get(sort)
+    if order_by is None:
+      raise ValueError(f"Unknown sort order: '{sort}', expected 'title' or 'recent'")
 
-    documents_list = rows_query.fetchall()
-    
-    if len(documents_list) == 0:
-      raise TitleNotFound(f"Title: '{title}' not found, please check the provided title is correct. Please note that the tile is case sensitive and it needs to match exactly the title stored in the database.")
-    
-    conn.close()
-    return documents_list
+    with self.read_pool.cursor() as cursor:
+      rows = cursor.execute(f"""
+        SELECT title, creation_timestamp, revision_count FROM title_heads
+        INNER JOIN titles ON titles.title_id = title_heads.title_id
+        ORDER BY {order_by} LIMIT ?
+        """, ( -1 if limit is None else limit, )
+      ).fetchall()
+
+    if len(rows) == 0:
+      raise NoDataInDatabase(f"Database has no data in it, make sure to load some data into {self.database_name} before trying to retrieve data from it.")
+
+    return [
+      TitleSummary(title, format_timestamp(creation_timestamp), revision_count)
+      for title, creation_timestamp, revision_count in rows
+    ]
+
+  def get_documents(self, title, limit = None, after = None, include_content = True, documents_cursor = None):
+
+    return [revision for _, revision in self._iter_positioned_documents(title, limit, after, include_content, documents_cursor)]
+
+  def get_documents_page(self, title, limit = None, after = None, include_content = True, documents_cursor = None):
+    '''
+    Returns the revisions get_documents would return, and the cursor of
+    the next page, or None when this page isn't full.
+    '''
+    positioned_revisions = list(self._iter_positioned_documents(title, limit, after, include_content, documents_cursor))
+
+    next_cursor = None
+    if positioned_revisions and len(positioned_revisions) == limit:
+      next_cursor = encode_changes_cursor(*positioned_revisions[-1][0])
+
+    return [revision for _, revision in positioned_revisions], next_cursor
+
+  def iter_documents(self, title, limit = None, after = None, include_content = True, documents_cursor = None):
+    '''
+    Returns a generator over the revisions of a title in creation order,
+    read STREAM_PAGE_SIZE at a time, each page on a connection checked
+    out only while it is read, so a slow consumer doesn't hold one. Pages
+    are selected with a keyset: only revisions created after the `after`
+    timestamp are returned, at most `limit` of them. A documents_cursor
+    from get_documents_page continues where that page ended instead,
+    which also tells apart revisions created at the same timestamp.
+    Without content, each revision is returned as (title, timestamp,
+    document_id). Raises ValueError when limit is negative.
+    '''
+    title_id, position = self._get_listing_start(title, limit, after, documents_cursor)
+
+    return self._iter_document_pages(title, title_id, position, limit, include_content)
+
+  def _iter_document_pages(self, title, title_id, position, limit, include_content):
+    revisions = self._iter_revisions if include_content else self._iter_revision_metadata
+
+    while limit is None or limit > 0:
+      page_size = STREAM_PAGE_SIZE if limit is None else min(limit, STREAM_PAGE_SIZE)
+      positioned_revisions = list(revisions(title, title_id, position, MAX_TIMESTAMP, page_size))
+
+      for _, revision in positioned_revisions:
+        yield revision
+
+      if len(positioned_revisions) < page_size:
+        return
+      position = positioned_revisions[-1][0]
+      if limit is not None:
+        limit -= page_size
+
+  def _iter_positioned_documents(self, title, limit, after, include_content, documents_cursor):
+    title_id, position = self._get_listing_start(title, limit, after, documents_cursor)
+    # A negative LIMIT means no limit in SQLite
+    limit = -1 if limit is None else limit
+
+    if include_content:
+      return self._iter_revisions(title, title_id, position, MAX_TIMESTAMP, limit)
+    return self._iter_revision_metadata(title, title_id, position, MAX_TIMESTAMP, limit)
+
+  def _get_listing_start(self, title, limit, after, documents_cursor):
+    '''
+    Returns the title's id and the ( creation_timestamp, document_id, )
+    position its revision listing continues after.
+    '''
+    if limit is not None and limit < 0:
+      raise ValueError("The revision listing limit must be at least 0")
+
+    if documents_cursor is not None:
+      position = decode_changes_cursor(documents_cursor)
+    elif after is not None:
+      # Past every document id, so revisions created at after are skipped too
+      position = ( to_epoch_microseconds(after), MAX_TIMESTAMP, )
+    else:
+      position = ( MIN_TIMESTAMP, 0, )
+
+    with self.read_pool.cursor() as cursor:
+      title_id = self.data_handler.get_title_id(cursor, title)
+
+    if title_id is None:
+      raise self._title_not_found(title)
+
+    return title_id, position
+
+  # Both yield ( ( creation_timestamp, document_id, ), revision, ) in keyset order
+  def _iter_revision_metadata(self, title, title_id, position, until, limit):
+    with self.read_pool.cursor() as cursor:
+      rows = cursor.execute("""
+        SELECT document_id, creation_timestamp, document_uuid FROM documents_metadata
+        WHERE title_id = ? AND (creation_timestamp, document_id) > (?, ?) AND creation_timestamp <= ?
+        ORDER BY creation_timestamp, document_id LIMIT ?
+        """, ( title_id, *position, until, limit, )
+      )
+
+      for document_id, creation_timestamp, document_uuid in rows:
+        yield ( creation_timestamp, document_id, ), RevisionMetadata(title, format_timestamp(creation_timestamp), document_uuid)
+
+  def _iter_revisions(self, title, title_id, position, until, limit):
+    with self.read_pool.cursor() as cursor:
+      # Deltas are resolved on a second cursor so the listing keeps streaming
+      content_cursor = cursor.connection.cursor()
+      resolved_contents = {}
+
+      rows = cursor.execute("""
+        SELECT documents_metadata.document_id, creation_timestamp, document_content, storage_format, base_document_id FROM documents_metadata
+        INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
+        WHERE documents_metadata.title_id = ?
+        AND (documents_metadata.creation_timestamp, documents_metadata.document_id) > (?, ?)
+        AND documents_metadata.creation_timestamp <= ?
+        ORDER BY documents_metadata.creation_timestamp, documents_metadata.document_id LIMIT ?
+        """, ( title_id, *position, until, limit, )
+      )
+
+      try:
+        for document_id, creation_timestamp, document_content, storage_format, base_document_id in rows:
+          # Only revisions since the last full snapshot can be needed again
+          if storage_format != DELTA_FORMAT:
+            resolved_contents.clear()
+
+          document_content = resolve_content(content_cursor, document_content, storage_format, base_document_id, resolved_contents)
+          resolved_contents[document_id] = document_content
+
+          yield ( creation_timestamp, document_id, ), Revision(title, format_timestamp(creation_timestamp), document_content)
+      finally:
+        content_cursor.close()
+
+  def get_revision_history(self, title, from_timestamp = None, to_timestamp = None, bucket = None, include_content = True):
+    '''
+    Returns the revisions of a title created between from_timestamp and
+    to_timestamp, both included, in creation order. With a bucket of
+    "hour", "day", "month" or "year", returns a HistoryBucket with the
+    number of revisions and their content lengths for every bucket of the
+    window that has revisions instead.
+    '''
+    bucket_format = None
+    if bucket is not None:
+      bucket_format = HISTORY_BUCKETS.get(bucket)
+      if bucket_format is None:
+        raise ValueError(f"Unknown bucket: '{bucket}', expected one of {', '.join(HISTORY_BUCKETS)}")
+
+    # Document ids start at 1, so this includes revisions created at from_timestamp
+    position = ( MIN_TIMESTAMP if from_timestamp is None else to_epoch_microseconds(from_timestamp), 0, )
+    until = MAX_TIMESTAMP if to_timestamp is None else to_epoch_microseconds(to_timestamp)
+
+    with self.read_pool.cursor() as cursor:
+      title_id = self.data_handler.get_title_id(cursor, title)
+      if title_id is None:
+        raise self._title_not_found(title)
+
+      if bucket_format is None:
+        revisions = self._iter_revisions if include_content else self._iter_revision_metadata
+        return [revision for _, revision in revisions(title, title_id, position, until, -1)]
+
+      # A range scan of the (title_id, creation_timestamp) index
+      rows = cursor.execute("""
+        SELECT
+          strftime(?, creation_timestamp / 1000000, 'unixepoch') AS bucket_start,
+          COUNT(*),
+          MIN(content_length),
+          AVG(content_length),
+          MAX(content_length)
+        FROM documents_metadata
+        WHERE title_id = ? AND creation_timestamp >= ? AND creation_timestamp <= ?
+        GROUP BY bucket_start ORDER BY bucket_start
+        """, ( bucket_format, title_id, position[0], until, )
+      ).fetchall()
+
+    return [
+      HistoryBucket(bucket_start, revision_count, min_length, round(average_length), max_length)
+      for bucket_start, revision_count, min_length, average_length, max_length in rows
+    ]
+
+  def get_changes(self, since = None, limit = 100, changes_cursor = None):
+    '''
+    Returns a page of the feed of revisions of every title created at or
+    after the since timestamp, oldest first, as Change records, and the
+    cursor of the next page or None on the last page. A cursor from a
+    previous page continues the feed where that page ended.
+    '''
+    if limit < 1:
+      raise ValueError("The changes feed limit must be at least 1")
+
+    if changes_cursor is not None:
+      position = decode_changes_cursor(changes_cursor)
+    else:
+      # Document ids start at 1, so this includes revisions created at since
+      position = ( MIN_TIMESTAMP if since is None else to_epoch_microseconds(since), 0, )
+
+    with self.read_pool.cursor() as cursor:
+      # A range scan of the creation_timestamp index, which ends with the document_id
+      rows = cursor.execute("""
+        SELECT documents_metadata.document_id, title, creation_timestamp, document_uuid, content_length FROM documents_metadata
+        INNER JOIN titles ON titles.title_id = documents_metadata.title_id
+        WHERE (creation_timestamp, documents_metadata.document_id) > (?, ?)
+        ORDER BY creation_timestamp, documents_metadata.document_id LIMIT ?
+        """, ( *position, limit, )
+      ).fetchall()
+
+    changes = [
+      Change(title, format_timestamp(creation_timestamp), document_uuid, content_length)
+      for _, title, creation_timestamp, document_uuid, content_length in rows
+    ]
+    next_cursor = None
+    if len(rows) == limit:
+      next_cursor = encode_changes_cursor(rows[-1][2], rows[-1][0])
+
+    return changes, next_cursor
+
+  def get_change_log(self, after = 0, limit = 100, wait = 0):
+    '''
+    Returns up to limit ChangeLogEntry records logged after the after
+    sequence number, oldest first. When there are none yet, waits up to
+    wait seconds (at most MAX_CHANGE_LOG_WAIT) for one to be logged and
+    returns an empty list if none was. Writes made through this instance
+    wake the wait at once, other processes' writes are polled for.
+    '''
+    if limit < 1:
+      raise ValueError("The change log limit must be at least 1")
+
+    deadline = monotonic() + min(max(wait, 0), MAX_CHANGE_LOG_WAIT)
+    while True:
+      # Read before the entries, so a write made while reading them isn't missed
+      with self._write_condition:
+        writes = self._writes
+
+      with self.read_pool.cursor() as cursor:
+        entries = read_change_log(cursor, after, limit)
+
+      remaining = deadline - monotonic()
+      if entries or remaining <= 0:
+        return entries
+
+      with self._write_condition:
+        self._write_condition.wait_for(lambda: self._writes != writes, min(remaining, CHANGE_LOG_POLL_INTERVAL))
 
   def get_document_as_it_was_at_a_given_timestamp(self, title, timestamp):
     
-    [conn, cursor] = self.db_connection()
-
-    rows_query = cursor.execute("""
-      SELECT title, creation_timestamp, document_content FROM documents_metadata
-      INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
-      INNER JOIN titles ON documents_metadata.title_id = titles.title_id
-      WHERE
-        documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
-      AND
-        documents_metadata.creation_timestamp <= ?
-      ORDER BY documents_metadata.creation_timestamp DESC LIMIT 1
-      """, ( title, timestamp, )
-    )
+    timestamp = to_epoch_microseconds(timestamp)
 
-    rows = rows_query.fetchall()
+    with self.read_pool.cursor() as cursor:
+      rows_query = cursor.execute("""
+        SELECT title, creation_timestamp, document_content, storage_format, base_document_id FROM documents_metadata
+        INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
+        INNER JOIN titles ON documents_metadata.title_id = titles.title_id
+        WHERE
+          documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
+        AND
+          documents_metadata.creation_timestamp <= ?
+        ORDER BY documents_metadata.creation_timestamp DESC LIMIT 1
+        """, ( title, timestamp, )
+      )
 
-    if len(rows) == 0:
-      if title in self.get_titles():
-        # Getting the earliest revision available for title
-        rows_query = cursor.execute("""
-          SELECT title, MIN(creation_timestamp), document_content FROM documents_metadata
-          INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
-          INNER JOIN titles ON documents_metadata.title_id = titles.title_id
-          WHERE
-            documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
-          """, ( title, )
-        )
-        rows = rows_query.fetchall()
+      rows = rows_query.fetchall()
 
-        raise NoDocumentCreatedAtTimestamp(f"There are no document revisions created for title '{title}' before timestamp: {timestamp}. The earlier revision for this title was created at timestamp: {rows[0][1]}")
-      else:
-        raise TitleNotFound(f"Title: '{title}' not found, please check the provided title is correct. Please note that the tile is case sensitive and it needs to match exactly the title stored in the database.")
+      if len(rows) == 0:
+        if title in self.get_titles():
+          # Getting the earliest revision available for title
+          rows_query = cursor.execute("""
+            SELECT title, MIN(creation_timestamp), document_content FROM documents_metadata
+            INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
+            INNER JOIN titles ON documents_metadata.title_id = titles.title_id
+            WHERE
+              documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
+            """, ( title, )
+          )
+          rows = rows_query.fetchall()
+
+          raise NoDocumentCreatedAtTimestamp(f"There are no document revisions created for title '{title}' before timestamp: {format_timestamp(timestamp)}. The earlier revision for this title was created at timestamp: {format_timestamp(rows[0][1])}")
+        else:
+          raise self._title_not_found(title)
       
-    document_revision_at_a_given_timestamp = list(numpy.concatenate(rows))
+      document_revision_at_a_given_timestamp = self._build_revisions(cursor, rows)[0]
 
-    conn.close()
     return document_revision_at_a_given_timestamp
 
-  def get_latest_document_revision(self, title):
-    
-    [conn, cursor] = self.db_connection()
-
-    rows_query = cursor.execute("""
-      SELECT title, MAX(creation_timestamp), document_content FROM documents_metadata
-      INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
-      INNER JOIN titles ON documents_metadata.title_id = titles.title_id
-      WHERE
-        documents_metadata.title_id = ( SELECT title_id FROM titles WHERE title = ? )
-      """, ( title, )
+  def get_revisions_for_titles(self, titles, timestamp = None):
+    '''
+    Returns a {title: revision} dict with the latest revision of every
+    title, or the revision as it was at timestamp, all read with one
+    query. Titles without such a revision map to None. Raises
+    BatchTooLarge for more than MAX_BATCH_SIZE titles.
+    '''
+    if len(titles) > MAX_BATCH_SIZE:
+      raise BatchTooLarge(f"A batch can read at most {MAX_BATCH_SIZE} titles, got {len(titles)}")
+
+    revisions = dict.fromkeys(titles)
+
+    if timestamp is None:
+      self._check_external_writes()
+      # Read before the database, see LRUCache.fill
+      cache_generation = self.cache.generation()
+      for title in revisions:
+        cached_latest = self.cache.get(("latest", title))
+        revisions[title] = None if cached_latest is None else cached_latest[0]
+      timestamp = MAX_TIMESTAMP
+    else:
+      timestamp = to_epoch_microseconds(timestamp)
+
+    missing_titles = [title for title, revision in revisions.items() if revision is None]
+    if not missing_titles:
+      return revisions
+
+    with self.read_pool.cursor() as cursor:
+      if timestamp == MAX_TIMESTAMP:
+        rows = cursor.execute("""
+          SELECT title, creation_timestamp, document_content, storage_format, base_document_id, content_hash FROM titles
+          INNER JOIN title_heads ON title_heads.title_id = titles.title_id
+          INNER JOIN documents_data ON documents_data.document_id = title_heads.document_id
+          WHERE title IN ( SELECT value FROM json_each(?) )
+          """, ( json.dumps(missing_titles), )
+        ).fetchall()
+
+        for latest in self._build_latest_revisions(cursor, rows):
+          revisions[latest[0].title] = latest[0]
+          self.cache.fill(("latest", latest[0].title), latest, cache_generation)
+        return revisions
+
+      # One index seek per title for its newest revision up to timestamp
+      rows = cursor.execute("""
+        SELECT title, creation_timestamp, document_content, storage_format, base_document_id FROM titles
+        INNER JOIN documents_metadata ON documents_metadata.document_id = (
+          SELECT document_id FROM documents_metadata
+          WHERE documents_metadata.title_id = titles.title_id AND creation_timestamp <= ?
+          ORDER BY creation_timestamp DESC LIMIT 1
+        )
+        INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
+        WHERE title IN ( SELECT value FROM json_each(?) )
+        """, ( timestamp, json.dumps(missing_titles), )
+      ).fetchall()
+
+      for revision in self._build_revisions(cursor, rows):
+        revisions[revision.title] = revision
+
+    return revisions
+
+  def get_revision_info_at_a_given_timestamp(self, title, timestamp):
+    '''
+    Returns (creation_timestamp, content_hash, is_historical, document_id)
+    of the revision get_document_as_it_was_at_a_given_timestamp would
+    return, without loading its content, or None when there is no such
+    revision. A revision is historical when the title has a newer revision.
+    '''
+    timestamp = to_epoch_microseconds(timestamp)
+
+    with self.read_pool.cursor() as cursor:
+      return cursor.execute("""
+        SELECT creation_timestamp, content_hash, EXISTS (
+          SELECT 1 FROM documents_metadata AS newer_revisions
+          WHERE newer_revisions.title_id = documents_metadata.title_id
+          AND newer_revisions.creation_timestamp > documents_metadata.creation_timestamp
+        ), document_id FROM documents_metadata
+        WHERE
+          title_id = ( SELECT title_id FROM titles WHERE title = ? )
+        AND
+          creation_timestamp <= ?
+        ORDER BY creation_timestamp DESC LIMIT 1
+        """, ( title, timestamp, )
+      ).fetchone()
+
+  def get_encoded_historical_revision(self, title, timestamp, document_id, content_encoding):
+    '''
+    Returns the JSON body of a historical revision compressed with
+    content_encoding. Historical revisions never change, so the body is
+    compressed once and kept in precompressed_revisions, and later calls
+    send the stored bytes as they are.
+    '''
+    with self.read_pool.cursor() as cursor:
+      row = cursor.execute("""
+        SELECT body FROM precompressed_revisions
+        WHERE document_id = ? AND content_encoding = ?
+        """, ( document_id, content_encoding, )
+      ).fetchone()
+
+    if row is not None:
+      return row[0]
+
+    revision = self.get_document_as_it_was_at_a_given_timestamp(title, timestamp)
+    body = compress(dumps_bytes(revision), content_encoding)
+
+    # Read only instances still answer, they just can't keep the body
+    if not self.connection_pool.read_only:
+      with self.connection_pool.transaction() as cursor:
+        cursor.execute("INSERT OR IGNORE INTO precompressed_revisions VALUES (?, ?, ?)", ( document_id, content_encoding, body, ))
+
+    return body
+
+  def get_revision_diff(self, title, from_timestamp, to_timestamp, context = 3):
+    '''
+    Returns a RevisionDiff with the unified diff, line by line, from the
+    revision of title as it was at from_timestamp to the one as it was at
+    to_timestamp. Diffs between two historical revisions never change and
+    are kept in a bounded cache. Raises ValueError when context is
+    negative.
+    '''
+    if context < 0:
+      raise ValueError("The diff context must be at least 0")
+
+    from_info = self.get_revision_info_at_a_given_timestamp(title, from_timestamp)
+    to_info = self.get_revision_info_at_a_given_timestamp(title, to_timestamp)
+    if from_info is None or to_info is None:
+      # Raises the same errors as reading the missing revision would
+      self.get_document_as_it_was_at_a_given_timestamp(title, to_timestamp if from_info else from_timestamp)
+
+    cache_key = ( from_info[3], to_info[3], context, )
+    is_historical = from_info[2] and to_info[2]
+    if is_historical:
+      cached_diff = self.diff_cache.get(cache_key)
+      if cached_diff is not None:
+        return cached_diff
+
+    with self.read_pool.cursor() as cursor:
+      # Revisions stored as deltas can share their base revisions
+      resolved_contents = {}
+      from_content = load_document_content(cursor, from_info[3], resolved_contents)[0]
+      to_content = load_document_content(cursor, to_info[3], resolved_contents)[0]
+
+    revision_diff = RevisionDiff(
+      title,
+      format_timestamp(from_info[0]),
+      format_timestamp(to_info[0]),
+      diff_lines(from_content.split("\n"), to_content.split("\n"), context)
     )
 
-    rows = rows_query.fetchall()
-    if rows[0][1] == None:
-      raise TitleNotFound(f"Title: '{title}' not found, please check the provided title is correct. Please note that the tile is case sensitive and it needs to match exactly the title stored in the database.")
+    if is_historical:
+      self.diff_cache.set(cache_key, revision_diff)
+    return revision_diff
+
+  def get_latest_document_revision(self, title):
 
-    latest_document_revision = list(numpy.concatenate(rows))
+    return self.get_latest_document_revision_with_hash(title)[0]
 
-    conn.close()
-    return latest_document_revision
+  def get_latest_document_revision_with_hash(self, title):
+    '''
+    Returns the latest revision of a title and the hash of its content,
+    which is read from the title's head and cached with the revision, so
+    ETags don't hash the content again.
+    '''
+    cached_latest = self._get_cached(("latest", title))
+    if cached_latest is not None:
+      return cached_latest
+
+    # Read before the database, see LRUCache.fill
+    cache_generation = self.cache.generation()
+    with self.read_pool.cursor() as cursor:
+      # The title's head points straight at its latest revision
+      rows_query = cursor.execute("""
+        SELECT title, creation_timestamp, document_content, storage_format, base_document_id, content_hash FROM titles
+        INNER JOIN title_heads ON title_heads.title_id = titles.title_id
+        INNER JOIN documents_data ON documents_data.document_id = title_heads.document_id
+        WHERE title = ?
+        """, ( title, )
+      )
+
+      rows = rows_query.fetchall()
+      if len(rows) == 0:
+        raise self._title_not_found(title)
+
+      latest = self._build_latest_revisions(cursor, rows)[0]
+
+    self.cache.fill(("latest", title), latest, cache_generation)
+    return latest
+
+  def _build_latest_revisions(self, cursor, rows):
+    # Rows end with the content hash of the title's head, which rows
+    # written before content hashes were stored don't have
+    revisions = self._build_revisions(cursor, [row[:-1] for row in rows])
+    return [
+      ( revision, row[-1] or hash_content(revision.content), )
+      for revision, row in zip(revisions, rows)
+    ]
   
-  def post_new_document_revision(self, title, timestamp, new_content):
+  def suggest_titles(self, prefix, limit = 10):
+    '''
+    Returns up to `limit` titles starting with prefix, ignoring case,
+    the title matching prefix ignoring case if there is one, and close
+    misspellings of prefix when no title starts with it.
+    '''
+    self._check_external_writes()
+
+    suggestions = self.title_index.suggest(prefix, limit)
+    return {
+      "suggestions": suggestions,
+      "match": self.title_index.resolve(prefix),
+      "did_you_mean": [] if suggestions else self.title_index.did_you_mean(prefix, limit=limit)
+    }
+
+  def search_documents(self, query, limit = 20, offset = 0):
+    '''
+    Returns the revisions matching every word of the query, best match
+    first, as (title, timestamp, snippet) with the matches in [brackets].
+    '''
+    with self.read_pool.cursor() as cursor:
+      return self.search_index.search(cursor, query, limit, offset)
 
-    titles_list = self.get_titles()
-    old_content = self.get_latest_document_revision(title)
+  def _save_new_document_revision(self, cursor, title, timestamp, new_content):
+    '''
+    Validates and writes one revision of an existing title with the given
+    cursor. Returns the creation timestamp of the title's previous latest
+    revision and the hash of the new content.
+    '''
+    title_id = self.data_handler.get_title_id(cursor, title)
+    if title_id is None:
+      raise self._title_not_found(title)
 
-    if old_content[2] == new_content:
+    _, latest_timestamp, latest_content_hash = get_title_head(cursor, title_id)
+
+    new_content_hash = hash_content(new_content)
+    if latest_content_hash == new_content_hash:
       raise NoChangesDetected(f"No changes detected in new content for title: {title}")
-    if title not in titles_list:
-      raise TitleNotFound(f"Title: '{title}' not found, please check the provided title is correct. Please note that the tile is case sensitive and it needs to match exactly the title stored in the database.")
-    else:
-      self.data_handler.save_data_to_db(title, timestamp, new_content)
-      return f"New document saved to title: {title}"
+
+    self.data_handler.insert_document_revision(cursor, title_id, timestamp, new_content)
+    return latest_timestamp, new_content_hash
+
+  def _cache_new_document_revision(self, title, timestamp, new_content, latest_timestamp, new_content_hash):
+    # Write-through: the new revision only replaces the cached latest one
+    # when it is not older than it
+    if timestamp >= latest_timestamp:
+      self.cache.set(("latest", title), ( Revision(title, format_timestamp(timestamp), new_content), new_content_hash, ))
+
+  def post_new_document_revision(self, title, timestamp, new_content):
+
+    if self.writer is not None:
+      return self.writer.post_new_document_revision(title, timestamp, new_content)
+
+    timestamp = to_epoch_microseconds(timestamp)
+
+    if self.group_commit is not None:
+      return self.group_commit.submit("revision", title, timestamp, new_content)
+
+    # Title lookup, change detection and both inserts share one transaction
+    with self.connection_pool.transaction() as cursor:
+      latest_timestamp, new_content_hash = self._save_new_document_revision(cursor, title, timestamp, new_content)
+
+    self._cache_new_document_revision(title, timestamp, new_content, latest_timestamp, new_content_hash)
+    self._notify_write()
+    return f"New document saved to title: {title}"
+
+  def _commit_writes(self, writes):
+    '''
+    Saves the ( "revision", title, timestamp, content, ) and ( "batch",
+    results, valid_revisions, ) writes queued on the group commit
+    thread, in order. Consecutive revisions share one transaction and
+    each batch has its own, all on this one thread and its connection,
+    so writes never wait on each other for the write lock.
+    '''
+    results = []
+
+    for kind, group in itertools.groupby(writes, key=lambda write: write[0]):
+      group = [write[1:] for write in group]
+      if kind == "batch":
+        for batch_results, valid_revisions in group:
+          try:
+            results.append(( True, self._save_document_revisions(batch_results, valid_revisions), ))
+          except Exception as error:
+            results.append(( False, error, ))
+        continue
+
+      try:
+        results += self._commit_new_document_revisions(group)
+      except Exception as error:
+        # The transaction failed, so did every revision in it
+        results += [( False, error, )] * len(group)
+
+    return results
+
+  def _commit_new_document_revisions(self, revisions):
+    '''
+    Saves the (title, timestamp, content) revisions queued by concurrent
+    post_new_document_revision calls in one transaction. Each revision
+    runs in its own savepoint, so a rejected one leaves the others alone.
+    '''
+    results = []
+    saved_revisions = []
+
+    with self.connection_pool.transaction() as cursor:
+      for title, timestamp, new_content in revisions:
+        cursor.execute("SAVEPOINT group_commit_revision")
+        try:
+          latest_timestamp, new_content_hash = self._save_new_document_revision(cursor, title, timestamp, new_content)
+        except Exception as error:
+          cursor.execute("ROLLBACK TO group_commit_revision")
+          results.append(( False, error, ))
+        else:
+          saved_revisions.append(( title, timestamp, new_content, latest_timestamp, new_content_hash, ))
+          results.append(( True, f"New document saved to title: {title}", ))
+        cursor.execute("RELEASE group_commit_revision")
+
+    for saved_revision in saved_revisions:
+      self._cache_new_document_revision(*saved_revision)
+    if saved_revisions:
+      self._notify_write()
+    return results
+
+  def post_document_revisions(self, revisions, default_timestamp):
+    '''
+    Saves many revisions in a single transaction. Each revision is a
+    {"title", "content", "timestamp"} dict and titles that don't exist
+    yet are created. Revisions without a timestamp are given
+    default_timestamp, one microsecond later for each such revision
+    before them, so every one of them has its own timestamp.
+    Invalid revisions are rejected and the others are still saved.
+    Returns one {"title", "saved", "message"} dict per revision, in order.
+    Raises BatchTooLarge for more than MAX_BATCH_SIZE revisions.
+    '''
+    if len(revisions) > MAX_BATCH_SIZE:
+      raise BatchTooLarge(f"A batch can hold at most {MAX_BATCH_SIZE} revisions, got {len(revisions)}")
+
+    if self.writer is not None:
+      return self.writer.post_document_revisions(revisions, default_timestamp)
+
+    # Checked before queueing, so only valid revisions wait for the writer
+    results, valid_revisions = self._check_document_revisions(revisions, default_timestamp)
+
+    if self.group_commit is not None:
+      return self.group_commit.submit("batch", results, valid_revisions)
+
+    return self._save_document_revisions(results, valid_revisions)
+
+  def _check_document_revisions(self, revisions, default_timestamp):
+    '''
+    Runs the checks of a batch that don't need the database. Returns the
+    results of the rejected revisions, None for the others, and the
+    ( index, title, timestamp, content, ) of the valid ones.
+    '''
+    default_timestamp = to_epoch_microseconds(default_timestamp)
+    results = [None] * len(revisions)
+    valid_revisions = []
+    defaulted_timestamps = 0
+
+    for index, revision in enumerate(revisions):
+      title = revision.get("title") if isinstance(revision, dict) else None
+      try:
+        if not isinstance(title, str) or not isinstance(revision.get("content"), str):
+          raise ValueError("Every revision needs a 'title' and a 'content' string")
+        if len(title) > 50:
+          raise TitleTooLongError(f"Title: '{title}' Title is too long, max limit of 50 characters")
+
+        timestamp = revision.get("timestamp")
+        if timestamp is None:
+          timestamp = default_timestamp + defaulted_timestamps
+          defaulted_timestamps += 1
+        else:
+          timestamp = to_epoch_microseconds(timestamp)
+      except (InvalidTimestamp, TitleTooLongError, ValueError) as error:
+        results[index] = {"title": title, "saved": False, "message": str(error)}
+      else:
+        valid_revisions.append(( index, title, timestamp, revision["content"], ))
+
+    return results, valid_revisions
+
+  def _save_document_revisions(self, results, valid_revisions):
+    new_titles = []
+    with self.connection_pool.transaction() as cursor:
+      # Id, latest timestamp and latest content hash of every title in the batch
+      heads = {
+        title: [ title_id, latest_timestamp, latest_content_hash ]
+        for title, title_id, latest_timestamp, latest_content_hash in cursor.execute("""
+          SELECT title, titles.title_id, creation_timestamp, content_hash FROM titles
+          LEFT JOIN title_heads ON title_heads.title_id = titles.title_id
+          WHERE title IN ( SELECT value FROM json_each(?) )
+          """, ( json.dumps(sorted(set(title for _, title, _, _ in valid_revisions))), )
+        )
+      }
+
+      for index, title, timestamp, new_content in valid_revisions:
+        new_content_hash = hash_content(new_content)
+        head = heads.get(title)
+
+        if head is None:
+          cursor.execute("INSERT INTO titles (title) VALUES (?)", ( title, ))
+          head = heads[title] = [ cursor.lastrowid, None, None ]
+          new_titles.append(title)
+        elif head[2] == new_content_hash:
+          results[index] = {"title": title, "saved": False, "message": str(NoChangesDetected(f"No changes detected in new content for title: {title}"))}
+          continue
+
+        self.data_handler.insert_document_revision(cursor, head[0], timestamp, new_content)
+        if head[1] is None or timestamp >= head[1]:
+          head[1], head[2] = timestamp, new_content_hash
+        results[index] = {"title": title, "saved": True, "message": f"New document saved to title: {title}"}
+
+    for title in heads:
+      self.cache.delete(("latest", title))
+    if new_titles:
+      self.cache.delete(("titles",))
+      for title in new_titles:
+        self.title_index.add(title)
+    self._notify_write()
+
+    return results
@@ -30,3 +30,21 @@ class NoChangesDetected(Error):
     self.message = message
   def __str__(self):
     return repr(self.message)
+
+class InvalidTimestamp(Error):
+  def __init__(self, message):
+    self.message = message
+  def __str__(self):
+    return repr(self.message)
+
+class ConnectionPoolExhausted(Error):
+  def __init__(self, message):
+    self.message = message
+  def __str__(self):
+    return repr(self.message)
+
+class BatchTooLarge(Error):
+  def __init__(self, message):
+    self.message = message
+  def __str__(self):
+    return repr(self.message)
@@ -0,0 +1,93 @@
+import os
+import queue
+import threading
+
+from concurrent.futures import Future
+
+class GroupCommitQueue:
+  '''
+  Coalesces writes submitted concurrently from many threads into shared
+  transactions. A single background thread takes every request waiting
+  in the queue, up to max_batch_size, and hands them to commit_batch
+  together so they share one commit and one fsync. Requests arriving
+  while a batch commits form the next batch. A max_delay > 0 also waits
+  up to that many seconds for each further request, trading latency for
+  larger batches.
+
+  commit_batch receives a list of argument tuples and must return one
+  ( succeeded, result_or_exception, ) pair per tuple.
+
+  The background thread is started by the first submit in each process,
+  so a queue created before a fork runs in the process that uses it.
+  '''
+  def __init__(self, commit_batch, max_batch_size = 64, max_delay = 0):
+    self.commit_batch = commit_batch
+    self.max_batch_size = max_batch_size
+    self.max_delay = max_delay
+
+    self.batches = 0
+    self.requests = 0
+
+    self._queue = queue.Queue()
+    self._start_lock = threading.Lock()
+    # Process the background thread was started in
+    self._pid = None
+
+  def _ensure_started(self):
+    with self._start_lock:
+      if self._pid == os.getpid():
+        return
+
+      # A forked child inherits the queue but not the thread
+      if self._pid is not None:
+        self._queue = queue.Queue()
+      self._pid = os.getpid()
+      threading.Thread(target=self._run, args=(self._queue,), name="group-commit", daemon=True).start()
+
+  def submit(self, *arguments):
+    '''
+    Queues a write and blocks until the transaction holding it commits.
+    Returns its result or raises its exception.
+    '''
+    self._ensure_started()
+    future = Future()
+    self._queue.put(( arguments, future, ))
+    return future.result()
+
+  def _take_batch(self, requests):
+    batch = [requests.get()]
+    try:
+      while len(batch) < self.max_batch_size:
+        if self.max_delay > 0:
+          batch.append(requests.get(timeout=self.max_delay))
+        else:
+          batch.append(requests.get_nowait())
+    except queue.Empty:
+      pass
+
+    return batch
+
+  def _run(self, requests):
+    while True:
+      batch = self._take_batch(requests)
+
+      try:
+        results = self.commit_batch([arguments for arguments, _ in batch])
+      except Exception as error:
+        # The whole transaction failed, so did every write in it
+        results = [( False, error, )] * len(batch)
+
+      self.batches += 1
+      self.requests += len(batch)
+
+      for ( _, future ), ( succeeded, result ) in zip(batch, results):
+        if succeeded:
+          future.set_result(result)
+        else:
+          future.set_exception(result)
+
+  def stats(self):
+    return {
+      "batches": self.batches,
+      "requests": self.requests
+    }
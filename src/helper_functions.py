@@ -1,7 +1,80 @@
+import hashlib
 import json
 
+from datetime import datetime, timedelta, timezone
+
+from src.exceptions import InvalidTimestamp
+from src.json_encoding import dumps_bytes
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+# Digits of an ISO 8601 basic format date, "YYYYMMDD"
+ISO_BASIC_DATE_LENGTH = 8
+# Digits of microseconds since the epoch from 2001-09-09 to 2286-11-20.
+# Other digit strings are more likely seconds, milliseconds or
+# nanoseconds than microseconds, so they are rejected rather than guessed
+EPOCH_MICROSECONDS_LENGTH = 16
+# Timestamps format_timestamp can turn back into a date
+MIN_EPOCH_MICROSECONDS = (datetime.min - EPOCH) // ONE_MICROSECOND
+MAX_EPOCH_MICROSECONDS = (datetime.max - EPOCH) // ONE_MICROSECOND
+
 def get_data_from_file(file):
   with open(file, "r") as f:
     data = json.load(f)
 
-  return data
\ No newline at end of file
+  return data
+
+def invalid_timestamp(timestamp):
+  return InvalidTimestamp(f"Timestamp: '{timestamp}' is not a valid timestamp, please use the format 'YYYY-MM-DD HH:MM:SS.ffffff'")
+
+def to_epoch_microseconds(timestamp):
+  '''
+  Normalizes a timestamp into integer microseconds since the epoch.
+  Accepts integers, datetimes, ISO formatted strings such as
+  "2023-03-22 14:00:00.00" or "20230322" and strings of
+  EPOCH_MICROSECONDS_LENGTH digits, read as microseconds. Naive
+  datetimes are treated as UTC. Raises InvalidTimestamp for anything
+  else, and for integers outside the range of dates.
+  '''
+  if isinstance(timestamp, int):
+    if not MIN_EPOCH_MICROSECONDS <= timestamp <= MAX_EPOCH_MICROSECONDS:
+      raise invalid_timestamp(timestamp)
+    return timestamp
+
+  if isinstance(timestamp, str):
+    if timestamp.isdigit() and len(timestamp) != ISO_BASIC_DATE_LENGTH:
+      if len(timestamp) != EPOCH_MICROSECONDS_LENGTH:
+        raise InvalidTimestamp(f"Timestamp: '{timestamp}' is not a valid timestamp, numeric timestamps are microseconds since the epoch and have {EPOCH_MICROSECONDS_LENGTH} digits")
+      return int(timestamp)
+    try:
+      timestamp = datetime.fromisoformat(timestamp)
+    except ValueError:
+      raise invalid_timestamp(timestamp)
+
+  if isinstance(timestamp, datetime):
+    if timestamp.tzinfo is not None:
+      try:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+      except OverflowError:
+        raise invalid_timestamp(timestamp)
+    return (timestamp - EPOCH) // ONE_MICROSECOND
+
+  raise invalid_timestamp(timestamp)
+
+def format_timestamp(epoch_microseconds):
+  return (EPOCH + timedelta(microseconds=epoch_microseconds)).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def hash_content(content):
+  return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def iter_json_array_chunks(items):
+  '''
+  Serializes an iterable as a JSON array one item at a time, so a response
+  can be streamed without building the whole list in memory.
+  '''
+  yield b"["
+  for index, item in enumerate(items):
+    if index > 0:
+      yield b","
+    yield dumps_bytes(item)
+  yield b"]"
@@ -0,0 +1,67 @@
+import hashlib
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from src.compression import strip_encoding_from_etag
+from src.helper_functions import hash_content, to_epoch_microseconds
+
+# Responses may be stored but have to be revalidated on every use. Even a
+# point-in-time revision URL can resolve to another revision once an
+# older timestamp is written, by a batch or the bulk importer
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+def revision_etag(creation_timestamp, content_hash):
+  '''
+  Strong ETag of a revision from its integer timestamp and content hash.
+  '''
+  return f'"{creation_timestamp:x}-{content_hash[:32]}"'
+
+def body_etag(body):
+  return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def http_date(epoch_microseconds):
+  timestamp = datetime.fromtimestamp(epoch_microseconds // 1000000, timezone.utc)
+  return format_datetime(timestamp, usegmt=True)
+
+def revision_info_headers(creation_timestamp, content_hash):
+  '''
+  ETag, Last-Modified and Cache-Control headers of a revision.
+  '''
+  return {
+    "ETag": revision_etag(creation_timestamp, content_hash),
+    "Last-Modified": http_date(creation_timestamp),
+    "Cache-Control": REVALIDATE_CACHE_CONTROL
+  }
+
+def revision_headers(revision, content_hash = None):
+  '''
+  Same as revision_info_headers for a Revision record, hashing its
+  content unless its content_hash is given.
+  '''
+  return revision_info_headers(
+    to_epoch_microseconds(revision.creation_timestamp),
+    hash_content(revision.content) if content_hash is None else content_hash
+  )
+
+def is_not_modified(if_none_match, if_modified_since, headers):
+  '''
+  Whether a GET with these If-None-Match and If-Modified-Since request
+  headers can be answered with 304 Not Modified. As in RFC 9110,
+  If-Modified-Since is ignored when If-None-Match is sent.
+  '''
+  if if_none_match:
+    if if_none_match.strip() == "*":
+      return True
+    # Weak comparison, as required for If-None-Match, of the ETags
+    # without the content coding suffix compress_body adds
+    etags = [strip_encoding_from_etag(etag.strip().removeprefix("W/")) for etag in if_none_match.split(",")]
+    return headers.get("ETag") in etags
+
+  if if_modified_since and "Last-Modified" in headers:
+    try:
+      return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+      return False
+
+  return False
@@ -0,0 +1,22 @@
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+def _tuple_to_list(value):
+  # orjson only serializes plain tuples, Revision records are tuple subclasses
+  if isinstance(value, tuple):
+    return list(value)
+  raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_bytes(value):
+  '''
+  Serializes a value straight to UTF-8 JSON bytes, using orjson when it
+  is installed and the standard library otherwise.
+  '''
+  if orjson is not None:
+    return orjson.dumps(value, default=_tuple_to_list)
+
+  return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
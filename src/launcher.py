@@ -0,0 +1,202 @@
+import argparse
+import os
+import os.path
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+from multiprocessing.connection import Client, Listener
+from werkzeug.serving import make_server
+
+# Imported before forking so every worker starts with the app preloaded
+import server
+
+from src.connection_pool import get_connection_pool
+from src.document_store_actions import DocumentStoreActions
+from src.sqlite import SqliteDB
+
+class WriterServer:
+  '''
+  Owns the only writable connection to the database. Workers send their
+  writes over a Unix socket, so SQLite never sees two processes competing
+  for the write lock. Every worker connection is served on its own thread,
+  and every write, batches included, is saved by the one group commit
+  thread, so concurrent single posts share transactions and no two
+  writes compete for the write lock within the writer either.
+  '''
+  def __init__(self, address, authkey, database_name = "wiki_documents_db.db"):
+    self.address = address
+    self.authkey = authkey
+    self.database_name = database_name
+    # Created by serve_forever, so its threads and connections belong to the writer process
+    self.document_store_actions = None
+
+  def _serve_connection(self, connection):
+    with connection:
+      while True:
+        try:
+          method, arguments = connection.recv()
+        except (EOFError, OSError):
+          return
+
+        try:
+          result = ( "ok", getattr(self.document_store_actions, method)(*arguments), )
+        except Exception as error:
+          result = ( "error", error, )
+        connection.send(result)
+
+  def serve_forever(self):
+    # Left behind by a previous writer process
+    if os.path.exists(self.address):
+      os.unlink(self.address)
+
+    self.document_store_actions = DocumentStoreActions(self.database_name, group_commit=True)
+    listener = Listener(self.address, "AF_UNIX", authkey=self.authkey)
+
+    while True:
+      connection = listener.accept()
+      threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+class WriterClient:
+  '''
+  Stands in for the write methods of DocumentStoreActions in a worker
+  process by forwarding them to the WriterServer. Each call uses an idle
+  connection to the writer or opens one, so concurrent calls reach the
+  writer together and can share its group commits.
+  '''
+  def __init__(self, address, authkey):
+    self.address = address
+    self.authkey = authkey
+
+    self._idle = []
+    self._lock = threading.Lock()
+
+  def _connect(self, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while True:
+      try:
+        return Client(self.address, "AF_UNIX", authkey=self.authkey)
+      except (FileNotFoundError, ConnectionRefusedError):
+        # The writer process may still be starting up
+        if time.monotonic() > deadline:
+          raise
+        time.sleep(0.05)
+
+  def _call(self, method, *arguments):
+    with self._lock:
+      connection = self._idle.pop() if self._idle else None
+    if connection is None:
+      connection = self._connect()
+
+    try:
+      connection.send(( method, arguments, ))
+      status, result = connection.recv()
+    except (EOFError, OSError):
+      # Dropped, later calls connect again if the writer was restarted
+      connection.close()
+      raise
+
+    with self._lock:
+      self._idle.append(connection)
+
+    if status == "error":
+      raise result
+    return result
+
+  def post_new_document_revision(self, title, timestamp, new_content):
+    return self._call("post_new_document_revision", title, timestamp, new_content)
+
+  def post_document_revisions(self, revisions, default_timestamp):
+    return self._call("post_document_revisions", revisions, default_timestamp)
+
+def run_worker(listening_socket, database_name, writer_address, authkey, snapshot_interval = None):
+  # Reads use this worker's own read-only connections and writes go to the writer
+  server.document_store_actions = DocumentStoreActions(
+    database_name,
+    read_only=True,
+    writer=WriterClient(writer_address, authkey),
+    detect_external_writes=True,
+    snapshot=snapshot_interval is not None,
+    snapshot_refresh_interval=snapshot_interval
+  )
+  # Each worker has its own index, built after the fork from its read connections
+  server.document_store_actions.title_index.load()
+
+  host, port = listening_socket.getsockname()[:2]
+  make_server(host, port, server.app, threaded=True, fd=listening_socket.fileno()).serve_forever()
+
+def fork(target, *arguments):
+  pid = os.fork()
+  if pid == 0:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+      target(*arguments)
+    finally:
+      os._exit(0)
+
+  return pid
+
+def launch(host = "127.0.0.1", port = 8080, workers = None, database_name = "wiki_documents_db.db", snapshot_interval = None):
+  '''
+  Pre-forks one writer process and `workers` HTTP worker processes
+  (one per core by default) that share a single listening socket. With
+  a snapshot_interval, every worker serves reads from its own in-memory
+  snapshot of the database, refreshed at most that many seconds after a
+  write.
+  '''
+  workers = workers or os.cpu_count() or 1
+  database_name = os.path.abspath(database_name)
+
+  if os.path.isfile(database_name):
+    SqliteDB(database_name).migrate()
+  else:
+    SqliteDB(database_name).database_setup()
+  # No connection may be inherited by the forked processes
+  get_connection_pool(database_name).close_all()
+
+  listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  listening_socket.bind(( host, port, ))
+  listening_socket.listen(1024)
+
+  runtime_directory = tempfile.mkdtemp(prefix="wiki-launcher-")
+  writer_address = os.path.join(runtime_directory, "writer.sock")
+  authkey = os.urandom(32)
+
+  writer_pid = fork(WriterServer(writer_address, authkey, database_name).serve_forever)
+  worker_pids = set(fork(run_worker, listening_socket, database_name, writer_address, authkey, snapshot_interval) for _ in range(workers))
+  print(f"Serving on http://{host}:{port} with {workers} workers")
+
+  def stop(signal_number, frame):
+    for pid in worker_pids | { writer_pid }:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except ProcessLookupError:
+        pass
+    raise SystemExit(0)
+
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+
+  # Replace any worker that dies
+  while True:
+    pid, _ = os.wait()
+    if pid in worker_pids:
+      worker_pids.remove(pid)
+      worker_pids.add(fork(run_worker, listening_socket, database_name, writer_address, authkey, snapshot_interval))
+    elif pid == writer_pid:
+      writer_pid = fork(WriterServer(writer_address, authkey, database_name).serve_forever)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run the document API with pre-forked worker processes")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8080)
+  parser.add_argument("--workers", type=int, help="defaults to the number of CPU cores")
+  parser.add_argument("--database", default="wiki_documents_db.db")
+  parser.add_argument("--snapshot-interval", type=float, help="serve reads from in-memory snapshots refreshed every this many seconds")
+  args = parser.parse_args()
+
+  launch(args.host, args.port, args.workers, args.database, args.snapshot_interval)
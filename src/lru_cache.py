@@ -0,0 +1,111 @@
+import sys
+import threading
+
+from collections import OrderedDict
+
+def estimate_size(value):
+  '''
+  Rough in-memory size of a cached value, counting the strings it holds.
+  '''
+  if isinstance(value, (list, tuple)):
+    return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+
+  return sys.getsizeof(value)
+
+class LRUCache:
+  '''
+  Thread safe least recently used cache bounded by a number of entries
+  and, optionally, by the estimated size in bytes of the cached values.
+
+  Values read from a database are cached with fill(), which only stores
+  them when nothing was set, deleted or cleared since generation() was
+  read before the database read, so a read that raced a write can't put
+  back what the write replaced.
+  '''
+  def __init__(self, max_entries = 1024, max_bytes = None):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.current_bytes = 0
+
+    # Bumped by every set, delete and clear
+    self._generation = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default = None):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return default
+
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[0]
+
+  def generation(self):
+    with self._lock:
+      return self._generation
+
+  def set(self, key, value):
+    size = estimate_size(value)
+
+    with self._lock:
+      self._generation += 1
+      self._store(key, value, size)
+
+  def fill(self, key, value, generation):
+    '''
+    Caches a value read from the database, unless the cache has been
+    written to since generation. Returns True when the value was cached.
+    '''
+    size = estimate_size(value)
+
+    with self._lock:
+      if self._generation != generation:
+        return False
+
+      self._store(key, value, size)
+      return True
+
+  def _store(self, key, value, size):
+    self._remove(key)
+    if self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+      return
+
+    self._entries[key] = ( value, size, )
+    self.current_bytes += size
+
+    while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.current_bytes > self.max_bytes):
+      self._remove(next(iter(self._entries)))
+      self.evictions += 1
+
+  def delete(self, key):
+    with self._lock:
+      self._generation += 1
+      self._remove(key)
+
+  def clear(self):
+    with self._lock:
+      self._generation += 1
+      self._entries.clear()
+      self.current_bytes = 0
+
+  def _remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self.current_bytes -= entry[1]
+
+  def stats(self):
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "entries": len(self._entries),
+        "bytes": self.current_bytes
+      }
@@ -0,0 +1,114 @@
+import threading
+
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+def _format_labels(label_names, label_values, extra = ()):
+  pairs = list(zip(label_names, label_values)) + list(extra)
+  if not pairs:
+    return ""
+
+  escaped = (
+    f'{name}="' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+    for name, value in pairs
+  )
+  return "{" + ",".join(escaped) + "}"
+
+def _format_number(value):
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+  '''
+  Thread safe Prometheus style histogram with one series per
+  combination of label values.
+  '''
+  def __init__(self, name, documentation, label_names = (), buckets = LATENCY_BUCKETS):
+    self.name = name
+    self.documentation = documentation
+    self.label_names = tuple(label_names)
+    self.buckets = tuple(buckets)
+
+    # label values -> [bucket counts..., sum, count]
+    self._series = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value, *label_values):
+    # Bucket i counts the observations <= buckets[i], made cumulative when rendered
+    bucket = bisect_left(self.buckets, value)
+
+    with self._lock:
+      series = self._series.get(label_values)
+      if series is None:
+        series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+      series[bucket] += 1
+      series[-2] += value
+      series[-1] += 1
+
+  def samples(self):
+    with self._lock:
+      return {label_values: list(series) for label_values, series in self._series.items()}
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+    for label_values, series in sorted(self.samples().items()):
+      cumulative_count = 0
+      for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+        cumulative_count += bucket_count
+        labels = _format_labels(self.label_names, label_values, [( "le", _format_number(upper_bound), )])
+        lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+
+      labels = _format_labels(self.label_names, label_values)
+      lines.append(f"{self.name}_sum{labels} {_format_number(series[-2])}")
+      lines.append(f"{self.name}_count{labels} {series[-1]}")
+
+    return "\n".join(lines)
+
+class MetricsRegistry:
+  def __init__(self):
+    self.metrics = []
+
+  def histogram(self, name, documentation, label_names = (), buckets = LATENCY_BUCKETS):
+    histogram = Histogram(name, documentation, label_names, buckets)
+    self.metrics.append(histogram)
+    return histogram
+
+  def render(self):
+    '''
+    Every metric in the Prometheus text exposition format.
+    '''
+    return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+  "wiki_http_request_duration_seconds",
+  "Time spent handling HTTP requests",
+  ( "method", "route", "status", )
+)
+sqlite_query_duration = registry.histogram(
+  "wiki_sqlite_query_duration_seconds",
+  "Time spent executing SQL statements and fetching their rows",
+  ( "statement", )
+)
+sqlite_query_rows = registry.histogram(
+  "wiki_sqlite_query_rows",
+  "Rows returned by SQL statements",
+  ( "statement", ),
+  ROW_BUCKETS
+)
+sqlite_connection_acquire_duration = registry.histogram(
+  "wiki_sqlite_connection_acquire_seconds",
+  "Time spent getting a connection from the pool",
+  ( "outcome", )
+)
+snapshot_refresh_duration = registry.histogram(
+  "wiki_snapshot_refresh_seconds",
+  "Time spent copying the database into a new in-memory snapshot",
+  buckets=( 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, )
+)
@@ -0,0 +1,306 @@
+import sys
+
+from src.change_log import rebuild_change_log
+from src.connection_pool import get_connection_pool
+from src.helper_functions import hash_content, to_epoch_microseconds
+from src.search_index import SearchIndex
+from src.storage_engines import load_document_content
+from src.title_heads import rebuild_title_heads
+
+def _convert_creation_timestamps_to_integers(cursor):
+  # SQLite can't change a column type in place, so the table is rebuilt
+  cursor.execute("""
+    CREATE TABLE documents_metadata_new (
+      document_id TEXT PRIMARY KEY NOT NULL,
+      creation_timestamp INTEGER NOT NULL,
+      title_id TEXT NOT NULL
+    )
+  """)
+
+  rows = cursor.connection.execute("SELECT document_id, creation_timestamp, title_id FROM documents_metadata")
+  cursor.executemany(
+    "INSERT INTO documents_metadata_new VALUES (?, ?, ?)",
+    (
+      ( document_id, to_epoch_microseconds(creation_timestamp), title_id, )
+      for document_id, creation_timestamp, title_id in rows
+    )
+  )
+
+  cursor.execute("DROP TABLE documents_metadata")
+  cursor.execute("ALTER TABLE documents_metadata_new RENAME TO documents_metadata")
+  cursor.execute("""
+    CREATE INDEX documents_metadata_title_id_creation_timestamp
+    ON documents_metadata (title_id, creation_timestamp, document_id)
+  """)
+
+def _iter_document_contents(cursor):
+  '''
+  Yields the ( document_id, content, ) of every revision, resolving the
+  revisions stored as deltas.
+  '''
+  rows = cursor.execute("""
+    SELECT document_id, title_id FROM documents_metadata
+    ORDER BY title_id, creation_timestamp
+  """).fetchall()
+
+  resolved_contents = {}
+  previous_title_id = None
+  for document_id, title_id in rows:
+    # Revisions are only stored as deltas of revisions of the same title
+    if title_id != previous_title_id:
+      resolved_contents = {}
+      previous_title_id = title_id
+
+    yield document_id, load_document_content(cursor, document_id, resolved_contents)[0]
+
+def _add_content_hashes(cursor):
+  cursor.execute("ALTER TABLE documents_metadata ADD COLUMN content_hash TEXT")
+
+  content_hashes = [
+    ( hash_content(document_content), document_id, )
+    for document_id, document_content in _iter_document_contents(cursor)
+  ]
+  cursor.executemany("UPDATE documents_metadata SET content_hash = ? WHERE document_id = ?", content_hashes)
+
+def _create_search_index(cursor):
+  SearchIndex().rebuild(cursor)
+
+def _use_integer_keys(cursor):
+  # Titles and revisions get INTEGER PRIMARY KEY ids in creation order,
+  # a revision's UUID is kept in document_uuid as its external id
+  cursor.execute("""
+    CREATE TABLE titles_new (
+      title_id INTEGER PRIMARY KEY,
+      title TEXT UNIQUE NOT NULL
+    )
+  """)
+  cursor.execute("INSERT INTO titles_new (title) SELECT title FROM titles ORDER BY rowid")
+  cursor.execute("""
+    CREATE TEMP TABLE title_id_map (
+      old_title_id TEXT PRIMARY KEY NOT NULL,
+      new_title_id INTEGER NOT NULL
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("""
+    INSERT INTO title_id_map
+    SELECT titles.title_id, titles_new.title_id FROM titles
+    INNER JOIN titles_new ON titles_new.title = titles.title
+  """)
+  # Revisions of titles that no longer exist keep a dangling title id of
+  # their own, negative so that no new title can ever take it
+  cursor.execute("""
+    INSERT INTO title_id_map
+    SELECT title_id, -ROW_NUMBER() OVER (ORDER BY title_id) FROM (
+      SELECT DISTINCT title_id FROM documents_metadata
+      WHERE title_id NOT IN ( SELECT old_title_id FROM title_id_map )
+    )
+  """)
+
+  cursor.execute("""
+    CREATE TABLE documents_metadata_new (
+      document_id INTEGER PRIMARY KEY,
+      document_uuid TEXT UNIQUE NOT NULL,
+      creation_timestamp INTEGER NOT NULL,
+      title_id INTEGER NOT NULL,
+      content_hash TEXT
+    )
+  """)
+  cursor.execute("""
+    INSERT INTO documents_metadata_new (document_uuid, creation_timestamp, title_id, content_hash)
+    SELECT document_id, creation_timestamp, new_title_id, content_hash FROM documents_metadata
+    INNER JOIN title_id_map ON title_id_map.old_title_id = documents_metadata.title_id
+    ORDER BY creation_timestamp
+  """)
+
+  cursor.execute("""
+    CREATE TABLE documents_data_new (
+      document_id INTEGER PRIMARY KEY,
+      document_content TEXT NOT NULL,
+      storage_format TEXT NOT NULL DEFAULT 'full',
+      base_document_id INTEGER
+    )
+  """)
+  cursor.execute("""
+    INSERT INTO documents_data_new (document_id, document_content, storage_format, base_document_id)
+    SELECT revisions.document_id, document_content, storage_format, base_revisions.document_id FROM documents_data
+    INNER JOIN documents_metadata_new AS revisions ON revisions.document_uuid = documents_data.document_id
+    LEFT JOIN documents_metadata_new AS base_revisions ON base_revisions.document_uuid = documents_data.base_document_id
+  """)
+
+  cursor.execute("""
+    CREATE TABLE precompressed_revisions_new (
+      document_id INTEGER NOT NULL,
+      content_encoding TEXT NOT NULL,
+      body BLOB NOT NULL,
+      PRIMARY KEY (document_id, content_encoding)
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("""
+    INSERT INTO precompressed_revisions_new
+    SELECT documents_metadata_new.document_id, content_encoding, body FROM precompressed_revisions
+    INNER JOIN documents_metadata_new ON documents_metadata_new.document_uuid = precompressed_revisions.document_id
+  """)
+
+  # The documents_fts rows keep their rowids, only their mapping changes
+  cursor.execute("""
+    CREATE TABLE search_documents_new (
+      search_rowid INTEGER PRIMARY KEY,
+      document_id INTEGER UNIQUE NOT NULL,
+      title_id INTEGER NOT NULL
+    )
+  """)
+  cursor.execute("""
+    INSERT INTO search_documents_new
+    SELECT search_rowid, documents_metadata_new.document_id, documents_metadata_new.title_id FROM search_documents
+    INNER JOIN documents_metadata_new ON documents_metadata_new.document_uuid = search_documents.document_id
+  """)
+
+  for table in [ "titles", "documents_metadata", "documents_data", "precompressed_revisions", "search_documents" ]:
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+  cursor.execute("DROP TABLE title_id_map")
+
+  cursor.execute("""
+    CREATE INDEX documents_metadata_title_id_creation_timestamp
+    ON documents_metadata (title_id, creation_timestamp, document_id)
+  """)
+  cursor.execute("CREATE INDEX search_documents_title_id ON search_documents (title_id)")
+  cursor.execute("DELETE FROM documents_fts WHERE rowid NOT IN ( SELECT search_rowid FROM search_documents )")
+
+  cursor.execute("DROP TABLE title_heads")
+  rebuild_title_heads(cursor)
+
+def _add_content_lengths(cursor):
+  cursor.execute("ALTER TABLE documents_metadata ADD COLUMN content_length INTEGER")
+
+  content_lengths = [
+    ( len(document_content), document_id, )
+    for document_id, document_content in _iter_document_contents(cursor)
+  ]
+  cursor.executemany("UPDATE documents_metadata SET content_length = ? WHERE document_id = ?", content_lengths)
+
+# Every migration is a (version, description, statements) tuple. Versions are
+# applied in order and the last applied version is kept in PRAGMA user_version,
+# so an existing database file can be upgraded in place.
+MIGRATIONS = [
+  (
+    1,
+    "Add a covering (title_id, creation_timestamp) index for revision lookups",
+    [
+      """
+      CREATE INDEX IF NOT EXISTS documents_metadata_title_id_creation_timestamp
+      ON documents_metadata (title_id, creation_timestamp, document_id)
+      """
+    ]
+  ),
+  (
+    2,
+    "Store creation_timestamp as integer microseconds since the epoch",
+    [
+      _convert_creation_timestamps_to_integers
+    ]
+  ),
+  (
+    3,
+    "Record how each revision's content is stored for pluggable storage engines",
+    [
+      "ALTER TABLE documents_data ADD COLUMN storage_format TEXT NOT NULL DEFAULT 'full'",
+      "ALTER TABLE documents_data ADD COLUMN base_document_id TEXT"
+    ]
+  ),
+  (
+    4,
+    "Store a content hash with every revision so writes can detect unchanged content",
+    [
+      _add_content_hashes
+    ]
+  ),
+  (
+    5,
+    "Add an FTS5 full-text index over the latest revision of each title",
+    [
+      _create_search_index
+    ]
+  ),
+  (
+    6,
+    "Keep pre-compressed response bodies of historical revisions",
+    [
+      """
+      CREATE TABLE IF NOT EXISTS precompressed_revisions (
+        document_id TEXT NOT NULL,
+        content_encoding TEXT NOT NULL,
+        body BLOB NOT NULL,
+        PRIMARY KEY (document_id, content_encoding)
+      ) WITHOUT ROWID
+      """
+    ]
+  ),
+  (
+    7,
+    "Keep the latest revision and revision count of each title in title_heads",
+    [
+      rebuild_title_heads
+    ]
+  ),
+  (
+    8,
+    "Key titles and revisions with integer ids, keeping revision UUIDs as external ids",
+    [
+      _use_integer_keys
+    ]
+  ),
+  (
+    9,
+    "Store every revision's content length and index revisions by creation time for time range queries",
+    [
+      _add_content_lengths,
+      "CREATE INDEX IF NOT EXISTS documents_metadata_creation_timestamp ON documents_metadata (creation_timestamp)"
+    ]
+  ),
+  (
+    10,
+    "Log every new revision under a sequence number in the append-only change_log",
+    [
+      rebuild_change_log
+    ]
+  )
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cursor):
+  return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(connection_pool):
+  '''
+  Applies every migration newer than the database's schema version,
+  each one in its own transaction. Returns the list of applied versions.
+  '''
+  applied_versions = []
+
+  for version, description, statements in MIGRATIONS:
+    with connection_pool.cursor() as cursor:
+      if version <= get_schema_version(cursor):
+        continue
+
+      cursor.execute("BEGIN")
+      for statement in statements:
+        if callable(statement):
+          statement(cursor)
+        else:
+          cursor.execute(statement)
+      cursor.execute(f"PRAGMA user_version = {version}")
+
+    applied_versions.append(version)
+
+  return applied_versions
+
+if __name__ == "__main__":
+  database_name = sys.argv[1] if len(sys.argv) > 1 else "wiki_documents_db.db"
+  applied_versions = run_migrations(get_connection_pool(database_name))
+
+  if applied_versions:
+    print(f"Applied migrations {applied_versions} to {database_name}")
+  else:
+    print(f"{database_name} is already at schema version {LATEST_SCHEMA_VERSION}")
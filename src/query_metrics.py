@@ -0,0 +1,154 @@
+import logging
+import os
+import re
+import sqlite3
+
+from time import perf_counter
+
+from src.metrics import sqlite_query_duration, sqlite_query_rows
+
+slow_query_logger = logging.getLogger("wiki.slow_queries")
+
+# Seconds, statements taking longer are logged with their SQL
+slow_query_threshold = float(os.environ.get("WIKI_SLOW_QUERY_SECONDS", "0.1"))
+# Also time rows read by iterating a cursor, at a cost on every row
+row_timing = os.environ.get("WIKI_QUERY_ROW_TIMING") == "1"
+
+STATEMENT_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|INDEX|ON)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+MAX_STATEMENT_LABELS = 1024
+_statement_labels = {}
+
+def set_slow_query_threshold(seconds):
+  global slow_query_threshold
+  slow_query_threshold = seconds
+
+def set_row_timing(enabled):
+  '''
+  Whether cursors created from now on time and count the rows read by
+  iterating them, see RowTimedCursor.
+  '''
+  global row_timing
+  row_timing = enabled
+
+def statement_label(sql):
+  '''
+  Short metric label for a SQL statement: its verb and the first table
+  it names, e.g. "SELECT documents_metadata". Keeps the number of
+  series small however many different statements touch a table.
+  '''
+  label = _statement_labels.get(sql)
+  if label is None:
+    words = sql.split(None, 1)
+    verb = words[0].upper() if words else ""
+    if verb == "PRAGMA" and len(words) > 1:
+      label = "PRAGMA " + re.split(r"[\s=(]", words[1], 1)[0]
+    else:
+      table = STATEMENT_TABLE_PATTERN.search(sql)
+      label = f"{verb} {table.group(1)}" if table else verb
+
+    if len(_statement_labels) < MAX_STATEMENT_LABELS:
+      _statement_labels[sql] = label
+
+  return label
+
+class InstrumentedCursor(sqlite3.Cursor):
+  '''
+  Cursor timing every statement it runs, from execute() until the next
+  statement or close(): the execute() call and the fetchone(),
+  fetchmany() and fetchall() calls, and counting the rows they fetch.
+  Rows read by iterating the cursor are neither timed nor counted, as
+  wrapping every row in Python would cost more than the rows themselves.
+  Statements slower than the threshold are written to the slow query
+  log.
+  '''
+  _sql = None
+  _elapsed = 0.0
+  _rows = 0
+
+  def _start(self, sql):
+    self._finish()
+    self._sql = sql
+    self._elapsed = 0.0
+    self._rows = 0
+
+  def _finish(self):
+    sql = self._sql
+    if sql is None:
+      return
+    self._sql = None
+
+    label = statement_label(sql)
+    sqlite_query_duration.observe(self._elapsed, label)
+    sqlite_query_rows.observe(self._rows, label)
+    if self._elapsed >= slow_query_threshold:
+      slow_query_logger.warning("Slow query took %.1f ms and returned %d rows: %s", self._elapsed * 1000, self._rows, " ".join(sql.split()))
+
+  def execute(self, sql, parameters = ()):
+    self._start(sql)
+    start = perf_counter()
+    try:
+      return super().execute(sql, parameters)
+    finally:
+      self._elapsed += perf_counter() - start
+
+  def executemany(self, sql, seq_of_parameters):
+    self._start(sql)
+    start = perf_counter()
+    try:
+      return super().executemany(sql, seq_of_parameters)
+    finally:
+      self._elapsed += perf_counter() - start
+
+  def fetchone(self):
+    start = perf_counter()
+    row = super().fetchone()
+    self._elapsed += perf_counter() - start
+    if row is not None:
+      self._rows += 1
+    return row
+
+  def fetchmany(self, size = None):
+    start = perf_counter()
+    rows = super().fetchmany(self.arraysize if size is None else size)
+    self._elapsed += perf_counter() - start
+    self._rows += len(rows)
+    return rows
+
+  def fetchall(self):
+    start = perf_counter()
+    rows = super().fetchall()
+    self._elapsed += perf_counter() - start
+    self._rows += len(rows)
+    return rows
+
+  def close(self):
+    self._finish()
+    super().close()
+
+  def __del__(self):
+    # Cursors made by Connection.execute are rarely closed explicitly
+    self._finish()
+
+class RowTimedCursor(InstrumentedCursor):
+  '''
+  InstrumentedCursor that also times and counts the rows read by
+  iterating it, used while row timing is enabled.
+  '''
+  def __next__(self):
+    start = perf_counter()
+    try:
+      row = super().__next__()
+    finally:
+      self._elapsed += perf_counter() - start
+    self._rows += 1
+    return row
+
+class InstrumentedConnection(sqlite3.Connection):
+  '''
+  Connection whose cursors, including the ones made by execute(), are
+  InstrumentedCursors, or RowTimedCursors while row timing is enabled.
+  '''
+  def cursor(self, factory = None):
+    if factory is None:
+      factory = RowTimedCursor if row_timing else InstrumentedCursor
+    return super().cursor(factory)
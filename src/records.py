@@ -0,0 +1,92 @@
+from typing import NamedTuple
+
+class Revision(NamedTuple):
+  '''
+  One revision of a document. Serializes to JSON as
+  [title, creation_timestamp, content].
+  '''
+  title: str
+  creation_timestamp: str
+  content: str
+
+class RevisionMetadata(NamedTuple):
+  '''
+  A revision without its content. Serializes to JSON as
+  [title, creation_timestamp, document_id].
+  '''
+  title: str
+  creation_timestamp: str
+  document_id: str
+
+class SearchResult(NamedTuple):
+  '''
+  A revision matching a search query. Serializes to JSON as
+  [title, creation_timestamp, snippet].
+  '''
+  title: str
+  creation_timestamp: str
+  snippet: str
+
+class DiffHunk(NamedTuple):
+  '''
+  One hunk of a unified diff. Serializes to JSON as
+  [from_start, from_lines, to_start, to_lines, lines].
+  '''
+  from_start: int
+  from_lines: int
+  to_start: int
+  to_lines: int
+  lines: list
+
+class RevisionDiff(NamedTuple):
+  '''
+  The changes between two revisions of a document. Serializes to JSON as
+  [title, from_timestamp, to_timestamp, hunks].
+  '''
+  title: str
+  from_timestamp: str
+  to_timestamp: str
+  hunks: list
+
+class TitleSummary(NamedTuple):
+  '''
+  A title with the timestamp of its latest revision and its number of
+  revisions. Serializes to JSON as [title, last_modified, revision_count].
+  '''
+  title: str
+  last_modified: str
+  revision_count: int
+
+class HistoryBucket(NamedTuple):
+  '''
+  The revisions of a title created within one bucket of time, with the
+  length of their content in characters. Serializes to JSON as
+  [bucket_start, revision_count, min_length, average_length, max_length].
+  '''
+  bucket_start: str
+  revision_count: int
+  min_length: int
+  average_length: int
+  max_length: int
+
+class Change(NamedTuple):
+  '''
+  A revision in the feed of changes across all titles. Serializes to JSON
+  as [title, creation_timestamp, document_id, content_length].
+  '''
+  title: str
+  creation_timestamp: str
+  document_id: str
+  content_length: int
+
+class ChangeLogEntry(NamedTuple):
+  '''
+  A revision as logged in the change log, under its sequence number.
+  Serializes to JSON as
+  [sequence, title, creation_timestamp, document_id, content_length].
+  '''
+  sequence: int
+  title: str
+  creation_timestamp: str
+  document_id: str
+  content_length: int
@@ -0,0 +1,140 @@
+import argparse
+
+from src.connection_pool import get_connection_pool
+from src.helper_functions import format_timestamp
+from src.records import SearchResult
+from src.storage_engines import load_document_content
+
+LATEST_MODE = "latest"
+ALL_MODE = "all"
+
+def create_search_tables(cursor):
+  # documents_fts rows are keyed by search_documents.search_rowid
+  cursor.execute("""
+    CREATE TABLE IF NOT EXISTS search_documents (
+      search_rowid INTEGER PRIMARY KEY,
+      document_id INTEGER UNIQUE NOT NULL,
+      title_id INTEGER NOT NULL
+    )
+  """)
+  cursor.execute("CREATE INDEX IF NOT EXISTS search_documents_title_id ON search_documents (title_id)")
+  cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+      title, content, tokenize = 'unicode61 remove_diacritics 2'
+    )
+  """)
+  cursor.execute("""
+    CREATE TABLE IF NOT EXISTS search_index_settings (
+      key TEXT PRIMARY KEY NOT NULL,
+      value TEXT NOT NULL
+    )
+  """)
+
+def to_match_expression(query):
+  '''
+  Turns free text into an FTS5 query that matches documents containing
+  every word. A trailing * keeps its meaning as a prefix search.
+  '''
+  terms = []
+  for word in query.split():
+    is_prefix = word.endswith("*")
+    word = word.rstrip("*").replace('"', '""')
+    if word:
+      terms.append(f'"{word}"*' if is_prefix else f'"{word}"')
+
+  return " ".join(terms)
+
+class SearchIndex:
+  '''
+  Full-text index over document revisions backed by an FTS5 table. In
+  "latest" mode only the latest revision of each title is indexed, in
+  "all" mode every revision is. The mode is stored in the database.
+  '''
+  def get_mode(self, cursor):
+    row = cursor.execute("SELECT value FROM search_index_settings WHERE key = 'mode'").fetchone()
+    return LATEST_MODE if row is None else row[0]
+
+  def index_revision(self, cursor, title_id, title, document_id, content, is_latest):
+    if self.get_mode(cursor) == LATEST_MODE:
+      if not is_latest:
+        return
+      # Replace the title's previously indexed revision
+      for search_rowid, in cursor.execute("SELECT search_rowid FROM search_documents WHERE title_id = ?", ( title_id, )).fetchall():
+        cursor.execute("DELETE FROM documents_fts WHERE rowid = ?", ( search_rowid, ))
+      cursor.execute("DELETE FROM search_documents WHERE title_id = ?", ( title_id, ))
+
+    cursor.execute("INSERT INTO search_documents (document_id, title_id) VALUES (?, ?)", ( document_id, title_id, ))
+    cursor.execute("INSERT INTO documents_fts (rowid, title, content) VALUES (?, ?, ?)", ( cursor.lastrowid, title, content, ))
+
+  def rebuild(self, cursor, mode = None):
+    '''
+    Re-indexes every title (latest mode) or every revision (all mode),
+    optionally switching the index to another mode first.
+    '''
+    create_search_tables(cursor)
+    if mode is not None:
+      cursor.execute("INSERT OR REPLACE INTO search_index_settings VALUES ('mode', ?)", ( mode, ))
+    mode = self.get_mode(cursor)
+
+    cursor.execute("DELETE FROM documents_fts")
+    cursor.execute("DELETE FROM search_documents")
+
+    if mode == LATEST_MODE:
+      revisions = cursor.execute("""
+        SELECT titles.title_id, title, document_id FROM titles
+        INNER JOIN documents_metadata ON documents_metadata.document_id = (
+          SELECT document_id FROM documents_metadata
+          WHERE documents_metadata.title_id = titles.title_id
+          ORDER BY creation_timestamp DESC LIMIT 1
+        )
+      """).fetchall()
+    else:
+      revisions = cursor.execute("""
+        SELECT titles.title_id, title, document_id FROM documents_metadata
+        INNER JOIN titles ON documents_metadata.title_id = titles.title_id
+        ORDER BY documents_metadata.title_id, creation_timestamp
+      """).fetchall()
+
+    resolved_contents = {}
+    for title_id, title, document_id in revisions:
+      if len(resolved_contents) > 1024:
+        resolved_contents = {}
+      content = load_document_content(cursor, document_id, resolved_contents)[0]
+      self.index_revision(cursor, title_id, title, document_id, content, True)
+
+    # Merge the index b-trees now rather than during the first searches
+    cursor.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+
+  def search(self, cursor, query, limit = 20, offset = 0):
+    match_expression = to_match_expression(query)
+    if not match_expression:
+      return []
+
+    # Matches in the title count ten times more than matches in the content
+    rows = cursor.execute("""
+      SELECT titles.title, documents_metadata.creation_timestamp,
+        snippet(documents_fts, 1, '[', ']', '...', 16)
+      FROM documents_fts
+      INNER JOIN search_documents ON search_documents.search_rowid = documents_fts.rowid
+      INNER JOIN documents_metadata ON documents_metadata.document_id = search_documents.document_id
+      INNER JOIN titles ON titles.title_id = search_documents.title_id
+      WHERE documents_fts MATCH ?
+      ORDER BY bm25(documents_fts, 10.0, 1.0)
+      LIMIT ? OFFSET ?
+      """, ( match_expression, limit, offset, )
+    ).fetchall()
+
+    return [
+      SearchResult(title, format_timestamp(creation_timestamp), snippet)
+      for title, creation_timestamp, snippet in rows
+    ]
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Rebuild the full-text search index")
+  parser.add_argument("--database", default="wiki_documents_db.db")
+  parser.add_argument("--mode", choices=[LATEST_MODE, ALL_MODE], help="index only the latest revision of each title or every revision")
+  args = parser.parse_args()
+
+  with get_connection_pool(args.database).transaction() as cursor:
+    SearchIndex().rebuild(cursor, args.mode)
+  print(f"Rebuilt the search index of {args.database}")
@@ -0,0 +1,272 @@
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+from time import monotonic, perf_counter
+from urllib.parse import quote
+
+from src.exceptions import ConnectionPoolExhausted
+from src.metrics import snapshot_refresh_duration, sqlite_connection_acquire_duration
+from src.query_metrics import InstrumentedConnection
+
+logger = logging.getLogger(__name__)
+
+_snapshot_numbers = itertools.count(1)
+
+class SnapshotConnectionPool:
+  '''
+  Read only stand-in for ConnectionPool that serves reads from a
+  consistent in-memory copy of a database file, written by VACUUM INTO.
+  Reads never touch the disk and never wait for a writer.
+
+  The copy is refreshed whenever notify_write() is called and every
+  refresh_interval seconds, on a background thread and only when the
+  file has changed since the last copy. Every refresh makes a new copy,
+  so refreshes asked for by notify_write() are at least
+  min_refresh_interval seconds apart and writes made in between share
+  the next one.
+  Like ConnectionPool, threads check a connection out for their outermost
+  connection() block, waiting at most acquire_timeout seconds for one, and
+  blocks started after a refresh read the new copy. Connections to older
+  copies are closed as soon as they are returned, which frees those
+  copies.
+  '''
+  read_only = True
+
+  def __init__(self, database_name = "wiki_documents_db.db", refresh_interval = None, max_connections = 32, min_refresh_interval = 1, acquire_timeout = 10):
+    self.database_name = database_name
+    self.refresh_interval = refresh_interval
+    self.min_refresh_interval = min_refresh_interval
+    self.max_connections = max_connections
+    self.acquire_timeout = acquire_timeout
+
+    self.hits = 0
+    self.misses = 0
+    self.refreshes = 0
+
+    self._lock = threading.Lock()
+    self._returned = threading.Condition(self._lock)
+    self._refresh_lock = threading.Lock()
+    self._local = threading.local()
+    # Every open connection, mapped to the generation of the copy it reads
+    self._connections = {}
+    # Connections to the current copy not checked out by any thread
+    self._idle = []
+    self._opening = 0
+    self._seen_generation = None
+    # ( generation, uri, keeper connection, ), the keeper holds the copy in memory
+    self._snapshot = None
+    self._source = None
+    self._source_data_version = None
+    self._refresh_requested = threading.Event()
+    self._last_refresh = monotonic()
+    self._closed = threading.Event()
+
+    self.refresh()
+    self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+    self._thread.start()
+
+  def _source_connection(self):
+    if self._source is None:
+      uri = f"file:{quote(os.path.abspath(self.database_name))}?mode=ro"
+      self._source = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    return self._source
+
+  def refresh(self, force = False):
+    '''
+    Copies the database file into a new in-memory snapshot, unless it
+    has not changed since the last copy and force is False. Returns
+    True when a new snapshot was made.
+    '''
+    with self._refresh_lock:
+      source = self._source_connection()
+      # Changes whenever another connection commits to the file
+      data_version = source.execute("PRAGMA data_version").fetchone()[0]
+      if not force and self._snapshot is not None and data_version == self._source_data_version:
+        return False
+
+      start = perf_counter()
+      generation = next(_snapshot_numbers)
+      # The memdb VFS lets every connection opening this name share the copy
+      uri = f"file:/wiki-snapshot-{os.getpid()}-{generation}?vfs=memdb"
+      # The keeper holds the copy in memory once it is written
+      keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+      try:
+        # Writes the copy straight into the shared in-memory database in
+        # one read transaction, with a rollback journal header: the file's
+        # says WAL, which in-memory databases other connections share
+        # can't open
+        source.execute("VACUUM INTO ?", ( uri, ))
+      except BaseException:
+        keeper.close()
+        raise
+
+      with self._lock:
+        previous_snapshot = self._snapshot
+        self._snapshot = ( generation, uri, keeper, )
+        self._source_data_version = data_version
+        self.refreshes += 1
+        stale_connections = self._idle
+        self._idle = []
+        for conn in stale_connections:
+          del self._connections[conn]
+        self._returned.notify_all()
+      snapshot_refresh_duration.observe(perf_counter() - start)
+      self._last_refresh = monotonic()
+
+    # The previous copy is freed once the connections still reading it are returned
+    for conn in stale_connections:
+      conn.close()
+    if previous_snapshot is not None:
+      previous_snapshot[2].close()
+    return True
+
+  def notify_write(self):
+    '''
+    Asks the background thread to refresh the snapshot soon.
+    '''
+    self._refresh_requested.set()
+
+  def _run(self):
+    while True:
+      self._refresh_requested.wait(self.refresh_interval)
+      # Writes notified while waiting share the refresh
+      delay = self._last_refresh + self.min_refresh_interval - monotonic()
+      if delay > 0:
+        self._closed.wait(delay)
+      self._refresh_requested.clear()
+      if self._closed.is_set():
+        return
+
+      try:
+        self.refresh()
+      except sqlite3.Error as error:
+        # Reads carry on from the previous snapshot
+        logger.warning("Could not refresh the snapshot of %s: %s", self.database_name, error)
+
+  def _create_connection(self, uri):
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=InstrumentedConnection)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+  def _acquire(self):
+    state = self._local
+    if getattr(state, "depth", 0) > 0:
+      return state.conn
+
+    start = perf_counter()
+    with self._lock:
+      if not self._returned.wait_for(self._can_check_out, self.acquire_timeout):
+        raise ConnectionPoolExhausted(f"No connection to the snapshot of {self.database_name} was returned within {self.acquire_timeout} seconds")
+
+      generation, uri, _ = self._snapshot
+      if self._idle:
+        conn = self._idle.pop()
+        self.hits += 1
+      else:
+        conn = None
+        self.misses += 1
+        self._opening += 1
+
+    if conn is None:
+      try:
+        conn = self._create_connection(uri)
+      finally:
+        with self._lock:
+          self._opening -= 1
+          if conn is not None:
+            self._connections[conn] = generation
+          else:
+            self._returned.notify()
+      sqlite_connection_acquire_duration.observe(perf_counter() - start, "created")
+    else:
+      sqlite_connection_acquire_duration.observe(perf_counter() - start, "reused")
+
+    state.conn = conn
+    state.depth = 0
+    return conn
+
+  def _can_check_out(self):
+    return self._idle or len(self._connections) + self._opening < self.max_connections
+
+  def _release(self, state):
+    conn = state.conn
+    state.conn = None
+
+    with self._lock:
+      generation = self._connections.get(conn)
+      is_current = generation is not None and generation == self._snapshot[0]
+      if is_current:
+        self._idle.append(conn)
+      elif generation is not None:
+        del self._connections[conn]
+      self._returned.notify()
+
+    # A connection to an older copy keeps that copy in memory
+    if not is_current:
+      conn.close()
+
+  @contextmanager
+  def connection(self):
+    conn = self._acquire()
+    state = self._local
+    state.depth += 1
+    try:
+      yield conn
+    finally:
+      state.depth -= 1
+      if state.depth == 0:
+        self._release(state)
+
+  @contextmanager
+  def cursor(self):
+    with self.connection() as conn:
+      cursor = conn.cursor()
+      try:
+        yield cursor
+      finally:
+        cursor.close()
+
+  def has_external_changes(self):
+    '''
+    Returns True when the snapshot has been refreshed since this pool
+    last asked, from any thread. The first call always returns True.
+    '''
+    with self._lock:
+      generation = self._snapshot[0]
+      last_generation = self._seen_generation
+      self._seen_generation = generation
+
+    return generation != last_generation
+
+  def stats(self):
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "open_connections": len(self._connections),
+        "idle_connections": len(self._idle),
+        "refreshes": self.refreshes
+      }
+
+  def close_all(self):
+    self._closed.set()
+    self._refresh_requested.set()
+
+    with self._refresh_lock, self._lock:
+      connections = list(self._connections)
+      self._connections = {}
+      self._idle = []
+      self._local = threading.local()
+      if self._snapshot is not None:
+        connections.append(self._snapshot[2])
+      if self._source is not None:
+        connections.append(self._source)
+        self._source = None
+
+    for conn in connections:
+      conn.close()
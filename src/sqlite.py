@@ -1,17 +1,15 @@
+import logging
 import sqlite3
 
+from src.connection_pool import get_connection_pool
+from src.migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
 class SqliteDB:
   def __init__(self, database_name = "wiki_documents_db.db"):
     self.database_name = database_name
-
-  def db_connection(self):
-    try:
-      conn = sqlite3.connect(self.database_name)
-      cursor = conn.cursor()
-    except sqlite3.Error as error:
-      print(error)
-
-    return conn, cursor
+    self.connection_pool = get_connection_pool(database_name)
   
   def database_setup(self):
 
@@ -37,16 +35,17 @@ class SqliteDB:
       )
     """
 
-    [conn, cursor] = self.db_connection()
-
     try:
-      cursor.execute(sqlite_create_titles_table)
-      cursor.execute(sqlite_create_documents_metadata_table)
-      cursor.execute(sqlite_create_documents_data_table)
-      conn.commit()
+      with self.connection_pool.cursor() as cursor:
+        cursor.execute(sqlite_create_titles_table)
+        cursor.execute(sqlite_create_documents_metadata_table)
+        cursor.execute(sqlite_create_documents_data_table)
+        # Freshly created tables start from the base schema
+        cursor.execute("PRAGMA user_version = 0")
     except sqlite3.Error as error:
-      print(error)
-      conn.rollback()
-    
-    conn.close()
-  
\ No newline at end of file
+      logger.info("Skipped creating the base tables: %s", error)
+
+    self.migrate()
+
+  def migrate(self):
+    return run_migrations(self.connection_pool)
@@ -0,0 +1,146 @@
+import json
+import zlib
+
+from difflib import SequenceMatcher
+
+FULL_FORMAT = "full"
+DELTA_FORMAT = "delta"
+# Full content, compressed with zlib and stored as a BLOB
+COMPRESSED_FORMAT = "zlib"
+
+def create_delta(base_content, new_content):
+  '''
+  Returns a line based delta that rebuilds new_content from base_content.
+  The delta is a JSON list where [start, end] copies lines from the base
+  and a string inserts new text.
+  '''
+  base_lines = base_content.splitlines(keepends=True)
+  new_lines = new_content.splitlines(keepends=True)
+
+  operations = []
+  matcher = SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+  for tag, base_start, base_end, new_start, new_end in matcher.get_opcodes():
+    if tag == "equal":
+      operations.append([base_start, base_end])
+    elif tag != "delete":
+      operations.append("".join(new_lines[new_start:new_end]))
+
+  return json.dumps(operations, separators=(",", ":"))
+
+def apply_delta(base_content, delta):
+  base_lines = base_content.splitlines(keepends=True)
+  content_parts = []
+
+  for operation in json.loads(delta):
+    if isinstance(operation, str):
+      content_parts.append(operation)
+    else:
+      content_parts.extend(base_lines[operation[0]:operation[1]])
+
+  return "".join(content_parts)
+
+def decode_full_content(document_content, storage_format):
+  if storage_format == COMPRESSED_FORMAT:
+    return zlib.decompress(document_content).decode("utf-8")
+  return document_content
+
+def load_document_content(cursor, document_id, resolved_contents = None):
+  '''
+  Returns the full content of a revision and the number of deltas that
+  had to be applied to rebuild it. resolved_contents is an optional dict of
+  already rebuilt revisions, it is filled in as revisions are rebuilt.
+  '''
+  if resolved_contents is None:
+    resolved_contents = {}
+
+  deltas = []
+
+  while document_id not in resolved_contents:
+    document_content, storage_format, base_document_id = cursor.execute("""
+      SELECT document_content, storage_format, base_document_id FROM documents_data
+      WHERE document_id = ?
+      """, ( document_id, )
+    ).fetchone()
+
+    if storage_format != DELTA_FORMAT:
+      resolved_contents[document_id] = decode_full_content(document_content, storage_format)
+      break
+    deltas.append(( document_id, document_content, ))
+    document_id = base_document_id
+
+  document_content = resolved_contents[document_id]
+  for delta_document_id, delta in reversed(deltas):
+    document_content = apply_delta(document_content, delta)
+    resolved_contents[delta_document_id] = document_content
+
+  return document_content, len(deltas)
+
+def resolve_content(cursor, document_content, storage_format, base_document_id, resolved_contents = None):
+  '''
+  Turns a stored documents_data row into the revision's full content.
+  '''
+  if storage_format != DELTA_FORMAT:
+    return decode_full_content(document_content, storage_format)
+
+  base_content = load_document_content(cursor, base_document_id, resolved_contents)[0]
+  return apply_delta(base_content, document_content)
+
+class FullCopyStorageEngine:
+  '''
+  Stores the whole content of every revision.
+  '''
+  def encode(self, cursor, title_id, document_content):
+    return document_content, FULL_FORMAT, None
+
+class CompressedStorageEngine:
+  '''
+  Stores the whole content of every revision compressed with zlib.
+  Content shorter than min_size, or that does not shrink, is stored as
+  it is.
+  '''
+  def __init__(self, level = 6, min_size = 256):
+    self.level = level
+    self.min_size = min_size
+
+  def encode(self, cursor, title_id, document_content):
+    if len(document_content) >= self.min_size:
+      compressed_content = zlib.compress(document_content.encode("utf-8"), self.level)
+      if len(compressed_content) < len(document_content):
+        return compressed_content, COMPRESSED_FORMAT, None
+
+    return document_content, FULL_FORMAT, None
+
+class DeltaStorageEngine:
+  '''
+  Stores a full snapshot (keyframe) every keyframe_interval revisions of a
+  title and a delta against the previous revision in between, so any
+  revision is rebuilt with at most keyframe_interval - 1 delta applications.
+  '''
+  def __init__(self, keyframe_interval = 16):
+    if keyframe_interval < 1:
+      raise ValueError("keyframe_interval must be at least 1")
+    self.keyframe_interval = keyframe_interval
+
+  def encode(self, cursor, title_id, document_content):
+    previous_revision = cursor.execute("""
+      SELECT document_id FROM documents_metadata
+      WHERE title_id = ?
+      ORDER BY creation_timestamp DESC LIMIT 1
+      """, ( title_id, )
+    ).fetchone()
+
+    if previous_revision is None:
+      return document_content, FULL_FORMAT, None
+
+    previous_document_id = previous_revision[0]
+    previous_content, previous_depth = load_document_content(cursor, previous_document_id)
+
+    if previous_depth + 1 >= self.keyframe_interval:
+      return document_content, FULL_FORMAT, None
+
+    delta = create_delta(previous_content, document_content)
+    # A delta that is not smaller than the content is not worth storing
+    if len(delta) >= len(document_content):
+      return document_content, FULL_FORMAT, None
+
+    return delta, DELTA_FORMAT, previous_document_id
@@ -0,0 +1,64 @@
+def create_title_heads_table(cursor):
+  # One row per title with at least one revision
+  cursor.execute("""
+    CREATE TABLE IF NOT EXISTS title_heads (
+      title_id INTEGER PRIMARY KEY NOT NULL,
+      document_id INTEGER NOT NULL,
+      creation_timestamp INTEGER NOT NULL,
+      content_hash TEXT,
+      revision_count INTEGER NOT NULL
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("CREATE INDEX IF NOT EXISTS title_heads_creation_timestamp ON title_heads (creation_timestamp)")
+
+def rebuild_title_heads(cursor):
+  '''
+  Recomputes the head of every title from documents_metadata, for
+  writes that bypass update_title_head such as the bulk importer.
+  '''
+  create_title_heads_table(cursor)
+  cursor.execute("DELETE FROM title_heads")
+  cursor.execute("""
+    INSERT INTO title_heads (title_id, document_id, creation_timestamp, content_hash, revision_count)
+    SELECT title_id, document_id, creation_timestamp, content_hash, revision_count FROM (
+      SELECT
+        title_id,
+        document_id,
+        creation_timestamp,
+        content_hash,
+        ROW_NUMBER() OVER (PARTITION BY title_id ORDER BY creation_timestamp DESC) AS recency,
+        COUNT(*) OVER (PARTITION BY title_id) AS revision_count
+      FROM documents_metadata
+    )
+    WHERE recency = 1
+  """)
+
+def get_title_head(cursor, title_id):
+  '''
+  Returns the ( document_id, creation_timestamp, content_hash, ) of the
+  title's latest revision, or None when it has no revisions.
+  '''
+  return cursor.execute("""
+    SELECT document_id, creation_timestamp, content_hash FROM title_heads
+    WHERE title_id = ?
+    """, ( title_id, )
+  ).fetchone()
+
+def update_title_head(cursor, title_id, document_id, creation_timestamp, content_hash, is_latest):
+  '''
+  Counts a newly written revision of the title and makes it the title's
+  head when it is its latest revision. Runs in the caller's transaction.
+  '''
+  if is_latest:
+    cursor.execute("""
+      INSERT INTO title_heads (title_id, document_id, creation_timestamp, content_hash, revision_count)
+      VALUES (?, ?, ?, ?, 1)
+      ON CONFLICT (title_id) DO UPDATE SET
+        document_id = excluded.document_id,
+        creation_timestamp = excluded.creation_timestamp,
+        content_hash = excluded.content_hash,
+        revision_count = revision_count + 1
+      """, ( title_id, document_id, creation_timestamp, content_hash, )
+    )
+  else:
+    cursor.execute("UPDATE title_heads SET revision_count = revision_count + 1 WHERE title_id = ?", ( title_id, ))
@@ -0,0 +1,250 @@
+import threading
+
+from bisect import bisect_left
+from collections import Counter
+
+# Most edits the close title lookup is indexed for
+MAX_FUZZY_DISTANCE = 2
+# Titles are split into this many segments, a title within
+# MAX_FUZZY_DISTANCE edits of another keeps all but that many of them
+FUZZY_SEGMENTS = 2 * MAX_FUZZY_DISTANCE + 1
+
+def bounded_edit_distance(first, second, max_distance):
+  '''
+  Levenshtein distance between two strings, or max_distance + 1 as soon
+  as it is known to be larger than max_distance. Characters both strings
+  start or end with are skipped, and only the cells within max_distance
+  of the diagonal are computed, the others can't be on a path that short.
+  '''
+  too_far = max_distance + 1
+  if abs(len(first) - len(second)) > max_distance:
+    return too_far
+  if first == second:
+    return 0
+
+  start = 0
+  shortest = min(len(first), len(second))
+  while start < shortest and first[start] == second[start]:
+    start += 1
+  end = 0
+  while end < shortest - start and first[-1 - end] == second[-1 - end]:
+    end += 1
+  first = first[start:len(first) - end]
+  second = second[start:len(second) - end]
+
+  previous_row = [min(j, too_far) for j in range(len(second) + 1)]
+  for i, first_character in enumerate(first, 1):
+    low = max(1, i - max_distance)
+    high = min(len(second), i + max_distance)
+    current_row = [too_far] * (len(second) + 1)
+    current_row[0] = min(i, too_far)
+    for j in range(low, high + 1):
+      current_row[j] = min(
+        previous_row[j] + 1,
+        current_row[j - 1] + 1,
+        previous_row[j - 1] + (first_character != second[j - 1])
+      )
+
+    if min(current_row[low - 1:high + 1]) > max_distance:
+      return too_far
+    previous_row = current_row
+
+  return min(previous_row[-1], too_far)
+
+def segments(length, count):
+  '''
+  Splits a string of the given length into count contiguous segments as
+  even as possible, returned as ( start, length, ) pairs.
+  '''
+  short_length, long_segments = divmod(length, count)
+  starts = []
+  start = 0
+  for number in range(count):
+    segment_length = short_length + (number >= count - long_segments)
+    starts.append(( start, segment_length, ))
+    start += segment_length
+
+  return starts
+
+class TitleIndex:
+  '''
+  In-memory index of every title, kept as a sorted list of case folded
+  titles. Prefix lookups are a binary search followed by a scan of the
+  matching run, so they cost O(log n + limit) whatever the number of titles.
+  The titles are loaded from the database by load(), or on first use.
+
+  Close titles are found with a segment index: every title is split into
+  FUZZY_SEGMENTS segments, and each edit changes at most one of them, so
+  a title within max_distance edits of another keeps all but max_distance
+  of its segments intact, at most max_distance characters away from where
+  they were. A lookup only compares the titles sharing that many segments
+  with the requested title, which never misses one, so long titles only
+  sharing a common start such as "List of" aren't compared.
+  '''
+  def __init__(self, connection_pool):
+    self.connection_pool = connection_pool
+
+    self._keys = []
+    self._titles = []
+    self._titles_by_key = {}
+    # ( length, segment number, ) -> segment -> case folded titles
+    self._segments = {}
+    # Length -> case folded titles too short to be split into segments
+    self._short_keys = {}
+    # Titles with a greater title_id were added since the last load or refresh
+    self._last_title_id = 0
+    self._loaded = False
+    self._lock = threading.Lock()
+
+  def load(self):
+    '''
+    Reads every title from the database and builds the index. It is
+    otherwise built by the first lookup, so servers call this at startup
+    to keep that cost off the first request.
+    '''
+    with self.connection_pool.cursor() as cursor:
+      rows = cursor.execute("SELECT title_id, title FROM titles").fetchall()
+
+    entries = sorted(( title.casefold(), title, ) for _, title in rows)
+    titles_by_key = {}
+    segment_index = {}
+    short_keys = {}
+    for key, title in entries:
+      if key not in titles_by_key:
+        self._index_close_titles(key, segment_index, short_keys)
+      titles_by_key.setdefault(key, []).append(title)
+
+    with self._lock:
+      self._keys = [key for key, _ in entries]
+      self._titles = [title for _, title in entries]
+      self._titles_by_key = titles_by_key
+      self._segments = segment_index
+      self._short_keys = short_keys
+      self._last_title_id = max((title_id for title_id, _ in rows), default=0)
+      self._loaded = True
+
+  def refresh(self):
+    '''
+    Adds the titles saved since the last load or refresh, for titles
+    added by other processes. Loads the whole index on first use.
+    '''
+    if not self._loaded:
+      self.load()
+      return
+
+    with self.connection_pool.cursor() as cursor:
+      rows = cursor.execute("SELECT title_id, title FROM titles WHERE title_id > ? ORDER BY title_id", ( self._last_title_id, )).fetchall()
+
+    for _, title in rows:
+      self.add(title)
+    if rows:
+      with self._lock:
+        self._last_title_id = max(self._last_title_id, rows[-1][0])
+
+  @staticmethod
+  def _index_close_titles(key, segment_index, short_keys):
+    if len(key) <= MAX_FUZZY_DISTANCE:
+      short_keys.setdefault(len(key), []).append(key)
+      return
+
+    for number, ( start, segment_length ) in enumerate(segments(len(key), FUZZY_SEGMENTS)):
+      if segment_length == 0:
+        continue
+      segment_index.setdefault(( len(key), number, ), {}).setdefault(key[start:start + segment_length], []).append(key)
+
+  def _ensure_loaded(self):
+    if not self._loaded:
+      self.load()
+
+  def add(self, title):
+    with self._lock:
+      # Picked up by the next load
+      if not self._loaded:
+        return
+
+      key = title.casefold()
+      if title in self._titles_by_key.get(key, ()):
+        return
+
+      if key not in self._titles_by_key:
+        self._index_close_titles(key, self._segments, self._short_keys)
+      position = bisect_left(self._keys, key)
+      self._keys.insert(position, key)
+      self._titles.insert(position, title)
+      self._titles_by_key.setdefault(key, []).append(title)
+
+  def suggest(self, prefix, limit = 10):
+    '''
+    Titles starting with prefix, ignoring case, in alphabetical order.
+    '''
+    self._ensure_loaded()
+    prefix = prefix.casefold()
+
+    with self._lock:
+      position = bisect_left(self._keys, prefix)
+      suggestions = []
+      while position < len(self._keys) and len(suggestions) < limit and self._keys[position].startswith(prefix):
+        suggestions.append(self._titles[position])
+        position += 1
+
+    return suggestions
+
+  def resolve(self, title):
+    '''
+    Returns the stored title matching title exactly or, failing that,
+    ignoring case. Returns None when no title matches.
+    '''
+    self._ensure_loaded()
+
+    with self._lock:
+      matches = self._titles_by_key.get(title.casefold(), [])
+
+    if title in matches:
+      return title
+    return matches[0] if matches else None
+
+  def did_you_mean(self, title, max_distance = 2, limit = 5):
+    '''
+    Titles within max_distance edits of title, ignoring case, closest
+    first. Only titles sharing enough segments with title are compared.
+    max_distance is capped at MAX_FUZZY_DISTANCE.
+    '''
+    self._ensure_loaded()
+    max_distance = min(max_distance, MAX_FUZZY_DISTANCE)
+    key = title.casefold()
+
+    candidates = []
+    with self._lock:
+      # Lengths further than max_distance from the title's can't be close enough
+      for length in range(max(0, len(key) - max_distance), len(key) + max_distance + 1):
+        if length <= MAX_FUZZY_DISTANCE:
+          candidates.extend(self._short_keys.get(length, ()))
+          continue
+
+        # Number of intact segments of every title of this length sharing one
+        shared_segments = Counter()
+        title_segments = segments(length, FUZZY_SEGMENTS)
+        for number, ( start, segment_length ) in enumerate(title_segments):
+          segment_index = self._segments.get(( length, number, ))
+          if segment_index is None or segment_length == 0:
+            continue
+
+          sharing_titles = set()
+          for position in range(max(0, start - max_distance), min(len(key) - segment_length, start + max_distance) + 1):
+            sharing_titles.update(segment_index.get(key[position:position + segment_length], ()))
+          shared_segments.update(sharing_titles)
+
+        # Empty segments are never changed by an edit, so they don't count
+        required_segments = sum(segment_length > 0 for _, segment_length in title_segments) - max_distance
+        candidates.extend(candidate for candidate, count in shared_segments.items() if count >= required_segments)
+
+      titles_by_key = {candidate: list(self._titles_by_key[candidate]) for candidate in candidates}
+
+    # The lock is only held to read the index, distances are computed without it
+    matches = []
+    for candidate in candidates:
+      distance = bounded_edit_distance(key, candidate, max_distance)
+      if distance <= max_distance:
+        matches.extend(( distance, match, ) for match in titles_by_key[candidate])
+
+    return [match for _, match in sorted(matches)[:limit]]
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import pytest
+
+from src.asgi_app import DocumentsASGIApp
+from src.document_store_actions import DocumentStoreActions
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( "document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)", ),
+    ( "document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)", )
+  ]
+
+@pytest.fixture
+def asgi_app(setup_test_db_with_data):
+  app = DocumentsASGIApp(DocumentStoreActions(database_name), max_concurrency=2)
+
+  yield app
+
+  app.executor.shutdown()
+
+def call_app_for_response(app, method, path, body = b"", query_string = b""):
+  '''
+  Returns the status, headers and JSON payload of the app's response,
+  its body put back together when it was sent in chunks.
+  '''
+  messages = []
+
+  async def receive():
+    return {"type": "http.request", "body": body, "more_body": False}
+
+  async def send(message):
+    messages.append(message)
+
+  scope = {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": []}
+  asyncio.run(app(scope, receive, send))
+
+  headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in messages[0]["headers"]}
+  return messages[0]["status"], headers, json.loads(b"".join(message["body"] for message in messages[1:]))
+
+def call_app(app, method, path, body = b""):
+  status, _, payload = call_app_for_response(app, method, path, body)
+
+  return status, payload
+
+def test_asgi_app_returns_the_latest_revision(asgi_app):
+  '''
+  Given a title with two revisions
+  When we request its latest revision from the ASGI app
+  Then we expect the most recent revision
+  '''
+
+  status, payload = call_app(asgi_app, "GET", "/documents/document title B/latest")
+
+  assert status == 200
+  assert payload == ["document title B", "2023-03-22 14:15:00.000000", "document text content (revision 2)"]
+
+def test_asgi_app_returns_the_revision_at_a_timestamp(asgi_app):
+  '''
+  Given a title with two revisions
+  When we request the revision at a timestamp between them
+  Then we expect the earlier revision
+  '''
+
+  status, payload = call_app(asgi_app, "GET", "/documents/document title B/2023-03-22 14:12:00.00")
+
+  assert status == 200
+  assert payload[2] == "document text content (revision 1)"
+
+def test_asgi_app_posts_a_new_revision(asgi_app):
+  '''
+  Given a title with two revisions
+  When we post new content to it through the ASGI app
+  Then we expect a third revision to be saved
+  '''
+
+  status, payload = call_app(asgi_app, "POST", "/documents/document title B", b'{"content": "new content"}')
+  _, documents = call_app(asgi_app, "GET", "/documents/document title B")
+
+  assert status == 200
+  assert payload == {"message": "New document saved to title: document title B"}
+  assert documents[-1][2] == "new content"
+
+def test_asgi_app_returns_not_found_for_unknown_titles(asgi_app):
+  status, payload = call_app(asgi_app, "GET", "/documents/document title C/latest")
+
+  assert status == 404
+  assert "not found" in payload["message"]
+
+def test_asgi_app_rejects_requests_when_overloaded(asgi_app):
+  '''
+  Given an ASGI app whose queue of pending database calls is full
+  When a new request arrives
+  Then we expect it to be answered with 503
+  '''
+
+  asgi_app.max_pending = 0
+  status, _ = call_app(asgi_app, "GET", "/documents")
+
+  assert status == 503
+
+def test_asgi_app_answers_revalidations_with_not_modified(asgi_app):
+  '''
+  Given the ETag of a historical revision
+  When we request that revision again with If-None-Match
+  Then we expect a 304 with an empty body
+  '''
+
+  messages = []
+
+  async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+  async def send(message):
+    messages.append(message)
+
+  scope = {"type": "http", "method": "GET", "path": "/documents/document title B/2023-03-22 14:12:00.00", "headers": []}
+  asyncio.run(asgi_app(scope, receive, send))
+  headers = dict(messages[0]["headers"])
+
+  messages.clear()
+  scope["headers"] = [( b"if-none-match", headers[b"etag"], )]
+  asyncio.run(asgi_app(scope, receive, send))
+
+  assert headers[b"cache-control"] == b"no-cache"
+  assert messages[0]["status"] == 304
+  assert messages[1]["body"] == b""
+
+def test_asgi_app_pages_and_streams_revision_listings(asgi_app, monkeypatch):
+  '''
+  Given a title with two revisions
+  When we request a page of one revision, the next page with its cursor and a streamed listing read one revision per page
+  Then we expect each revision once, and every revision in the streamed listing
+  '''
+
+  status, headers, first_page = call_app_for_response(asgi_app, "GET", "/documents/document title B", query_string=b"limit=1")
+  _, _, second_page = call_app_for_response(
+    asgi_app, "GET", "/documents/document title B", query_string=f"limit=1&cursor={headers['x-next-cursor']}".encode()
+  )
+  monkeypatch.setattr("src.asgi_app.STREAM_PAGE_SIZE", 1)
+  _, _, streamed = call_app_for_response(asgi_app, "GET", "/documents/document title B", query_string=b"stream=true&metadata_only=true")
+
+  assert status == 200
+  assert [document[2] for document in first_page + second_page] == [
+    "document text content (revision 1)",
+    "document text content (revision 2)"
+  ]
+  assert [document[1] for document in streamed] == ["2023-03-22 14:10:00.000000", "2023-03-22 14:15:00.000000"]
+
+def test_asgi_app_answers_bad_numbers_with_400(asgi_app):
+  '''
+  Given the ASGI app
+  When we send query parameters that aren't numbers
+  Then we expect 400 rather than 500
+  '''
+
+  assert call_app_for_response(asgi_app, "GET", "/documents/document title B", query_string=b"limit=ten")[0] == 400
+  assert call_app_for_response(asgi_app, "GET", "/documents/document title B", query_string=b"limit=-1")[0] == 400
+  assert call_app_for_response(asgi_app, "GET", "/documents/document title B", query_string=b"limit=-1&stream=true")[0] == 400
+  assert call_app_for_response(asgi_app, "GET", "/search", query_string=b"q=text&offset=x")[0] == 400
+  assert call_app_for_response(asgi_app, "GET", "/change-log", query_string=b"wait=soon")[0] == 400
+
+def test_asgi_app_answers_batches_with_too_many_items_with_413(asgi_app, monkeypatch):
+  '''
+  Given batches capped at one item
+  When we post two revisions and read two titles in a batch
+  Then we expect 413 for both
+  '''
+
+  monkeypatch.setattr("src.document_store_actions.MAX_BATCH_SIZE", 1)
+  revisions = json.dumps([{"title": "document title B", "content": "a"}, {"title": "document title B", "content": "b"}]).encode()
+  titles = json.dumps({"titles": ["document title A", "document title B"]}).encode()
+
+  assert call_app_for_response(asgi_app, "POST", "/documents:batch", revisions)[0] == 413
+  assert call_app_for_response(asgi_app, "POST", "/documents:batch-get", titles)[0] == 413
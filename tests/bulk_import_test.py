@@ -0,0 +1,95 @@
+import io
+import json
+import pytest
+
+from src.bulk_import import BulkImporter, iter_documents
+from src.document_store_actions import DocumentStoreActions
+from src.exceptions import TitleTooLongError
+
+database_name = "test_db.db"
+
+documents = [
+  {"title": "document title A", "creation_timestamp": "2023-03-22 14:00:00.00", "content": "document text content A"},
+  {"title": "document title B", "creation_timestamp": "2023-03-22 14:10:00.00", "content": "document text content (revision 1)"},
+  {"title": "document title B", "creation_timestamp": "2023-03-22 14:15:00.00", "content": "document text content (revision 2)"}
+]
+
+def test_iter_documents_streams_a_json_array_in_small_chunks():
+  '''
+  Given a JSON array of documents
+  When we read it with iter_documents using a chunk size smaller than one document
+  Then we expect every document to be parsed
+  '''
+
+  file = io.StringIO(json.dumps(documents, indent=2))
+
+  assert list(iter_documents(file, chunk_size=7)) == documents
+
+def test_iter_documents_reads_json_lines():
+  '''
+  Given a JSON lines file of documents
+  When we read it with iter_documents
+  Then we expect every document to be parsed
+  '''
+
+  file = io.StringIO("\n".join(json.dumps(document) for document in documents) + "\n")
+
+  assert list(iter_documents(file, chunk_size=10)) == documents
+
+def test_bulk_importer_saves_every_revision(setup_test_db, tmp_path):
+  '''
+  Given a JSON lines file of documents
+  When we import it with a batch size smaller than the number of documents
+  Then we expect every revision to be saved and the indexes to be rebuilt
+  '''
+
+  file_path = tmp_path / "documents.jsonl"
+  file_path.write_text("\n".join(json.dumps(document) for document in documents))
+
+  result = BulkImporter(database_name, batch_size=2).import_file(file_path)
+
+  index_names = [row[0] for row in setup_test_db.execute(
+    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'documents_metadata'"
+  )]
+
+  assert result == (3, 2)
+  assert DocumentStoreActions(database_name).get_documents("document title B") == [
+    ('document title B', '2023-03-22 14:10:00.000000', 'document text content (revision 1)'),
+    ('document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)')
+  ]
+  assert "documents_metadata_title_id_creation_timestamp" in index_names
+
+@pytest.mark.usefixtures("setup_test_db")
+def test_bulk_importer_raises_title_too_long_error():
+  '''
+  Given a document whose title is longer than 50 chars
+  When we import it
+  Then we expect to raise TitleTooLongError exception
+  '''
+
+  long_title_document = {
+    "title": "This is a really really really unnecessarily long title",
+    "creation_timestamp": "2023-03-22 14:00:00.00",
+    "content": "document text content"
+  }
+
+  with pytest.raises(TitleTooLongError):
+    BulkImporter(database_name).import_documents([long_title_document])
+
+def test_bulk_importer_logs_every_revision_in_the_change_log(setup_test_db):
+  '''
+  Given documents imported in batches smaller than the number of documents
+  When we read the change log
+  Then we expect one entry per revision in the order they were imported, with increasing sequence numbers
+  '''
+
+  BulkImporter(database_name, batch_size=2).import_documents(documents)
+
+  entries = DocumentStoreActions(database_name).get_change_log()
+
+  assert [( entry.title, entry.creation_timestamp, ) for entry in entries] == [
+    ( "document title A", "2023-03-22 14:00:00.000000", ),
+    ( "document title B", "2023-03-22 14:10:00.000000", ),
+    ( "document title B", "2023-03-22 14:15:00.000000", )
+  ]
+  assert [entry.sequence for entry in entries] == sorted(entry.sequence for entry in entries)
@@ -0,0 +1,51 @@
+from src.compression import (
+  choose_encoding,
+  compress,
+  compress_body,
+  decompress,
+  strip_encoding_from_etag
+)
+
+def test_choose_encoding_honours_quality_values():
+  '''
+  Given Accept-Encoding headers with and without quality values
+  When we choose an encoding
+  Then we expect gzip when it is accepted and None when nothing usable is
+  '''
+
+  assert choose_encoding("gzip, deflate") == "gzip"
+  assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+  assert choose_encoding("gzip;q=0, identity") is None
+  assert choose_encoding(None) is None
+
+def test_compress_round_trips_and_is_deterministic():
+  '''
+  Given a JSON body
+  When we compress it twice with gzip and decompress it
+  Then we expect identical compressed bytes and the original body back
+  '''
+
+  body = b'["Earth","2023-03-22 14:00:00.000000","' + b"lorem ipsum " * 100 + b'"]'
+
+  assert compress(body, "gzip") == compress(body, "gzip")
+  assert decompress(compress(body, "gzip"), "gzip") == body
+
+def test_compress_body_gives_each_encoding_its_own_etag():
+  '''
+  Given a body large enough to compress and its ETag
+  When we compress it for a client accepting gzip
+  Then we expect a gzip body whose ETag maps back to the original one
+  '''
+
+  body = b"lorem ipsum " * 100
+  compressed_body, headers = compress_body(body, '"abc"', "gzip")
+
+  assert decompress(compressed_body, "gzip") == body
+  assert headers == {"Vary": "Accept-Encoding", "Content-Encoding": "gzip", "ETag": '"abc-gzip"'}
+  assert strip_encoding_from_etag(headers["ETag"]) == '"abc"'
+
+def test_compress_body_leaves_small_bodies_alone():
+  body, headers = compress_body(b"[]", None, "gzip")
+
+  assert body == b"[]"
+  assert headers == {"Vary": "Accept-Encoding"}
@@ -0,0 +1,48 @@
+import pytest
+import sqlite3
+
+from src.sqlite import SqliteDB
+from src.database_data_handlers import DatabaseManager
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  '''
+  ( title, creation_timestamp, content, ) rows saved by
+  setup_test_db_with_data. Test files override this fixture, or
+  parametrize it, with their own rows.
+  '''
+  return []
+
+@pytest.fixture
+def setup_test_db():
+  # Create test_db file if one doesn't exist yet
+  conn = sqlite3.connect(database_name)
+
+  # Reset the database by dropping every table, so nothing a test wrote
+  # outlives it. Virtual tables go first, as they drop their own shadow
+  # tables, and dropped tables take their sqlite_sequence rows with them
+  with conn:
+    tables = conn.execute("""
+      SELECT name FROM sqlite_master
+      WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+      ORDER BY sql LIKE 'CREATE VIRTUAL TABLE%' DESC
+    """).fetchall()
+    for table, in tables:
+      conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+  # Add tables to test_db
+  SqliteDB(database_name).database_setup()
+
+  yield conn
+
+  conn.close()
+
+@pytest.fixture
+def setup_test_db_with_data(setup_test_db, seed_rows):
+  database_manager = DatabaseManager(database_name)
+  for document_title, creation_timestamp, document_content in seed_rows:
+    database_manager.save_data_to_db(document_title, creation_timestamp, document_content)
+
+  return setup_test_db
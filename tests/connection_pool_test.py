@@ -0,0 +1,195 @@
+import pytest
+import sqlite3
+import threading
+
+from src.connection_pool import ConnectionPool, get_connection_pool
+from src.exceptions import ConnectionPoolExhausted
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def connection_pool():
+  pool = ConnectionPool(database_name)
+
+  yield pool
+
+  pool.close_all()
+
+def test_connection_pool_reuses_the_connection_within_a_thread(connection_pool):
+  '''
+  Given a connection pool
+  When we acquire a connection twice from the same thread
+  Then we expect to get the same connection back and count one miss and one hit
+  '''
+
+  with connection_pool.connection() as first_conn:
+    pass
+  with connection_pool.connection() as second_conn:
+    pass
+
+  assert first_conn is second_conn
+  assert connection_pool.stats() == {"hits": 1, "misses": 1, "open_connections": 1, "idle_connections": 1}
+
+def test_connection_pool_reuses_connections_returned_by_finished_threads(connection_pool):
+  '''
+  Given a connection pool
+  When a hundred short-lived threads each acquire a connection one after the other
+  Then we expect them all to share a single connection
+  '''
+
+  connections = []
+
+  def acquire():
+    with connection_pool.connection() as conn:
+      connections.append(conn)
+
+  for _ in range(100):
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+
+  assert len(set(map(id, connections))) == 1
+  assert connection_pool.stats()["misses"] == 1
+  assert connection_pool.stats()["open_connections"] == 1
+
+def test_connection_pool_gives_concurrent_threads_their_own_connections_up_to_its_cap():
+  '''
+  Given a connection pool capped at two connections
+  When three threads hold a connection at the same time
+  Then we expect two connections to be opened and the third thread to wait for one to be returned
+  '''
+
+  pool = ConnectionPool(database_name, max_connections=2)
+  acquired = threading.Semaphore(0)
+  release = threading.Event()
+  connections = []
+
+  def hold():
+    with pool.connection() as conn:
+      connections.append(conn)
+      acquired.release()
+      release.wait()
+
+  holders = [threading.Thread(target=hold) for _ in range(2)]
+  for holder in holders:
+    holder.start()
+  acquired.acquire()
+  acquired.acquire()
+  waiter = threading.Thread(target=hold)
+  waiter.start()
+  waiter.join(0.2)
+
+  assert waiter.is_alive()
+  assert connections[0] is not connections[1]
+
+  release.set()
+  for thread in holders + [waiter]:
+    thread.join()
+
+  assert pool.stats()["open_connections"] == 2
+  pool.close_all()
+
+def test_connection_pool_raises_when_no_connection_is_returned_in_time():
+  '''
+  Given a connection pool capped at one connection with a short acquire timeout
+  When another thread holds the only connection past the timeout
+  Then we expect acquiring a connection to raise ConnectionPoolExhausted
+  '''
+
+  pool = ConnectionPool(database_name, max_connections=1, acquire_timeout=0.1)
+  acquired = threading.Event()
+  release = threading.Event()
+
+  def hold():
+    with pool.connection():
+      acquired.set()
+      release.wait()
+
+  holder = threading.Thread(target=hold)
+  holder.start()
+  acquired.wait()
+
+  with pytest.raises(ConnectionPoolExhausted):
+    with pool.connection():
+      pass
+
+  release.set()
+  holder.join()
+  with pool.connection():
+    pass
+  pool.close_all()
+
+def test_nested_connection_blocks_share_one_connection(connection_pool):
+  '''
+  Given a connection pool
+  When we open a connection block inside another one on the same thread
+  Then we expect both blocks to get the same connection and a single checkout
+  '''
+
+  with connection_pool.connection() as outer_conn:
+    with connection_pool.connection() as inner_conn:
+      assert connection_pool.stats()["idle_connections"] == 0
+
+  assert outer_conn is inner_conn
+  assert connection_pool.stats()["hits"] + connection_pool.stats()["misses"] == 1
+
+def test_connection_pool_applies_pragmas_on_new_connections(connection_pool):
+  '''
+  Given a connection pool with the default pragmas
+  When we acquire a connection
+  Then we expect the database to be in WAL mode with synchronous set to NORMAL
+  '''
+
+  with connection_pool.cursor() as cursor:
+    journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+    synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+
+  assert journal_mode == "wal"
+  # 1 == NORMAL
+  assert synchronous == 1
+
+def test_connection_pool_rolls_back_when_an_exception_is_raised(connection_pool):
+  '''
+  Given a connection pool
+  When an exception is raised inside a connection block after a write
+  Then we expect the write to be rolled back and the connection to stay usable
+  '''
+
+  with connection_pool.cursor() as cursor:
+    cursor.execute("DROP TABLE IF EXISTS pool_test")
+    cursor.execute("CREATE TABLE pool_test (value TEXT)")
+
+  with pytest.raises(ValueError):
+    with connection_pool.cursor() as cursor:
+      cursor.execute("INSERT INTO pool_test VALUES ('rolled back')")
+      raise ValueError("boom")
+
+  with connection_pool.cursor() as cursor:
+    rows = cursor.execute("SELECT value FROM pool_test").fetchall()
+    cursor.execute("DROP TABLE pool_test")
+
+  assert rows == []
+
+def test_get_connection_pool_returns_a_shared_pool():
+  '''
+  Given a database name
+  When we call get_connection_pool twice with it
+  Then we expect the same pool to be returned
+  '''
+
+  assert get_connection_pool(database_name) is get_connection_pool(database_name)
+
+def test_read_only_connection_pool_cannot_write():
+  '''
+  Given a read only connection pool
+  When we try to write through it
+  Then we expect SQLite to refuse the write
+  '''
+
+  pool = ConnectionPool(database_name, read_only=True)
+
+  with pytest.raises(sqlite3.OperationalError):
+    with pool.cursor() as cursor:
+      cursor.execute("CREATE TABLE read_only_test (value TEXT)")
+
+  pool.close_all()
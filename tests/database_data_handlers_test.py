@@ -1,37 +1,11 @@
-import numpy
 import pytest
 import sqlite3
 
-from src.sqlite import SqliteDB
 from src.database_data_handlers import DatabaseManager
 from src.exceptions import TitleTooLongError
 
 database_name = "test_db.db"
 
-@pytest.fixture
-def setup_test_db():
-  # Create test_db file if one doesn't exist yet
-  conn = sqlite3.connect(database_name)
-  cursor = conn.cursor()
-
-  # Reset the database by deleting all data
-  try:
-    cursor.execute("DROP TABLE IF EXISTS titles")
-    cursor.execute("DROP TABLE IF EXISTS documents_metadata")
-    cursor.execute("DROP TABLE IF EXISTS documents_data")
-    conn.commit()
-  except sqlite3.Error as error:
-    print(error)
-    conn.rollback()
-
-  # Add tables to test_db
-  test_db = SqliteDB(database_name)
-  test_db.database_setup()
-
-  yield conn
-  
-  conn.close()
-
 @pytest.fixture
 def database_manager():
   return DatabaseManager(database_name)
@@ -66,9 +40,9 @@ def test_save_data_to_db_populates_the_db_tables(database_manager):
   )
 
   rows = rows_query.fetchall()
-  title_row = list(numpy.concatenate(rows))
 
-  assert title_row == ['document title B', '2023-03-22 14:20:00.00', 'document text content (revision 1)']
+  # Timestamps are stored as integer microseconds since the epoch
+  assert rows == [('document title B', 1679494800000000, 'document text content (revision 1)')]
 
 @pytest.mark.usefixtures("setup_test_db")
 def test_save_data_to_db_raises_title_too_long_error(database_manager):
@@ -85,3 +59,24 @@ def test_save_data_to_db_raises_title_too_long_error(database_manager):
 
   with pytest.raises(TitleTooLongError):
     database_manager.save_data_to_db(document_title, creation_timestamp, document_content_data)
+
+@pytest.mark.usefixtures("setup_test_db")
+def test_save_data_to_db_keeps_the_title_head_up_to_date(database_manager):
+  '''
+  Given a title saved with two revisions and then an older backdated one
+  When we read its row in title_heads
+  Then we expect it to point at the newest revision and count all three
+  '''
+
+  database_manager.save_data_to_db("document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)")
+  database_manager.save_data_to_db("document title B", "2023-03-22 14:20:00.00", "document text content (revision 2)")
+  database_manager.save_data_to_db("document title B", "2023-03-22 14:00:00.00", "document text content (revision 0)")
+
+  conn = sqlite3.connect(database_name)
+  title_head = conn.execute("""
+    SELECT title_heads.creation_timestamp, document_content, revision_count FROM title_heads
+    INNER JOIN documents_data ON documents_data.document_id = title_heads.document_id
+  """).fetchall()
+  conn.close()
+
+  assert title_head == [( 1679494800000000, "document text content (revision 2)", 3, )]
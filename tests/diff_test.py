@@ -0,0 +1,94 @@
+import pytest
+import random
+
+from src.diff import diff_lines, matching_blocks, matching_line_blocks
+
+def longest_common_subsequence_length(a, b):
+  lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+  for i in range(len(a) - 1, -1, -1):
+    for j in range(len(b) - 1, -1, -1):
+      lengths[i][j] = lengths[i + 1][j + 1] + 1 if a[i] == b[j] else max(lengths[i + 1][j], lengths[i][j + 1])
+
+  return lengths[0][0]
+
+def test_matching_blocks_form_a_longest_common_subsequence():
+  '''
+  Given random pairs of short sequences
+  When we compute their matching blocks
+  Then we expect ordered runs of equal items as long as their longest common subsequence
+  '''
+
+  random_generator = random.Random(7)
+  for _ in range(2000):
+    a = [random_generator.randrange(3) for _ in range(random_generator.randrange(10))]
+    b = [random_generator.randrange(3) for _ in range(random_generator.randrange(10))]
+
+    blocks = matching_blocks(a, b)
+
+    a_index = b_index = 0
+    for block_a_index, block_b_index, size in blocks:
+      assert block_a_index >= a_index and block_b_index >= b_index
+      assert a[block_a_index:block_a_index + size] == b[block_b_index:block_b_index + size]
+      a_index, b_index = block_a_index + size, block_b_index + size
+    assert sum(size for _, _, size in blocks) == longest_common_subsequence_length(a, b)
+
+def test_diff_lines_returns_unified_hunks_with_context():
+  '''
+  Given two documents with one changed line and one added line far apart
+  When we diff them with one line of context
+  Then we expect two hunks numbered like a unified diff
+  '''
+
+  from_lines = ["a", "b", "c", "d", "e", "f", "g"]
+  to_lines = ["a", "b", "x", "d", "e", "f", "g", "h"]
+
+  assert diff_lines(from_lines, to_lines, context=1) == [
+    ( 2, 3, 2, 3, [" b", "-c", "+x", " d"], ),
+    ( 7, 1, 7, 2, [" g", "+h"], )
+  ]
+
+def test_diff_lines_of_identical_documents_is_empty():
+  '''
+  Given two identical documents
+  When we diff them
+  Then we expect no hunks
+  '''
+
+  assert diff_lines(["a", "b"], ["a", "b"]) == []
+
+def test_matching_line_blocks_skip_unique_lines_and_still_find_a_longest_common_subsequence():
+  '''
+  Given random pairs of sequences where many items appear on one side only
+  When we compute their matching line blocks
+  Then we expect ordered runs of equal items as long as their longest common subsequence
+  '''
+
+  random_generator = random.Random(11)
+  for _ in range(500):
+    a = [random_generator.randrange(12) for _ in range(random_generator.randrange(12))]
+    b = [random_generator.randrange(6, 18) for _ in range(random_generator.randrange(12))]
+
+    blocks = matching_line_blocks(a, b)
+
+    a_index = b_index = 0
+    for block_a_index, block_b_index, size in blocks:
+      assert block_a_index >= a_index and block_b_index >= b_index
+      assert a[block_a_index:block_a_index + size] == b[block_b_index:block_b_index + size]
+      a_index, b_index = block_a_index + size, block_b_index + size
+    assert sum(size for _, _, size in blocks) == longest_common_subsequence_length(a, b)
+
+def test_matching_blocks_leave_ranges_unmatched_past_the_step_budget():
+  '''
+  Given two sequences that differ throughout
+  When we compute their matching blocks with a budget of one diagonal
+  Then we expect only their common prefix and suffix, as runs of equal items
+  '''
+
+  a = [0, 1, 2, 3, 1, 2, 9]
+  b = [0, 2, 1, 3, 2, 1, 9]
+
+  assert matching_blocks(a, b, max_steps=1) == [( 0, 0, 1, ), ( 6, 6, 1, )]
+
+def test_diff_lines_rejects_a_negative_context():
+  with pytest.raises(ValueError):
+    diff_lines(["a"], ["b"], context=-1)
@@ -1,5 +1,7 @@
 import pytest
 import sqlite3
+import threading
+import time
 
 from src.sqlite import SqliteDB
 from src.document_store_actions import DocumentStoreActions
@@ -14,56 +16,13 @@ from src.exceptions import (
 database_name = "test_db.db"
 
 @pytest.fixture
-def setup_test_db_with_data():
-  # Create test_db file if one doesn't exist yet
-  conn = sqlite3.connect(database_name)
-  cursor = conn.cursor()
-
-  # Reset the database by deleting all data
-  try:
-    cursor.execute("DROP TABLE IF EXISTS titles")
-    cursor.execute("DROP TABLE IF EXISTS documents_metadata")
-    cursor.execute("DROP TABLE IF EXISTS documents_data")
-    conn.commit()
-  except sqlite3.Error as error:
-    print(error)
-    conn.rollback()
-
-  # Add tables to test_db
-  test_db = SqliteDB(database_name)
-  test_db.database_setup()
-
-  # Add data to tables
-  data = [
-    {
-      "document_title": "document title A",
-      "creation_timestamp": "2023-03-22 14:00:00.00",
-      "document_content": "document text content A"
-    },
-    {
-      "document_title": "document title B",
-      "creation_timestamp": "2023-03-22 14:10:00.00",
-      "document_content": "document text content (revision 1)"
-    },
-    {
-      "document_title": "document title B",
-      "creation_timestamp": "2023-03-22 14:15:00.00",
-      "document_content": "document text content (revision 2)"
-    }
+def seed_rows():
+  return [
+    ( "document title A", "2023-03-22 14:00:00.00", "document text content A", ),
+    ( "document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)", ),
+    ( "document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)", )
   ]
 
-  database_manager = DatabaseManager(database_name)
-  for document in data:
-    document_title = document["document_title"]
-    creation_timestamp = document["creation_timestamp"]
-    document_content = document["document_content"]
-
-    database_manager.save_data_to_db(document_title, creation_timestamp, document_content)
-  
-  yield conn
-  
-  conn.close()
-
 @pytest.fixture
 def document_store_actions():
   return DocumentStoreActions(database_name)
@@ -122,8 +81,8 @@ def test_get_documents_returns_data_from_db(document_store_actions):
   document_list = document_store_actions.get_documents(title)
 
   assert document_list == [
-    ('document title B', '2023-03-22 14:10:00.00', 'document text content (revision 1)'),
-    ('document title B', '2023-03-22 14:15:00.00', 'document text content (revision 2)')
+    ('document title B', '2023-03-22 14:10:00.000000', 'document text content (revision 1)'),
+    ('document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)')
   ]
 
 @pytest.mark.usefixtures("setup_test_db_with_data")
@@ -151,9 +110,9 @@ def test_get_document_as_it_was_at_a_given_timestamp_returns_data_from_db(docume
   timestamp = "2023-03-22 14:14:00.00"
   document_revision = document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, timestamp)
 
-  assert document_revision == [
-    'document title B', '2023-03-22 14:10:00.00', 'document text content (revision 1)'
-  ]
+  assert document_revision == (
+    'document title B', '2023-03-22 14:10:00.000000', 'document text content (revision 1)'
+  )
 
 @pytest.mark.usefixtures("setup_test_db_with_data")
 def test_get_document_as_it_was_at_a_given_timestamp_raises_no_title_exception(document_store_actions):
@@ -196,9 +155,9 @@ def test_get_latest_document_revision_returns_data_from_db(document_store_action
   title = "document title B"
   latest_document_revision = document_store_actions.get_latest_document_revision(title)
 
-  assert latest_document_revision == [
-    'document title B', '2023-03-22 14:15:00.00', 'document text content (revision 2)'
-  ]
+  assert latest_document_revision == (
+    'document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)'
+  )
 
 @pytest.mark.usefixtures("setup_test_db_with_data")
 def test_get_latest_document_revision_raises_no_title_exception(document_store_actions):
@@ -232,9 +191,9 @@ def test_post_new_document_revision_adds_data_to_db(document_store_actions):
   document_revisions_list = document_store_actions.get_documents(title)
 
   assert document_revisions_list == [
-    ('document title B', '2023-03-22 14:10:00.00', 'document text content (revision 1)'),
-    ('document title B', '2023-03-22 14:15:00.00', 'document text content (revision 2)'),
-    ('document title B', '2023-03-22 14:20:00.00', 'document text content (revision 3)')
+    ('document title B', '2023-03-22 14:10:00.000000', 'document text content (revision 1)'),
+    ('document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)'),
+    ('document title B', '2023-03-22 14:20:00.000000', 'document text content (revision 3)')
   ]
 
 @pytest.mark.usefixtures("setup_test_db_with_data")
@@ -269,3 +228,447 @@ def test_post_new_document_revision_returns_no_changes_detected_exception(docume
   with pytest.raises(NoChangesDetected):
     # Adding new revision to title
     document_store_actions.post_new_document_revision(title, timestamp, content)
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_latest_document_revision_is_served_from_the_cache(document_store_actions):
+  '''
+  Given a database with many document revisions for a title
+  When we call get_latest_document_revision twice for the same title
+  Then we expect the second call to be a cache hit
+  '''
+
+  title = "document title B"
+  document_store_actions.get_latest_document_revision(title)
+  latest_document_revision = document_store_actions.get_latest_document_revision(title)
+
+  assert latest_document_revision == (
+    'document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)'
+  )
+  assert document_store_actions.cache_stats()["hits"] == 1
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_post_new_document_revision_updates_the_cached_latest_revision(document_store_actions):
+  '''
+  Given a title whose latest revision is cached
+  When we call post_new_document_revision with new content
+  Then we expect get_latest_document_revision to return the new revision
+  '''
+
+  title = "document title B"
+  document_store_actions.get_latest_document_revision(title)
+  document_store_actions.post_new_document_revision(title, "2023-03-22 14:20:00.00", "document text content (revision 3)")
+
+  assert document_store_actions.get_latest_document_revision(title) == (
+    'document title B', '2023-03-22 14:20:00.000000', 'document text content (revision 3)'
+  )
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_read_racing_a_post_does_not_cache_the_previous_revision(document_store_actions, monkeypatch):
+  '''
+  Given a read of a title's latest revision that has loaded it from the database
+  When a new revision of the title is posted before the read caches what it loaded
+  Then we expect the posted revision to stay cached as the latest one
+  '''
+
+  title = "document title B"
+  build_revisions = document_store_actions._build_revisions
+
+  def build_revisions_then_post(cursor, rows):
+    revisions = build_revisions(cursor, rows)
+    # Posted from another thread, as by a concurrent request
+    post = threading.Thread(target=document_store_actions.post_new_document_revision, args=(title, "2023-03-22 14:20:00.00", "document text content (revision 3)"))
+    post.start()
+    post.join()
+    return revisions
+
+  monkeypatch.setattr(document_store_actions, "_build_revisions", build_revisions_then_post)
+  assert document_store_actions.get_latest_document_revision(title)[2] == "document text content (revision 2)"
+  monkeypatch.setattr(document_store_actions, "_build_revisions", build_revisions)
+
+  assert document_store_actions.get_latest_document_revision(title)[2] == "document text content (revision 3)"
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_documents_returns_a_page_of_revisions(document_store_actions):
+  '''
+  Given a database with many document revisions for a title
+  When we call get_documents with a limit and an after timestamp
+  Then we expect only the revisions created after that timestamp, up to the limit
+  '''
+
+  title = "document title B"
+
+  assert document_store_actions.get_documents(title, limit=1) == [
+    ('document title B', '2023-03-22 14:10:00.000000', 'document text content (revision 1)')
+  ]
+  assert document_store_actions.get_documents(title, limit=1, after="2023-03-22 14:10:00.000000") == [
+    ('document title B', '2023-03-22 14:15:00.000000', 'document text content (revision 2)')
+  ]
+  assert document_store_actions.get_documents(title, after="2023-03-22 14:15:00.000000") == []
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_documents_page_keeps_revisions_sharing_a_timestamp(document_store_actions):
+  '''
+  Given three revisions of a new title saved with the same timestamp
+  When we page through them one at a time with the returned cursors
+  Then we expect every revision once, in the order they were saved
+  '''
+
+  document_store_actions.post_document_revisions([
+    {"title": "document title C", "content": f"v{number}", "timestamp": "2023-03-22 15:00:00.00"}
+    for number in range(1, 4)
+  ], "2023-03-22 15:00:00.00")
+
+  contents = []
+  documents_cursor = None
+  while True:
+    page, documents_cursor = document_store_actions.get_documents_page("document title C", 1, documents_cursor=documents_cursor)
+    contents += [revision[2] for revision in page]
+    if documents_cursor is None:
+      break
+
+  assert contents == ["v1", "v2", "v3"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_iter_documents_returns_its_connection_between_pages(document_store_actions, monkeypatch):
+  '''
+  Given revisions of a new title and a streamed listing read two revisions at a time
+  When we read the stream one revision at a time
+  Then we expect every revision, with no connection checked out between pages
+  '''
+
+  monkeypatch.setattr("src.document_store_actions.STREAM_PAGE_SIZE", 2)
+  document_store_actions.post_document_revisions([
+    {"title": "document title C", "content": f"v{number}", "timestamp": f"2023-03-22 15:0{number}:00.00"}
+    for number in range(1, 6)
+  ], "2023-03-22 15:00:00.00")
+
+  revisions = document_store_actions.iter_documents("document title C", limit=4)
+  contents = []
+  for revision in revisions:
+    contents.append(revision[2])
+    assert document_store_actions.read_pool.stats()["idle_connections"] == document_store_actions.read_pool.stats()["open_connections"]
+
+  assert contents == ["v1", "v2", "v3", "v4"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_documents_without_content_returns_revision_ids(document_store_actions):
+  '''
+  Given a database with many document revisions for a title
+  When we call get_documents with include_content set to False
+  Then we expect the timestamp and revision id of every revision without its content
+  '''
+
+  document_list = document_store_actions.get_documents("document title B", include_content=False)
+
+  assert [document[1] for document in document_list] == ['2023-03-22 14:10:00.000000', '2023-03-22 14:15:00.000000']
+  assert all(len(document[2]) == 36 for document in document_list)
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_cached_latest_revision_is_dropped_after_an_external_write():
+  '''
+  Given a DocumentStoreActions that detects external writes, with a cached latest revision
+  When another connection saves a newer revision of the title
+  Then we expect get_latest_document_revision to return the newer revision
+  '''
+
+  title = "document title B"
+  document_store_actions = DocumentStoreActions(database_name, read_only=True, detect_external_writes=True)
+  document_store_actions.get_latest_document_revision(title)
+
+  DatabaseManager(database_name).save_data_to_db(title, "2023-03-22 14:20:00.00", "document text content (revision 3)")
+
+  assert document_store_actions.get_latest_document_revision(title)[2] == "document text content (revision 3)"
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_post_document_revisions_saves_valid_revisions_and_reports_each_one(document_store_actions):
+  '''
+  Given a batch mixing new content, a new title, unchanged content, a too long title and a bad timestamp
+  When we post it with post_document_revisions
+  Then we expect the valid revisions saved in one go and a result per revision in order
+  '''
+
+  results = document_store_actions.post_document_revisions([
+    {"title": "document title A", "content": "document text content A (revision 2)", "timestamp": "2023-03-22 15:00:00.00"},
+    {"title": "document title C", "content": "document text content C"},
+    {"title": "document title B", "content": "document text content (revision 2)"},
+    {"title": "x" * 51, "content": "too long"},
+    {"title": "document title A", "content": "other content", "timestamp": "not a timestamp"}
+  ], "2023-03-22 16:00:00.00")
+
+  assert [result["saved"] for result in results] == [True, True, False, False, False]
+  assert "No changes detected" in results[2]["message"]
+  assert "Title is too long" in results[3]["message"]
+  assert "not a valid timestamp" in results[4]["message"]
+  assert document_store_actions.get_latest_document_revision("document title A") == (
+    "document title A", "2023-03-22 15:00:00.000000", "document text content A (revision 2)",
+  )
+  assert document_store_actions.get_latest_document_revision("document title C")[1] == "2023-03-22 16:00:00.000000"
+  assert "document title C" in document_store_actions.get_titles()
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_post_document_revisions_gives_each_revision_without_a_timestamp_its_own(document_store_actions):
+  '''
+  Given a batch of three revisions of a title without timestamps
+  When we save it
+  Then we expect the revisions to be a microsecond apart from the default timestamp, in order
+  '''
+
+  document_store_actions.post_document_revisions([
+    {"title": "document title C", "content": f"v{number}"} for number in range(1, 4)
+  ], "2023-03-22 15:00:00.00")
+
+  assert [revision[1:] for revision in document_store_actions.get_documents("document title C")] == [
+    ('2023-03-22 15:00:00.000000', 'v1'),
+    ('2023-03-22 15:00:00.000001', 'v2'),
+    ('2023-03-22 15:00:00.000002', 'v3')
+  ]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_post_document_revisions_detects_unchanged_content_within_the_batch(document_store_actions):
+  '''
+  Given a batch posting the same new content twice to a title
+  When we post it with post_document_revisions
+  Then we expect the second revision to be rejected as unchanged
+  '''
+
+  results = document_store_actions.post_document_revisions([
+    {"title": "document title A", "content": "same content", "timestamp": "2023-03-22 15:00:00.00"},
+    {"title": "document title A", "content": "same content", "timestamp": "2023-03-22 15:01:00.00"}
+  ], "2023-03-22 16:00:00.00")
+
+  assert [result["saved"] for result in results] == [True, False]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revisions_for_titles_returns_the_latest_revision_of_each_title(document_store_actions):
+  '''
+  Given two titles in the database
+  When we ask for the latest revisions of both and of an unknown title
+  Then we expect each title's latest revision and None for the unknown one
+  '''
+
+  revisions = document_store_actions.get_revisions_for_titles(["document title A", "document title B", "document title C"])
+
+  assert revisions == {
+    "document title A": ( "document title A", "2023-03-22 14:00:00.000000", "document text content A", ),
+    "document title B": ( "document title B", "2023-03-22 14:15:00.000000", "document text content (revision 2)", ),
+    "document title C": None
+  }
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revisions_for_titles_at_a_timestamp(document_store_actions):
+  '''
+  Given a title with two revisions and a title created before both
+  When we ask for both titles as they were between the two revisions
+  Then we expect the earlier revision and the older title's only revision
+  '''
+
+  revisions = document_store_actions.get_revisions_for_titles(["document title A", "document title B"], "2023-03-22 14:12:00.00")
+
+  assert revisions["document title A"][2] == "document text content A"
+  assert revisions["document title B"][2] == "document text content (revision 1)"
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revision_diff_returns_the_changed_lines(document_store_actions):
+  '''
+  Given a title with two revisions
+  When we ask for the diff between the revisions at two timestamps
+  Then we expect the revisions' timestamps and one hunk replacing the changed line
+  '''
+
+  revision_diff = document_store_actions.get_revision_diff("document title B", "2023-03-22 14:12:00.00", "2023-03-22 14:15:00.00")
+
+  assert revision_diff == (
+    "document title B",
+    "2023-03-22 14:10:00.000000",
+    "2023-03-22 14:15:00.000000",
+    [( 1, 1, 1, 1, ["-document text content (revision 1)", "+document text content (revision 2)"], )]
+  )
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revision_diff_caches_diffs_between_historical_revisions(document_store_actions):
+  '''
+  Given a title with two revisions
+  When we diff its first revision with itself twice and then with the latest revision twice
+  Then we expect only the diff between historical revisions to be cached
+  '''
+
+  for _ in range(2):
+    document_store_actions.get_revision_diff("document title B", "2023-03-22 14:10:00.00", "2023-03-22 14:10:00.00")
+    document_store_actions.get_revision_diff("document title B", "2023-03-22 14:10:00.00", "2023-03-22 14:15:00.00")
+
+  diff_cache_stats = document_store_actions.diff_cache.stats()
+  assert diff_cache_stats["hits"] == 1
+  assert diff_cache_stats["entries"] == 1
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revision_diff_raises_errors_for_missing_revisions(document_store_actions):
+  '''
+  Given a title with two revisions
+  When we ask for a diff from before its first revision or of an unknown title
+  Then we expect NoDocumentCreatedAtTimestamp and TitleNotFound
+  '''
+
+  with pytest.raises(NoDocumentCreatedAtTimestamp):
+    document_store_actions.get_revision_diff("document title B", "2023-03-22 14:00:00.00", "2023-03-22 14:15:00.00")
+  with pytest.raises(TitleNotFound):
+    document_store_actions.get_revision_diff("document title Z", "2023-03-22 14:00:00.00", "2023-03-22 14:15:00.00")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_title_summaries_sorts_by_recent_activity(document_store_actions):
+  '''
+  Given two titles, the second one edited last
+  When we ask for the title summaries sorted by recent activity and by title
+  Then we expect each title's last modification time and revision count in that order
+  '''
+
+  assert document_store_actions.get_title_summaries("recent") == [
+    ( "document title B", "2023-03-22 14:15:00.000000", 2, ),
+    ( "document title A", "2023-03-22 14:00:00.000000", 1, )
+  ]
+  assert [title_summary.title for title_summary in document_store_actions.get_title_summaries("title", limit=1)] == ["document title A"]
+  with pytest.raises(ValueError):
+    document_store_actions.get_title_summaries("size")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_latest_revision_follows_posts_and_batches(document_store_actions):
+  '''
+  Given a title with two revisions
+  When we post a new revision, then a batch with a backdated one
+  Then we expect the latest revision to stay the newest one
+  '''
+
+  document_store_actions.post_new_document_revision("document title B", "2023-03-22 14:30:00.00", "document text content (revision 3)")
+  document_store_actions.post_document_revisions(
+    [{"title": "document title B", "content": "backdated revision", "timestamp": "2023-03-22 14:05:00.00"}],
+    "2023-03-22 14:40:00.00"
+  )
+  document_store_actions.cache.clear()
+
+  assert document_store_actions.get_latest_document_revision("document title B")[2] == "document text content (revision 3)"
+  assert document_store_actions.get_title_summaries()[1].revision_count == 4
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revision_history_returns_the_revisions_within_a_window(document_store_actions):
+  '''
+  Given a title with two revisions
+  When we ask for its history with and without bounds
+  Then we expect only the revisions created within the window, bounds included
+  '''
+
+  assert document_store_actions.get_revision_history("document title B", "2023-03-22 14:15:00.00") == [
+    ( "document title B", "2023-03-22 14:15:00.000000", "document text content (revision 2)", )
+  ]
+  assert [revision[1] for revision in document_store_actions.get_revision_history("document title B", to_timestamp="2023-03-22 14:10:00.00", include_content=False)] == [
+    "2023-03-22 14:10:00.000000"
+  ]
+  assert len(document_store_actions.get_revision_history("document title B")) == 2
+  with pytest.raises(TitleNotFound):
+    document_store_actions.get_revision_history("unknown title")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_revision_history_aggregates_revisions_per_bucket(document_store_actions):
+  '''
+  Given two titles with revisions an hour apart
+  When we ask for a title's history in hourly and daily buckets
+  Then we expect each bucket's revision count and content length statistics
+  '''
+
+  document_store_actions.post_new_document_revision("document title B", "2023-03-22 15:30:00.00", "longer document text content (revision 3)")
+
+  assert document_store_actions.get_revision_history("document title B", bucket="hour") == [
+    ( "2023-03-22 14:00:00.000000", 2, 34, 34, 34, ),
+    ( "2023-03-22 15:00:00.000000", 1, 41, 41, 41, )
+  ]
+  assert document_store_actions.get_revision_history("document title B", "2023-03-22 14:15:00.00", bucket="day") == [
+    ( "2023-03-22 00:00:00.000000", 2, 34, 38, 41, )
+  ]
+  with pytest.raises(ValueError):
+    document_store_actions.get_revision_history("document title B", bucket="week")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_changes_pages_through_revisions_of_every_title(document_store_actions):
+  '''
+  Given three revisions across two titles
+  When we page through the changes since the second one, one revision at a time
+  Then we expect the later revisions in creation order and no cursor after the last page
+  '''
+
+  first_page, changes_cursor = document_store_actions.get_changes("2023-03-22 14:10:00.00", limit=1)
+  second_page, changes_cursor = document_store_actions.get_changes(limit=1, changes_cursor=changes_cursor)
+  last_page, last_cursor = document_store_actions.get_changes(limit=1, changes_cursor=changes_cursor)
+
+  assert [( change.title, change.creation_timestamp, change.content_length, ) for change in first_page + second_page] == [
+    ( "document title B", "2023-03-22 14:10:00.000000", 34, ),
+    ( "document title B", "2023-03-22 14:15:00.000000", 34, )
+  ]
+  assert last_page == [] and last_cursor is None
+  assert len(document_store_actions.get_changes()[0]) == 3
+  with pytest.raises(ValueError):
+    document_store_actions.get_changes(changes_cursor="not a cursor")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_change_log_returns_entries_after_a_sequence_number(document_store_actions):
+  '''
+  Given three logged revisions
+  When we read the change log after the first entry, one entry at a time
+  Then we expect the next revision and then the last one
+  '''
+
+  first_entry = document_store_actions.get_change_log(limit=1)[0]
+  second_entry = document_store_actions.get_change_log(first_entry.sequence, limit=1)[0]
+  remaining_entries = document_store_actions.get_change_log(second_entry.sequence)
+
+  assert first_entry.title == "document title A"
+  assert second_entry.sequence > first_entry.sequence
+  assert [( entry.title, entry.creation_timestamp, entry.content_length, ) for entry in remaining_entries] == [
+    ( "document title B", "2023-03-22 14:15:00.000000", 34, )
+  ]
+  assert document_store_actions.get_change_log(remaining_entries[-1].sequence) == []
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_get_change_log_waits_for_the_next_write(document_store_actions):
+  '''
+  Given a reader waiting on the change log after its last entry
+  When another thread posts a new revision
+  Then we expect the reader to wake up with that revision long before its wait ends
+  '''
+
+  last_sequence = document_store_actions.get_change_log()[-1].sequence
+  writer = threading.Timer(0.1, document_store_actions.post_new_document_revision, ( "document title B", "2023-03-22 14:30:00.00", "new content", ))
+
+  start = time.monotonic()
+  writer.start()
+  entries = document_store_actions.get_change_log(last_sequence, wait=10)
+  writer.join()
+
+  assert [( entry.title, entry.creation_timestamp, ) for entry in entries] == [( "document title B", "2023-03-22 14:30:00.000000", )]
+  assert time.monotonic() - start < 5
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_external_write_detection_keeps_caches_across_request_threads(monkeypatch):
+  '''
+  Given an instance that detects writes made by other processes
+  When twenty short-lived threads each ask for title suggestions, and then another connection writes
+  Then we expect the titles to be loaded once, and the written title to be added to the loaded index
+  '''
+
+  document_store_actions = DocumentStoreActions(database_name, detect_external_writes=True)
+  loads = []
+  load = document_store_actions.title_index.load
+  monkeypatch.setattr(document_store_actions.title_index, "load", lambda: loads.append(1) or load())
+
+  def suggest():
+    return document_store_actions.suggest_titles("document")
+
+  for _ in range(20):
+    thread = threading.Thread(target=suggest)
+    thread.start()
+    thread.join()
+  loads_before_write = len(loads)
+
+  with sqlite3.connect(database_name) as conn:
+    conn.execute("INSERT INTO titles (title) VALUES ('document title C')")
+
+  assert suggest()["suggestions"] == ["document title A", "document title B", "document title C"]
+  assert loads_before_write == 1
+  assert len(loads) == 1
@@ -0,0 +1,114 @@
+import os
+import pytest
+import threading
+import time
+
+from src.document_store_actions import DocumentStoreActions
+from src.exceptions import NoChangesDetected
+from src.group_commit import GroupCommitQueue
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( f"document title {index}", "2023-03-22 14:00:00.00", "document text content", )
+    for index in range(8)
+  ]
+
+def test_group_commit_queue_coalesces_waiting_requests():
+  '''
+  Given a group commit queue whose first batch is held up
+  When more requests arrive while it commits
+  Then we expect them to be committed together in one later batch
+  '''
+
+  first_batch_started = threading.Event()
+  release_first_batch = threading.Event()
+  batches = []
+
+  def commit_batch(arguments_list):
+    if not batches:
+      first_batch_started.set()
+      release_first_batch.wait()
+    batches.append([arguments[0] for arguments in arguments_list])
+    return [( True, arguments[0] * 2, ) for arguments in arguments_list]
+
+  group_commit = GroupCommitQueue(commit_batch)
+  results = {}
+
+  def submit(value):
+    results[value] = group_commit.submit(value)
+
+  threads = [threading.Thread(target=submit, args=(value,)) for value in range(5)]
+  threads[0].start()
+  first_batch_started.wait()
+  for thread in threads[1:]:
+    thread.start()
+  while group_commit._queue.qsize() < 4:
+    time.sleep(0.001)
+  release_first_batch.set()
+  for thread in threads:
+    thread.join()
+
+  assert batches[0] == [0]
+  assert sorted(batches[1]) == [1, 2, 3, 4]
+  assert results == {0: 0, 1: 2, 2: 4, 3: 6, 4: 8}
+
+def test_group_commit_queue_raises_each_request_own_exception():
+  '''
+  Given a commit function rejecting one request
+  When that request is submitted
+  Then we expect its exception to be raised to the caller
+  '''
+
+  group_commit = GroupCommitQueue(lambda arguments_list: [( False, ValueError("rejected"), )] * len(arguments_list))
+
+  with pytest.raises(ValueError):
+    group_commit.submit("value")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_document_store_actions_with_group_commit_saves_concurrent_posts():
+  '''
+  Given a store with group commit enabled
+  When eight threads post revisions at the same time, one of them unchanged
+  Then we expect the seven changed revisions saved and the unchanged one rejected
+  '''
+
+  document_store_actions = DocumentStoreActions(database_name, group_commit=True)
+  outcomes = {}
+
+  def post(index):
+    content = "document text content" if index == 0 else f"new content {index}"
+    try:
+      outcomes[index] = document_store_actions.post_new_document_revision(f"document title {index}", "2023-03-22 15:00:00.00", content)
+    except NoChangesDetected as error:
+      outcomes[index] = error
+
+  threads = [threading.Thread(target=post, args=(index,)) for index in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert isinstance(outcomes[0], NoChangesDetected)
+  assert all(outcomes[index] == f"New document saved to title: document title {index}" for index in range(1, 8))
+  assert document_store_actions.get_latest_document_revision("document title 3")[2] == "new content 3"
+  assert document_store_actions.group_commit.stats()["requests"] == 8
+
+def test_group_commit_queue_runs_in_a_forked_child():
+  '''
+  Given a group commit queue already used by this process
+  When a forked child submits a request to it
+  Then we expect the child to start its own thread and get the result
+  '''
+
+  group_commit = GroupCommitQueue(lambda arguments_list: [( True, arguments[0] * 2, ) for arguments in arguments_list])
+  assert group_commit.submit(1) == 2
+
+  pid = os.fork()
+  if pid == 0:
+    os._exit(0 if group_commit.submit(2) == 4 else 1)
+
+  _, status = os.waitpid(pid, 0)
+  assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
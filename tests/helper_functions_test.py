@@ -1,4 +1,8 @@
-from src.helper_functions import get_data_from_file
+import pytest
+
+from datetime import datetime
+from src.exceptions import InvalidTimestamp
+from src.helper_functions import format_timestamp, get_data_from_file, to_epoch_microseconds
 
 from unittest.mock import mock_open, patch
 
@@ -8,4 +12,52 @@ def test_get_data_from_file_returns_data():
 
   with patch("builtins.open", mock) as mocked_open:
     assert get_data_from_file("fake_file") == {"data": "data"}
-    mocked_open.assert_called_once_with("fake_file", "r")
\ No newline at end of file
+    mocked_open.assert_called_once_with("fake_file", "r")
+
+def test_to_epoch_microseconds_normalizes_mixed_timestamp_formats():
+  '''
+  Given timestamps written with two and six fractional digits and as a datetime
+  When we pass them to to_epoch_microseconds
+  Then we expect the same integer for the same point in time
+  '''
+
+  expected = 1679493600000000
+
+  assert to_epoch_microseconds("2023-03-22 14:00:00.00") == expected
+  assert to_epoch_microseconds("2023-03-22 14:00:00.000000") == expected
+  assert to_epoch_microseconds(datetime(2023, 3, 22, 14, 0)) == expected
+  assert to_epoch_microseconds(str(expected)) == expected
+  assert to_epoch_microseconds(expected) == expected
+
+def test_to_epoch_microseconds_reads_iso_basic_dates_as_dates():
+  '''
+  Given the ISO basic format date "20230322"
+  When we pass it to to_epoch_microseconds
+  Then we expect the start of that day rather than 20230322 microseconds
+  '''
+
+  assert to_epoch_microseconds("20230322") == to_epoch_microseconds("2023-03-22 00:00:00")
+
+def test_to_epoch_microseconds_raises_invalid_timestamp():
+  '''
+  Given a string that is not a timestamp
+  When we pass it to to_epoch_microseconds
+  Then we expect to raise InvalidTimestamp exception
+  '''
+
+  with pytest.raises(InvalidTimestamp):
+    to_epoch_microseconds("yesterday afternoon")
+
+def test_to_epoch_microseconds_rejects_numbers_that_are_not_plausible_microseconds():
+  '''
+  Given epoch seconds, epoch milliseconds and integers beyond the range of dates
+  When we pass them to to_epoch_microseconds
+  Then we expect to raise InvalidTimestamp exception instead of storing a wrong or unreadable date
+  '''
+
+  for timestamp in [ "1679493600", "1679493600000", "999999999999999999", "99999999999999999999999", 2 ** 63, -2 ** 63 ]:
+    with pytest.raises(InvalidTimestamp):
+      to_epoch_microseconds(timestamp)
+
+def test_format_timestamp_returns_six_fractional_digits():
+  assert format_timestamp(1679493600000123) == "2023-03-22 14:00:00.000123"
@@ -0,0 +1,111 @@
+import os
+import pytest
+import tempfile
+import threading
+
+from src.database_data_handlers import DatabaseManager
+from src.exceptions import NoChangesDetected
+from src.launcher import WriterClient, WriterServer
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( "document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)", )
+  ]
+
+@pytest.fixture
+def writer_server(setup_test_db_with_data):
+  writer_server = WriterServer(os.path.join(tempfile.mkdtemp(), "writer.sock"), b"test authkey", database_name)
+  threading.Thread(target=writer_server.serve_forever, daemon=True).start()
+
+  return writer_server
+
+@pytest.fixture
+def writer_client(writer_server):
+  return WriterClient(writer_server.address, writer_server.authkey)
+
+def test_writer_client_saves_revisions_through_the_writer(setup_test_db_with_data, writer_client):
+  '''
+  Given a writer server running on a Unix socket
+  When a worker posts a new revision through a WriterClient
+  Then we expect the writer to save it
+  '''
+
+  result = writer_client.post_new_document_revision("document title B", "2023-03-22 14:20:00.00", "document text content (revision 2)")
+
+  rows = setup_test_db_with_data.execute("SELECT COUNT(*) FROM documents_metadata").fetchone()
+
+  assert result == "New document saved to title: document title B"
+  assert rows == (2,)
+
+def test_writer_client_raises_the_writers_exceptions(writer_client):
+  '''
+  Given a writer server running on a Unix socket
+  When a worker posts content that is the same as the latest revision
+  Then we expect the writer's NoChangesDetected exception to be raised in the worker
+  '''
+
+  with pytest.raises(NoChangesDetected):
+    writer_client.post_new_document_revision("document title B", "2023-03-22 14:20:00.00", "document text content (revision 1)")
+
+def test_writer_group_commits_concurrent_posts_from_a_worker(setup_test_db_with_data, writer_server, writer_client):
+  '''
+  Given a writer server running on a Unix socket
+  When a worker posts revisions of five titles from five threads at once
+  Then we expect every revision to be saved through the writer's group commit
+  '''
+
+  for number in range(5):
+    DatabaseManager(database_name).save_data_to_db(f"title {number}", "2023-03-22 14:10:00.00", "revision 1")
+
+  results = []
+  threads = [
+    threading.Thread(target=lambda number=number: results.append(
+      writer_client.post_new_document_revision(f"title {number}", "2023-03-22 14:20:00.00", "revision 2")
+    ))
+    for number in range(5)
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert len(results) == 5
+  assert writer_server.document_store_actions.group_commit.stats()["requests"] == 5
+
+def test_writer_saves_batches_on_its_group_commit_thread(writer_server, writer_client):
+  '''
+  Given a writer server running on a Unix socket
+  When a worker posts three batches and three single revisions from six threads at once
+  Then we expect every revision to be saved, the batches through the same group commit thread as the single posts
+  '''
+
+  for number in range(3):
+    DatabaseManager(database_name).save_data_to_db(f"title {number}", "2023-03-22 14:10:00.00", "revision 1")
+
+  results = []
+  threads = [
+    threading.Thread(target=lambda number=number: results.append(
+      writer_client.post_new_document_revision(f"title {number}", "2023-03-22 14:20:00.00", "revision 2")
+    ))
+    for number in range(3)
+  ] + [
+    threading.Thread(target=lambda number=number: results.append(
+      writer_client.post_document_revisions([{"title": f"batch title {number}", "content": "revision 1"}], "2023-03-22 14:20:00.00")
+    ))
+    for number in range(3)
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert sorted(str(result) for result in results if isinstance(result, str)) == [
+    "New document saved to title: title 0",
+    "New document saved to title: title 1",
+    "New document saved to title: title 2"
+  ]
+  assert all(result[0]["saved"] for result in results if isinstance(result, list))
+  assert writer_server.document_store_actions.group_commit.stats()["requests"] == 6
@@ -0,0 +1,66 @@
+from src.lru_cache import LRUCache
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+  '''
+  Given a cache limited to two entries
+  When we add a third entry after reading the first one
+  Then we expect the second entry to be evicted
+  '''
+
+  cache = LRUCache(max_entries=2)
+  cache.set("first", "value 1")
+  cache.set("second", "value 2")
+  cache.get("first")
+  cache.set("third", "value 3")
+
+  assert cache.get("first") == "value 1"
+  assert cache.get("second") is None
+  assert cache.get("third") == "value 3"
+  assert cache.stats()["evictions"] == 1
+
+def test_lru_cache_respects_the_byte_limit():
+  '''
+  Given a cache limited in bytes
+  When we add entries that together go over the limit
+  Then we expect older entries to be evicted to stay under it
+  '''
+
+  cache = LRUCache(max_entries=100, max_bytes=1000)
+  for key in range(10):
+    cache.set(key, "x" * 200)
+
+  stats = cache.stats()
+
+  assert stats["bytes"] <= 1000
+  assert stats["entries"] < 10
+  assert cache.get(9) == "x" * 200
+
+def test_lru_cache_counts_hits_and_misses():
+  '''
+  Given a cache with one entry
+  When we read that entry and a missing one
+  Then we expect one hit and one miss to be counted
+  '''
+
+  cache = LRUCache()
+  cache.set("key", "value")
+  cache.get("key")
+  cache.get("missing key")
+
+  assert cache.stats()["hits"] == 1
+  assert cache.stats()["misses"] == 1
+
+def test_lru_cache_fill_is_skipped_after_a_write():
+  '''
+  Given the cache generation read before a database read
+  When the key is set before the value read is filled in
+  Then we expect the fill to be skipped and the set value to stay cached
+  '''
+
+  cache = LRUCache()
+  generation = cache.generation()
+  cache.set("latest", "value 2")
+
+  assert not cache.fill("latest", "value 1", generation)
+  assert cache.get("latest") == "value 2"
+  assert cache.fill("other", "value 3", cache.generation())
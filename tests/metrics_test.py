@@ -0,0 +1,85 @@
+import logging
+import sqlite3
+
+from src.metrics import Histogram
+from src.query_metrics import InstrumentedConnection, set_row_timing, set_slow_query_threshold, slow_query_threshold, statement_label
+
+def test_histogram_renders_cumulative_buckets_per_label():
+  '''
+  Given a histogram with two buckets
+  When we observe three values for one label
+  Then we expect cumulative bucket counts, the sum and the count in the Prometheus format
+  '''
+
+  histogram = Histogram("test_seconds", "Test histogram", ( "route", ), ( 0.1, 1, ))
+  histogram.observe(0.05, "/documents")
+  histogram.observe(0.5, "/documents")
+  histogram.observe(5, "/documents")
+
+  assert histogram.render().splitlines() == [
+    "# HELP test_seconds Test histogram",
+    "# TYPE test_seconds histogram",
+    'test_seconds_bucket{route="/documents",le="0.1"} 1',
+    'test_seconds_bucket{route="/documents",le="1"} 2',
+    'test_seconds_bucket{route="/documents",le="+Inf"} 3',
+    'test_seconds_sum{route="/documents"} 5.55',
+    'test_seconds_count{route="/documents"} 3'
+  ]
+
+def test_statement_label_keeps_the_verb_and_first_table():
+  '''
+  Given SQL statements of different kinds
+  When we label them
+  Then we expect the verb followed by the first table they name
+  '''
+
+  assert statement_label("SELECT title FROM titles WHERE title = ?") == "SELECT titles"
+  assert statement_label("\n  INSERT INTO documents_data VALUES (?, ?)") == "INSERT documents_data"
+  assert statement_label("PRAGMA user_version = 3") == "PRAGMA user_version"
+  assert statement_label("BEGIN IMMEDIATE") == "BEGIN"
+
+def test_slow_queries_are_logged_with_their_sql_and_rows(caplog):
+  '''
+  Given a slow query threshold of zero
+  When a connection runs a query returning two rows
+  Then we expect the query in the slow query log with its row count
+  '''
+
+  previous_threshold = slow_query_threshold
+  set_slow_query_threshold(0)
+  try:
+    conn = sqlite3.connect(":memory:", factory=InstrumentedConnection)
+    with caplog.at_level(logging.WARNING, logger="wiki.slow_queries"):
+      cursor = conn.cursor()
+      assert cursor.execute("SELECT 1 UNION ALL SELECT 2").fetchall() == [( 1, ), ( 2, )]
+      cursor.close()
+    conn.close()
+  finally:
+    set_slow_query_threshold(previous_threshold)
+
+  assert "returned 2 rows: SELECT 1 UNION ALL SELECT 2" in caplog.text
+
+def test_rows_read_by_iterating_a_cursor_are_counted_only_with_row_timing(caplog):
+  '''
+  Given a slow query threshold of zero
+  When a connection iterates a query returning two rows, without and then with row timing
+  Then we expect the rows to be counted only with row timing
+  '''
+
+  previous_threshold = slow_query_threshold
+  set_slow_query_threshold(0)
+  try:
+    conn = sqlite3.connect(":memory:", factory=InstrumentedConnection)
+    with caplog.at_level(logging.WARNING, logger="wiki.slow_queries"):
+      for enabled in [ False, True ]:
+        set_row_timing(enabled)
+        cursor = conn.cursor()
+        assert list(cursor.execute("SELECT 1 UNION ALL SELECT 2")) == [( 1, ), ( 2, )]
+        cursor.close()
+    conn.close()
+  finally:
+    set_row_timing(False)
+    set_slow_query_threshold(previous_threshold)
+
+  assert "returned 0 rows: SELECT 1 UNION ALL SELECT 2" in caplog.text
+  assert "returned 2 rows: SELECT 1 UNION ALL SELECT 2" in caplog.text
@@ -0,0 +1,268 @@
+import pytest
+import sqlite3
+
+from src.connection_pool import get_connection_pool
+from src.helper_functions import hash_content
+from src.migrations import LATEST_SCHEMA_VERSION, get_schema_version, run_migrations
+from src.sqlite import SqliteDB
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def setup_legacy_test_db():
+  # Create test_db file if one doesn't exist yet
+  conn = sqlite3.connect(database_name)
+  cursor = conn.cursor()
+
+  # Recreate the tables as they were before any migration existed
+  try:
+    cursor.execute("DROP TABLE IF EXISTS titles")
+    cursor.execute("DROP TABLE IF EXISTS documents_metadata")
+    cursor.execute("DROP TABLE IF EXISTS documents_data")
+    cursor.execute("CREATE TABLE titles (title_id TEXT PRIMARY KEY NOT NULL, title TEXT UNIQUE NOT NULL)")
+    cursor.execute("CREATE TABLE documents_metadata (document_id TEXT PRIMARY KEY NOT NULL, creation_timestamp TEXT NOT NULL, title_id TEXT NOT NULL)")
+    cursor.execute("CREATE TABLE documents_data (document_id TEXT PRIMARY KEY NOT NULL, document_content TEXT NOT NULL)")
+    cursor.execute("PRAGMA user_version = 0")
+    conn.commit()
+  except sqlite3.Error as error:
+    print(error)
+    conn.rollback()
+
+  yield conn
+
+  conn.close()
+
+@pytest.fixture
+def connection_pool():
+  return get_connection_pool(database_name)
+
+@pytest.mark.usefixtures("setup_legacy_test_db")
+def test_run_migrations_upgrades_an_existing_database_in_place(connection_pool):
+  '''
+  Given a database created before migrations existed
+  When we call run_migrations on it
+  Then we expect every migration to be applied and the revision lookup index to exist
+  '''
+
+  applied_versions = run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    schema_version = get_schema_version(cursor)
+    index_names = [row[0] for row in cursor.execute(
+      "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'documents_metadata'"
+    )]
+
+  assert applied_versions[-1] == LATEST_SCHEMA_VERSION
+  assert schema_version == LATEST_SCHEMA_VERSION
+  assert "documents_metadata_title_id_creation_timestamp" in index_names
+
+@pytest.mark.usefixtures("setup_legacy_test_db")
+def test_run_migrations_does_nothing_on_an_up_to_date_database(connection_pool):
+  '''
+  Given a database that is already at the latest schema version
+  When we call run_migrations on it again
+  Then we expect no migration to be applied
+  '''
+
+  run_migrations(connection_pool)
+
+  assert run_migrations(connection_pool) == []
+
+@pytest.mark.usefixtures("setup_legacy_test_db")
+def test_database_setup_brings_a_new_database_to_the_latest_version(connection_pool):
+  '''
+  Given an empty database
+  When we call database_setup on it
+  Then we expect the schema to be at the latest version
+  '''
+
+  with connection_pool.cursor() as cursor:
+    cursor.execute("DROP TABLE titles")
+    cursor.execute("DROP TABLE documents_metadata")
+    cursor.execute("DROP TABLE documents_data")
+
+  SqliteDB(database_name).database_setup()
+
+  with connection_pool.cursor() as cursor:
+    assert get_schema_version(cursor) == LATEST_SCHEMA_VERSION
+
+@pytest.mark.usefixtures("setup_legacy_test_db")
+def test_point_in_time_lookup_uses_an_index_seek(connection_pool):
+  '''
+  Given a migrated database
+  When we ask SQLite for the plan of a point-in-time revision lookup
+  Then we expect it to search the revision lookup index rather than scan the table
+  '''
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    plan = cursor.execute("""
+      EXPLAIN QUERY PLAN
+      SELECT document_id, creation_timestamp FROM documents_metadata
+      WHERE title_id = ? AND creation_timestamp <= ?
+      ORDER BY creation_timestamp DESC LIMIT 1
+      """, ( "title id", 1679493600000000, )
+    ).fetchall()
+
+  plan_details = " ".join(row[3] for row in plan)
+
+  assert "SEARCH documents_metadata USING COVERING INDEX documents_metadata_title_id_creation_timestamp" in plan_details
+
+def test_run_migrations_converts_text_timestamps_to_integers(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with revisions whose timestamps were stored as text in mixed formats
+  When we call run_migrations on it
+  Then we expect every timestamp to be stored as integer microseconds since the epoch
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 1', '2023-03-22 14:00:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 2', '2023-03-22 14:00:00.500000', 'title id')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 1', 'content 1')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 2', 'content 2')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    rows = cursor.execute("""
+      SELECT document_uuid, creation_timestamp, typeof(creation_timestamp) FROM documents_metadata
+      ORDER BY creation_timestamp
+    """).fetchall()
+
+  assert rows == [
+    ('document 1', 1679493600000000, 'integer'),
+    ('document 2', 1679493600500000, 'integer')
+  ]
+
+def test_run_migrations_backfills_content_hashes(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with revisions saved before content hashes existed
+  When we call run_migrations on it
+  Then we expect every revision to get the hash of its content
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 1', '2023-03-22 14:00:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 1', 'content 1')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    content_hash = cursor.execute("SELECT content_hash FROM documents_metadata").fetchone()[0]
+
+  assert content_hash == hash_content("content 1")
+
+def test_run_migrations_backfills_title_heads(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with a title saved with two revisions before title_heads existed
+  When we call run_migrations on it
+  Then we expect the title's head to point at its latest revision and count both
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO titles VALUES ('title id', 'title')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 1', '2023-03-22 14:00:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 2', '2023-03-22 14:05:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 1', 'content 1')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 2', 'content 2')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    title_heads = cursor.execute("""
+      SELECT title, document_uuid, title_heads.content_hash, revision_count FROM title_heads
+      INNER JOIN titles ON titles.title_id = title_heads.title_id
+      INNER JOIN documents_metadata ON documents_metadata.document_id = title_heads.document_id
+    """).fetchall()
+
+  assert title_heads == [( "title", "document 2", hash_content("content 2"), 2, )]
+
+def test_run_migrations_replaces_uuid_keys_with_integer_keys(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with a title and two revisions keyed by UUID strings
+  When we call run_migrations on it
+  Then we expect integer keys in creation order, the revision UUIDs kept as document_uuid and the search index still pointing at the latest revision
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO titles VALUES ('c0a8e7d2-title', 'title')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('f1e2-document-2', '2023-03-22 14:05:00.00', 'c0a8e7d2-title')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('a9b8-document-1', '2023-03-22 14:00:00.00', 'c0a8e7d2-title')")
+  cursor.execute("INSERT INTO documents_data VALUES ('f1e2-document-2', 'searchable content 2')")
+  cursor.execute("INSERT INTO documents_data VALUES ('a9b8-document-1', 'searchable content 1')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    revisions = cursor.execute("""
+      SELECT title, documents_metadata.document_id, document_uuid, document_content FROM documents_metadata
+      INNER JOIN titles ON titles.title_id = documents_metadata.title_id
+      INNER JOIN documents_data ON documents_data.document_id = documents_metadata.document_id
+      ORDER BY documents_metadata.document_id
+    """).fetchall()
+    search_document_ids = cursor.execute("SELECT document_id FROM search_documents").fetchall()
+
+  assert revisions == [
+    ( "title", 1, "a9b8-document-1", "searchable content 1", ),
+    ( "title", 2, "f1e2-document-2", "searchable content 2", )
+  ]
+  assert search_document_ids == [( 2, )]
+
+def test_run_migrations_backfills_content_lengths(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with revisions saved before content lengths existed
+  When we call run_migrations on it
+  Then we expect every revision to get the length of its content and the changes feed to use an index
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO titles VALUES ('title id', 'title')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 1', '2023-03-22 14:00:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 1', 'content 1')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    content_length = cursor.execute("SELECT content_length FROM documents_metadata").fetchone()[0]
+    plan = cursor.execute("""
+      EXPLAIN QUERY PLAN
+      SELECT document_id FROM documents_metadata
+      WHERE (creation_timestamp, document_id) > (?, ?)
+      ORDER BY creation_timestamp, document_id LIMIT 10
+      """, ( 1679493600000000, 0, )
+    ).fetchall()
+
+  assert content_length == len("content 1")
+  assert "documents_metadata_creation_timestamp" in " ".join(row[3] for row in plan)
+
+def test_run_migrations_logs_existing_revisions_in_creation_order(setup_legacy_test_db, connection_pool):
+  '''
+  Given a database with two revisions saved before the change log existed, the newer one first
+  When we call run_migrations on it
+  Then we expect both revisions in the change log, the older one first
+  '''
+
+  cursor = setup_legacy_test_db.cursor()
+  cursor.execute("INSERT INTO titles VALUES ('title id', 'title')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 2', '2023-03-22 14:05:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_metadata VALUES ('document 1', '2023-03-22 14:00:00.00', 'title id')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 2', 'content 2')")
+  cursor.execute("INSERT INTO documents_data VALUES ('document 1', 'content 1')")
+  setup_legacy_test_db.commit()
+
+  run_migrations(connection_pool)
+
+  with connection_pool.cursor() as cursor:
+    logged_revisions = cursor.execute("""
+      SELECT document_uuid FROM change_log
+      INNER JOIN documents_metadata ON documents_metadata.document_id = change_log.document_id
+      ORDER BY sequence
+    """).fetchall()
+
+  assert logged_revisions == [( "document 1", ), ( "document 2", )]
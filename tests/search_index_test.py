@@ -0,0 +1,86 @@
+import pytest
+
+from src.connection_pool import get_connection_pool
+from src.document_store_actions import DocumentStoreActions
+from src.search_index import ALL_MODE, to_match_expression
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( "Earth", "2023-03-22 14:00:00.00", "The third planet from the sun", ),
+    ( "Mars", "2023-03-22 14:10:00.00", "A red planet with two moons", ),
+    ( "Mars", "2023-03-22 14:15:00.00", "The fourth planet from the sun", ),
+    ( "Moon", "2023-03-22 14:20:00.00", "Orbits the Earth", )
+  ]
+
+@pytest.fixture
+def document_store_actions():
+  return DocumentStoreActions(database_name)
+
+def test_to_match_expression_quotes_every_word():
+  '''
+  Given a free text query with FTS5 syntax characters
+  When we convert it to a match expression
+  Then we expect each word quoted and a trailing * kept as a prefix search
+  '''
+
+  assert to_match_expression('red "planet plan*') == '"red" """planet" "plan"*'
+  assert to_match_expression("  * ") == ""
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_search_documents_only_matches_the_latest_revision(document_store_actions):
+  '''
+  Given a title whose older revision mentions moons
+  When we search for "moons" and for "fourth"
+  Then we expect only the latest revision's words to match
+  '''
+
+  assert document_store_actions.search_documents("moons") == []
+  assert document_store_actions.search_documents("fourth") == [
+    ( "Mars", "2023-03-22 14:15:00.000000", "The [fourth] planet from the sun", )
+  ]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_search_documents_ranks_title_matches_first_and_paginates(document_store_actions):
+  '''
+  Given "Earth" as a title and as a word in another title's content
+  When we search for "earth" one result at a time
+  Then we expect the title match on the first page and the content match on the second
+  '''
+
+  first_page = document_store_actions.search_documents("earth", limit=1)
+  second_page = document_store_actions.search_documents("earth", limit=1, offset=1)
+
+  assert [result.title for result in first_page] == ["Earth"]
+  assert [result.title for result in second_page] == ["Moon"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_post_new_document_revision_updates_the_search_index(document_store_actions):
+  '''
+  Given an indexed title
+  When we post a new revision with different words
+  Then we expect searches to match the new words and not the old ones
+  '''
+
+  document_store_actions.post_new_document_revision("Earth", "2023-03-22 15:00:00.00", "Home planet")
+
+  assert [result.title for result in document_store_actions.search_documents("home")] == ["Earth"]
+  assert document_store_actions.search_documents("third") == []
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_search_index_in_all_mode_matches_every_revision(document_store_actions):
+  '''
+  Given the search index rebuilt in "all" mode
+  When we search for a word of an older revision
+  Then we expect that revision to match
+  '''
+
+  with get_connection_pool(database_name).transaction() as cursor:
+    document_store_actions.search_index.rebuild(cursor, ALL_MODE)
+
+  assert document_store_actions.search_documents("moons") == [
+    ( "Mars", "2023-03-22 14:10:00.000000", "A red planet with two [moons]", )
+  ]
+  assert len(document_store_actions.search_documents("planet")) == 3
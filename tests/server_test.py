@@ -0,0 +1,471 @@
+import gzip
+import json
+import os
+import pytest
+import time
+
+from datetime import datetime, timezone
+
+import server
+from src.document_store_actions import DocumentStoreActions
+from src.exceptions import ConnectionPoolExhausted
+from src.helper_functions import to_epoch_microseconds
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( "document title A", "2023-03-22 14:00:00.00", "document text content A", ),
+    ( "document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)", ),
+    ( "document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)", ),
+    ( "document title B", "2023-03-22 14:20:00.00", "document text content (revision 3)", )
+  ]
+
+@pytest.fixture
+def client(monkeypatch, setup_test_db_with_data):
+  monkeypatch.setattr(server, "document_store_actions", DocumentStoreActions(database_name))
+  return server.app.test_client()
+
+def test_get_documents_route_returns_pages_with_a_next_cursor(client):
+  '''
+  Given a title with three revisions
+  When we request the revisions with limit=2 and then with the returned cursor
+  Then we expect two pages that together hold every revision
+  '''
+
+  first_page = client.get("/documents/document title B?limit=2")
+  next_cursor = first_page.headers["X-Next-Cursor"]
+  second_page = client.get(f"/documents/document title B?limit=2&cursor={next_cursor}")
+
+  assert [document[2] for document in first_page.get_json()] == [
+    "document text content (revision 1)",
+    "document text content (revision 2)"
+  ]
+  assert [document[2] for document in second_page.get_json()] == ["document text content (revision 3)"]
+  assert "X-Next-Cursor" not in second_page.headers
+
+def test_get_documents_route_rejects_negative_limits_and_bad_cursors(client):
+  '''
+  Given a title with three revisions
+  When we request its revisions with a negative limit, streamed or not, or with a cursor that isn't one
+  Then we expect 400 for each rather than every or no revision
+  '''
+
+  assert client.get("/documents/document title B?limit=-1").status_code == 400
+  assert client.get("/documents/document title B?limit=-1&stream=true").status_code == 400
+  assert client.get("/documents/document title B?cursor=2023-03-22 14:10:00").status_code == 400
+
+def test_get_documents_route_streams_metadata_only(client):
+  '''
+  Given a title with three revisions
+  When we request a streamed, metadata only listing
+  Then we expect a JSON array of timestamps and revision ids without content
+  '''
+
+  response = client.get("/documents/document title B?metadata_only=true&stream=true")
+  documents = json.loads(response.get_data(as_text=True))
+
+  assert [document[1] for document in documents] == [
+    "2023-03-22 14:10:00.000000",
+    "2023-03-22 14:15:00.000000",
+    "2023-03-22 14:20:00.000000"
+  ]
+  assert "document text content (revision 1)" not in response.get_data(as_text=True)
+
+def test_get_latest_revision_route_returns_a_json_array(client):
+  '''
+  Given a title with three revisions
+  When we request its latest revision
+  Then we expect a JSON array of title, timestamp and content
+  '''
+
+  response = client.get("/documents/document title B/latest")
+
+  assert response.mimetype == "application/json"
+  assert response.get_json() == ["document title B", "2023-03-22 14:20:00.000000", "document text content (revision 3)"]
+
+def test_search_route_returns_ranked_results_with_snippets(client):
+  '''
+  Given a title with three revisions
+  When we search for a word of its latest revision
+  Then we expect a JSON array of [title, timestamp, snippet] results
+  '''
+
+  response = client.get("/search?q=revision&limit=5")
+
+  assert response.get_json() == [
+    ["document title B", "2023-03-22 14:20:00.000000", "document text content ([revision] 3)"]
+  ]
+
+def test_suggest_titles_route_returns_matching_titles(client):
+  '''
+  Given titles "document title A" and "document title B"
+  When we ask for suggestions for an upper case prefix of them
+  Then we expect both titles among the suggestions
+  '''
+
+  response = client.get("/titles/suggest?prefix=DOCUMENT")
+
+  assert response.get_json() == {"suggestions": ["document title A", "document title B"], "match": None, "did_you_mean": []}
+
+def test_historical_revision_route_sends_an_etag_and_honours_if_none_match(client):
+  '''
+  Given a title with three revisions
+  When we request a revision that has a newer one, then again with its ETag
+  Then we expect a Cache-Control that asks for revalidation and then a 304 without a body
+  '''
+
+  first_response = client.get("/documents/document title B/2023-03-22 14:12:00.00")
+  second_response = client.get(
+    "/documents/document title B/2023-03-22 14:13:00.00",
+    headers={"If-None-Match": first_response.headers["ETag"]}
+  )
+
+  assert first_response.status_code == 200
+  assert first_response.headers["Cache-Control"] == "no-cache"
+  assert first_response.headers["Last-Modified"] == "Wed, 22 Mar 2023 14:10:00 GMT"
+  assert second_response.status_code == 304
+  assert second_response.get_data() == b""
+
+def test_historical_revision_route_etag_changes_after_a_backdated_write(client):
+  '''
+  Given the ETag of a title's revision as it was at 14:12
+  When a batch saves a revision created at 14:11 and we revalidate the ETag
+  Then we expect the backdated revision with a new ETag rather than a 304
+  '''
+
+  url = "/documents/document title B/2023-03-22 14:12:00.00"
+  etag = client.get(url).headers["ETag"]
+  client.post("/documents:batch", json=[
+    {"title": "document title B", "content": "document text content (revision 1.5)", "timestamp": "2023-03-22 14:11:00.00"}
+  ])
+  response = client.get(url, headers={"If-None-Match": etag})
+
+  assert response.status_code == 200
+  assert response.headers["ETag"] != etag
+  assert response.get_json()[2] == "document text content (revision 1.5)"
+
+def test_latest_revision_route_etag_changes_after_a_post(client):
+  '''
+  Given the ETag of a title's latest revision
+  When we revalidate it before and after posting a new revision
+  Then we expect a 304 first and then the new revision with a new ETag
+  '''
+
+  etag = client.get("/documents/document title B/latest").headers["ETag"]
+  not_modified_response = client.get("/documents/document title B/latest", headers={"If-None-Match": etag})
+  client.post("/documents/document title B", json={"content": "document text content (revision 4)"})
+  modified_response = client.get("/documents/document title B/latest", headers={"If-None-Match": etag})
+
+  assert not_modified_response.status_code == 304
+  assert not_modified_response.headers["Cache-Control"] == "no-cache"
+  assert modified_response.status_code == 200
+  assert modified_response.headers["ETag"] != etag
+  assert modified_response.get_json()[2] == "document text content (revision 4)"
+
+def test_latest_revision_route_etag_uses_the_stored_content_hash(monkeypatch, client):
+  '''
+  Given a title's latest revision, read once from the database and once from the cache
+  When we request it while hashing response content fails
+  Then we expect the same ETag both times, built from the content hash stored with the revision
+  '''
+
+  def hash_content(content):
+    raise AssertionError("The latest revision's content was hashed")
+
+  monkeypatch.setattr("src.http_caching.hash_content", hash_content)
+
+  etags = [client.get("/documents/document title B/latest").headers["ETag"] for _ in range(2)]
+
+  assert etags[0] == etags[1]
+
+def test_posted_revisions_are_timestamped_in_utc_whatever_the_local_time_zone(monkeypatch, client):
+  '''
+  Given a server running in the Asia/Tokyo time zone
+  When we post a new revision
+  Then we expect it to be timestamped with the current UTC time
+  '''
+
+  local_time_zone = os.environ.get("TZ")
+  monkeypatch.setenv("TZ", "Asia/Tokyo")
+  time.tzset()
+  try:
+    client.post("/documents/document title B", json={"content": "document text content (revision 4)"})
+  finally:
+    if local_time_zone is None:
+      monkeypatch.delenv("TZ")
+    else:
+      monkeypatch.setenv("TZ", local_time_zone)
+    time.tzset()
+
+  latest_timestamp = to_epoch_microseconds(client.get("/documents/document title B/latest").get_json()[1])
+
+  assert abs(latest_timestamp - to_epoch_microseconds(datetime.now(timezone.utc))) < 60 * 1000000
+
+def test_titles_route_honours_if_none_match(client):
+  '''
+  Given the ETag of the title list
+  When we request the title list with it
+  Then we expect a 304
+  '''
+
+  etag = client.get("/documents").headers["ETag"]
+
+  assert client.get("/documents", headers={"If-None-Match": etag}).status_code == 304
+
+def test_routes_send_gzip_encoded_bodies_when_accepted(client):
+  '''
+  Given a title with a large latest revision
+  When we request it accepting gzip and then revalidate with the returned ETag
+  Then we expect a gzip encoded body and then a 304
+  '''
+
+  large_content = "lorem ipsum dolor sit amet " * 100
+  client.post("/documents/document title B", json={"content": large_content})
+
+  response = client.get("/documents/document title B/latest", headers={"Accept-Encoding": "gzip"})
+  revalidation = client.get("/documents/document title B/latest", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+
+  assert response.headers["Content-Encoding"] == "gzip"
+  assert json.loads(gzip.decompress(response.get_data()))[2] == large_content
+  assert revalidation.status_code == 304
+
+def test_historical_revisions_are_sent_from_their_precompressed_body(monkeypatch, client):
+  '''
+  Given a store that keeps pre-compressed historical revisions
+  When we request the same historical revision twice accepting gzip
+  Then we expect the same gzip body both times and one stored body
+  '''
+
+  document_store_actions = DocumentStoreActions(database_name, precompress_historical=True)
+  monkeypatch.setattr(server, "document_store_actions", document_store_actions)
+
+  responses = [
+    client.get("/documents/document title B/2023-03-22 14:12:00.00", headers={"Accept-Encoding": "gzip"})
+    for _ in range(2)
+  ]
+
+  with document_store_actions.connection_pool.cursor() as cursor:
+    stored_bodies = cursor.execute("""
+      SELECT COUNT(*) FROM precompressed_revisions
+      INNER JOIN documents_metadata ON documents_metadata.document_id = precompressed_revisions.document_id
+    """).fetchone()[0]
+
+  assert responses[0].headers["Content-Encoding"] == "gzip"
+  assert responses[0].get_data() == responses[1].get_data()
+  assert json.loads(gzip.decompress(responses[1].get_data()))[2] == "document text content (revision 1)"
+  assert stored_bodies == 1
+
+def test_batch_route_returns_a_result_per_revision(client):
+  '''
+  Given a title with three revisions
+  When we post a batch with one new and one unchanged revision
+  Then we expect one saved and one rejected result
+  '''
+
+  response = client.post("/documents:batch", json=[
+    {"title": "document title B", "content": "document text content (revision 4)"},
+    {"title": "document title B", "content": "document text content (revision 4)"}
+  ])
+
+  assert [result["saved"] for result in response.get_json()] == [True, False]
+  assert client.post("/documents:batch", json={"title": "not a list"}).status_code == 400
+
+def test_timestamps_outside_the_range_of_dates_are_rejected(client):
+  '''
+  Given a title with three revisions
+  When we post a batch revision and request a revision with timestamps beyond the range of dates
+  Then we expect the revision not to be saved, a 400 for the request and the title to stay readable
+  '''
+
+  response = client.post("/documents:batch", json=[
+    {"title": "document title B", "content": "document text content (revision 4)", "timestamp": "999999999999999999"}
+  ])
+
+  assert response.get_json()[0]["saved"] is False
+  assert client.get("/documents/document title B/99999999999999999999999").status_code == 400
+  assert client.get("/documents/document title B/latest").get_json()[2] == "document text content (revision 3)"
+
+def test_batch_routes_answer_413_for_too_many_items(monkeypatch, client):
+  '''
+  Given batches capped at two items
+  When we post three revisions and read three titles in a batch
+  Then we expect a 413 for both and no revision to be saved
+  '''
+
+  monkeypatch.setattr("src.document_store_actions.MAX_BATCH_SIZE", 2)
+
+  post_response = client.post("/documents:batch", json=[
+    {"title": "document title B", "content": f"document text content (revision {number})"}
+    for number in range(4, 7)
+  ])
+  get_response = client.post("/documents:batch-get", json={"titles": ["document title A", "document title B", "document title C"]})
+
+  assert post_response.status_code == 413
+  assert get_response.status_code == 413
+  assert client.get("/documents/document title B/latest").get_json()[2] == "document text content (revision 3)"
+
+def test_batch_get_route_returns_a_revision_per_title(client):
+  '''
+  Given a title with three revisions
+  When we request it and an unknown title in one batch
+  Then we expect its latest revision and null for the unknown title
+  '''
+
+  response = client.post("/documents:batch-get", json={"titles": ["document title B", "unknown title"]})
+
+  assert response.get_json() == {
+    "document title B": ["document title B", "2023-03-22 14:20:00.000000", "document text content (revision 3)"],
+    "unknown title": None
+  }
+
+def test_metrics_route_exposes_request_and_query_histograms(client):
+  '''
+  Given a request for a title's latest revision
+  When we request the metrics
+  Then we expect Prometheus histograms for the route, its queries and connection acquisition
+  '''
+
+  client.get("/documents/document title B/latest")
+  response = client.get("/metrics")
+
+  assert response.status_code == 200
+  assert response.content_type.startswith("text/plain; version=0.0.4")
+  metrics = response.get_data(as_text=True)
+  assert 'wiki_http_request_duration_seconds_count{method="GET",route="/documents/<title>/latest",status="200"}' in metrics
+  assert 'wiki_sqlite_query_duration_seconds_bucket{statement="SELECT titles",le="+Inf"}' in metrics
+  assert "wiki_sqlite_query_rows_count" in metrics
+  assert "wiki_sqlite_connection_acquire_seconds_count" in metrics
+
+def test_diff_route_returns_the_hunks_between_two_revisions(client):
+  '''
+  Given a title with three revisions
+  When we request the diff between its first and last revisions
+  Then we expect a unified diff hunk, and 400 when a bound is missing or the context is negative
+  '''
+
+  response = client.get("/documents/document title B/diff?from=2023-03-22 14:10:00&to=2023-03-22 14:20:00")
+
+  assert response.get_json() == [
+    "document title B",
+    "2023-03-22 14:10:00.000000",
+    "2023-03-22 14:20:00.000000",
+    [[1, 1, 1, 1, ["-document text content (revision 1)", "+document text content (revision 3)"]]]
+  ]
+  assert client.get("/documents/document title B/diff?from=2023-03-22 14:10:00").status_code == 400
+  assert client.get("/documents/document title B/diff?from=2023-03-22 14:10:00&to=2023-03-22 14:20:00&context=-1").status_code == 400
+
+def test_routes_answer_503_when_no_database_connection_is_free(monkeypatch, client):
+  '''
+  Given a connection pool with every connection held past its acquire timeout
+  When we request the revisions of a title
+  Then we expect a 503 with a Retry-After header
+  '''
+
+  def get_documents_page(*args):
+    raise ConnectionPoolExhausted("No connection was returned in time")
+
+  monkeypatch.setattr(server.document_store_actions, "get_documents_page", get_documents_page)
+
+  response = client.get("/documents/document title B")
+
+  assert response.status_code == 503
+  assert response.headers["Retry-After"] == "1"
+
+def test_posts_answer_503_when_no_database_connection_is_free(monkeypatch, client):
+  '''
+  Given a connection pool with every connection held past its acquire timeout
+  When we post a new revision of a title
+  Then we expect a 503 with a Retry-After header rather than a message saying it wasn't saved
+  '''
+
+  def post_new_document_revision(*args):
+    raise ConnectionPoolExhausted("No connection was returned in time")
+
+  monkeypatch.setattr(server.document_store_actions, "post_new_document_revision", post_new_document_revision)
+
+  response = client.post("/documents/document title B", json={"content": "document text content (revision 4)"})
+
+  assert response.status_code == 503
+  assert response.headers["Retry-After"] == "1"
+
+def test_routes_answer_404_for_unknown_titles_and_revisions(client):
+  '''
+  Given a title whose first revision was created at 14:10
+  When we request an unknown title, and a diff from before the first revision
+  Then we expect a JSON 404 for each, as the ASGI app answers
+  '''
+
+  responses = [
+    client.get("/documents/unknown title/latest"),
+    client.get("/documents/unknown title/2023-03-22 14:10:00"),
+    client.get("/documents/unknown title/history"),
+    client.get("/documents/document title B/diff?from=2023-03-22 14:00:00&to=2023-03-22 14:20:00")
+  ]
+
+  assert [response.status_code for response in responses] == [404, 404, 404, 404]
+  assert all("message" in response.get_json() for response in responses)
+
+def test_titles_route_sorts_by_recent_activity_with_revision_counts(client):
+  '''
+  Given two titles, the second one edited last
+  When we request the titles sorted by recent activity, with and without counts
+  Then we expect the most recently edited title first
+  '''
+
+  assert client.get("/documents?sort=recent").get_json() == ["document title B", "document title A"]
+  assert client.get("/documents?sort=recent&counts=true&limit=1").get_json() == [["document title B", "2023-03-22 14:20:00.000000", 3]]
+  assert client.get("/documents?sort=size").status_code == 400
+
+def test_history_route_returns_revisions_or_buckets_within_a_window(client):
+  '''
+  Given a title with three revisions
+  When we request its history from its second revision, with and without buckets
+  Then we expect the revisions in the window or their hourly statistics, and 400 for an unknown bucket
+  '''
+
+  response = client.get("/documents/document title B/history?from=2023-03-22 14:15:00&metadata_only=true")
+
+  assert [revision[1] for revision in response.get_json()] == ["2023-03-22 14:15:00.000000", "2023-03-22 14:20:00.000000"]
+  assert client.get("/documents/document title B/history?bucket=hour").get_json() == [["2023-03-22 14:00:00.000000", 3, 34, 34, 34]]
+  assert client.get("/documents/document title B/history?bucket=week").status_code == 400
+
+def test_changes_route_pages_with_a_cursor(client):
+  '''
+  Given four revisions across two titles
+  When we request the changes two at a time and follow the cursor
+  Then we expect every revision once in creation order
+  '''
+
+  first_page = client.get("/changes?limit=2")
+  second_page = client.get(f"/changes?limit=2&cursor={first_page.headers['X-Next-Cursor']}")
+
+  assert [change[1] for change in first_page.get_json() + second_page.get_json()] == [
+    "2023-03-22 14:00:00.000000",
+    "2023-03-22 14:10:00.000000",
+    "2023-03-22 14:15:00.000000",
+    "2023-03-22 14:20:00.000000"
+  ]
+  assert client.get("/changes?cursor=invalid").status_code == 400
+
+def test_change_log_route_long_polls_for_new_entries(client):
+  '''
+  Given four logged revisions
+  When we read the change log from the start, then wait briefly after its last entry
+  Then we expect every revision with the last sequence number in a header, then an empty list
+  '''
+
+  response = client.get("/change-log")
+  last_sequence = response.headers["X-Last-Sequence"]
+  waiting_response = client.get(f"/change-log?after={last_sequence}&wait=0.1")
+
+  assert [entry[2] for entry in response.get_json()] == [
+    "2023-03-22 14:00:00.000000",
+    "2023-03-22 14:10:00.000000",
+    "2023-03-22 14:15:00.000000",
+    "2023-03-22 14:20:00.000000"
+  ]
+  assert int(last_sequence) == response.get_json()[-1][0]
+  assert waiting_response.get_json() == []
+  assert waiting_response.headers["X-Last-Sequence"] == last_sequence
@@ -0,0 +1,160 @@
+import pytest
+import sqlite3
+import threading
+import time
+
+from src.database_data_handlers import DatabaseManager
+from src.document_store_actions import DocumentStoreActions
+from src.snapshot import SnapshotConnectionPool
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( "document title B", "2023-03-22 14:10:00.00", "document text content (revision 1)", )
+  ]
+
+@pytest.fixture
+def snapshot_pool(setup_test_db_with_data):
+  pool = SnapshotConnectionPool(database_name)
+
+  yield pool
+
+  pool.close_all()
+
+def count_revisions(pool):
+  with pool.cursor() as cursor:
+    return cursor.execute("SELECT COUNT(*) FROM documents_metadata").fetchone()[0]
+
+def test_snapshot_only_sees_writes_after_a_refresh(snapshot_pool):
+  '''
+  Given a snapshot of a database with one revision
+  When a second revision is saved to the file
+  Then we expect the snapshot to keep one revision until it is refreshed
+  '''
+
+  DatabaseManager(database_name).save_data_to_db("document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)")
+
+  assert count_revisions(snapshot_pool) == 1
+  assert snapshot_pool.has_external_changes()
+
+  assert snapshot_pool.refresh()
+  assert count_revisions(snapshot_pool) == 2
+  assert snapshot_pool.has_external_changes()
+  # Nothing changed since the last copy
+  assert not snapshot_pool.refresh()
+  assert not snapshot_pool.has_external_changes()
+
+def test_snapshot_connections_are_read_only(snapshot_pool):
+  '''
+  Given a snapshot of a database
+  When we try to write through it
+  Then we expect an error
+  '''
+
+  with pytest.raises(sqlite3.OperationalError):
+    with snapshot_pool.cursor() as cursor:
+      cursor.execute("DELETE FROM documents_metadata")
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_connections_to_older_snapshots_are_closed_when_their_threads_finish(snapshot_pool):
+  '''
+  Given reads made from short-lived threads
+  When the snapshot is refreshed between them, once while a thread is still reading the old copy
+  Then we expect only one connection to stay open, to the latest copy
+  '''
+
+  reading = threading.Event()
+  refreshed = threading.Event()
+  counts = []
+
+  def read_across_a_refresh():
+    with snapshot_pool.cursor() as cursor:
+      reading.set()
+      refreshed.wait()
+      counts.append(cursor.execute("SELECT COUNT(*) FROM documents_metadata").fetchone()[0])
+
+  reader = threading.Thread(target=read_across_a_refresh)
+  reader.start()
+  reading.wait()
+  DatabaseManager(database_name).save_data_to_db("document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)")
+  snapshot_pool.refresh()
+  refreshed.set()
+  reader.join()
+
+  for _ in range(10):
+    thread = threading.Thread(target=lambda: counts.append(count_revisions(snapshot_pool)))
+    thread.start()
+    thread.join()
+    snapshot_pool.refresh(force=True)
+
+  assert counts == [1] + [2] * 10
+  assert snapshot_pool.stats()["open_connections"] == 0
+
+def test_has_external_changes_is_shared_by_every_thread(snapshot_pool):
+  '''
+  Given a snapshot pool that has already been asked about changes
+  When other threads ask again without a refresh, and then after one
+  Then we expect False for every thread until the refresh and True once after it
+  '''
+
+  snapshot_pool.has_external_changes()
+  answers = []
+
+  def ask():
+    answers.append(snapshot_pool.has_external_changes())
+
+  for _ in range(3):
+    thread = threading.Thread(target=ask)
+    thread.start()
+    thread.join()
+  snapshot_pool.refresh(force=True)
+  ask()
+  ask()
+
+  assert answers == [False, False, False, True, False]
+
+def test_document_store_actions_reads_its_writes_from_a_refreshed_snapshot():
+  '''
+  Given a DocumentStoreActions reading from a snapshot
+  When it saves a new revision
+  Then we expect the snapshot to be refreshed in the background and list both revisions
+  '''
+
+  document_store_actions = DocumentStoreActions(database_name, snapshot=True)
+  document_store_actions.post_new_document_revision("document title B", "2023-03-22 14:15:00.00", "document text content (revision 2)")
+
+  deadline = time.monotonic() + 5
+  while document_store_actions.read_pool.stats()["refreshes"] < 2 and time.monotonic() < deadline:
+    time.sleep(0.01)
+
+  assert len(document_store_actions.get_documents("document title B")) == 2
+  assert document_store_actions.get_latest_document_revision("document title B")[2] == "document text content (revision 2)"
+  document_store_actions.read_pool.close_all()
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_writes_notified_close_together_share_one_refresh():
+  '''
+  Given a snapshot refreshed at most every half second after writes
+  When three writes are notified one after the other
+  Then we expect a single refresh holding all three, only once the half second has passed
+  '''
+
+  pool = SnapshotConnectionPool(database_name, min_refresh_interval=0.5)
+  database_manager = DatabaseManager(database_name)
+  for minute in range(11, 14):
+    database_manager.save_data_to_db("document title B", f"2023-03-22 14:{minute}:00.00", f"revision at minute {minute}")
+    pool.notify_write()
+
+  time.sleep(0.2)
+  refreshes_before_the_interval = pool.stats()["refreshes"]
+  deadline = time.monotonic() + 5
+  while pool.stats()["refreshes"] < 2 and time.monotonic() < deadline:
+    time.sleep(0.01)
+  time.sleep(0.1)
+
+  assert refreshes_before_the_interval == 1
+  assert pool.stats()["refreshes"] == 2
+  assert count_revisions(pool) == 4
+  pool.close_all()
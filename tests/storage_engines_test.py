@@ -0,0 +1,103 @@
+import pytest
+
+from src.database_data_handlers import DatabaseManager
+from src.document_store_actions import DocumentStoreActions
+from src.storage_engines import CompressedStorageEngine, DeltaStorageEngine, apply_delta, create_delta
+
+database_name = "test_db.db"
+
+title = "document title A"
+revisions = [
+  (f"2023-03-22 14:{minute:02d}:00.00", "\n".join(f"line {line} of revision {minute if line == minute % 5 else 0}" for line in range(5)))
+  for minute in range(10)
+]
+
+@pytest.fixture
+def delta_storage_engine():
+  return DeltaStorageEngine(keyframe_interval=4)
+
+@pytest.fixture
+def document_store_actions(setup_test_db, delta_storage_engine):
+  database_manager = DatabaseManager(database_name, delta_storage_engine)
+  for creation_timestamp, content in revisions:
+    database_manager.save_data_to_db(title, creation_timestamp, content)
+
+  return DocumentStoreActions(database_name, delta_storage_engine)
+
+def test_apply_delta_rebuilds_the_new_content():
+  '''
+  Given two versions of a document
+  When we create a delta between them and apply it to the first version
+  Then we expect to get the second version back
+  '''
+
+  base_content = "first line\nsecond line\nthird line"
+  new_content = "first line\nchanged line\nthird line\nfourth line"
+
+  assert apply_delta(base_content, create_delta(base_content, new_content)) == new_content
+
+def test_delta_storage_engine_stores_a_keyframe_every_interval(setup_test_db, document_store_actions):
+  '''
+  Given a title with ten revisions saved with a keyframe interval of 4
+  When we look at how each revision was stored
+  Then we expect a full snapshot every 4 revisions and deltas in between
+  '''
+
+  rows = setup_test_db.execute("""
+    SELECT storage_format FROM documents_data
+    INNER JOIN documents_metadata ON documents_data.document_id = documents_metadata.document_id
+    ORDER BY creation_timestamp
+  """).fetchall()
+
+  assert [row[0] for row in rows] == [
+    "full", "delta", "delta", "delta",
+    "full", "delta", "delta", "delta",
+    "full", "delta"
+  ]
+
+def test_delta_storage_engine_returns_the_same_revisions_as_full_copies(document_store_actions):
+  '''
+  Given a title with revisions saved as deltas
+  When we read them back through DocumentStoreActions
+  Then we expect the same content that was saved for every revision
+  '''
+
+  document_list = document_store_actions.get_documents(title)
+
+  assert [document[2] for document in document_list] == [content for _, content in revisions]
+
+def test_delta_storage_engine_point_in_time_and_latest_lookups(document_store_actions):
+  '''
+  Given a title with revisions saved as deltas
+  When we ask for a revision at a timestamp and for the latest revision
+  Then we expect the full content of those revisions
+  '''
+
+  document_revision = document_store_actions.get_document_as_it_was_at_a_given_timestamp(title, "2023-03-22 14:06:30.00")
+  latest_document_revision = document_store_actions.get_latest_document_revision(title)
+
+  assert document_revision[2] == revisions[6][1]
+  assert latest_document_revision[2] == revisions[9][1]
+
+def test_compressed_storage_engine_stores_long_content_compressed(setup_test_db):
+  '''
+  Given revisions saved with the compressed storage engine, one of them too short to compress
+  When we read them back and look at how they were stored
+  Then we expect the long revision compressed, the short one as it is and both contents unchanged
+  '''
+
+  long_content = "lorem ipsum dolor sit amet\n" * 100
+  database_manager = DatabaseManager(database_name, CompressedStorageEngine(min_size=256))
+  database_manager.save_data_to_db(title, "2023-03-22 14:00:00.00", long_content)
+  database_manager.save_data_to_db(title, "2023-03-22 14:01:00.00", "short content")
+
+  rows = setup_test_db.execute("""
+    SELECT storage_format, LENGTH(document_content) FROM documents_data
+    INNER JOIN documents_metadata ON documents_data.document_id = documents_metadata.document_id
+    ORDER BY creation_timestamp
+  """).fetchall()
+  document_list = DocumentStoreActions(database_name).get_documents(title)
+
+  assert [row[0] for row in rows] == ["zlib", "full"]
+  assert rows[0][1] < len(long_content)
+  assert [document[2] for document in document_list] == [long_content, "short content"]
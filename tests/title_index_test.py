@@ -0,0 +1,127 @@
+import pytest
+
+from src.database_data_handlers import DatabaseManager
+from src.document_store_actions import DocumentStoreActions
+from src.exceptions import TitleNotFound
+from src.title_index import bounded_edit_distance
+
+database_name = "test_db.db"
+
+@pytest.fixture
+def seed_rows():
+  return [
+    ( document_title, "2023-03-22 14:00:00.00", f"About {document_title}", )
+    for document_title in [ "Mars", "Mercury", "Moon", "Earth", "mars rover" ]
+  ]
+
+@pytest.fixture
+def document_store_actions():
+  return DocumentStoreActions(database_name)
+
+def test_bounded_edit_distance_stops_past_the_bound():
+  '''
+  Given pairs of strings
+  When we compute their edit distance bounded by 2
+  Then we expect the exact distance up to 2 and 3 past it
+  '''
+
+  assert bounded_edit_distance("mars", "mars", 2) == 0
+  assert bounded_edit_distance("mras", "mars", 2) == 2
+  assert bounded_edit_distance("mercury", "mars", 2) == 3
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_suggest_titles_completes_a_prefix_ignoring_case(document_store_actions):
+  '''
+  Given titles starting with "M" and "m"
+  When we ask for suggestions for the prefix "ma"
+  Then we expect the matching titles in alphabetical order and "Mars" as the case insensitive match
+  '''
+
+  assert document_store_actions.suggest_titles("ma") == {
+    "suggestions": ["Mars", "mars rover"],
+    "match": None,
+    "did_you_mean": []
+  }
+  assert document_store_actions.suggest_titles("MARS", limit=1) == {
+    "suggestions": ["Mars"],
+    "match": "Mars",
+    "did_you_mean": []
+  }
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_suggest_titles_offers_close_titles_when_nothing_matches(document_store_actions):
+  '''
+  Given the title "Moon"
+  When we ask for suggestions for the misspelling "Mooon"
+  Then we expect "Moon" as a did you mean suggestion
+  '''
+
+  assert document_store_actions.suggest_titles("Mooon")["did_you_mean"] == ["Moon"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_did_you_mean_finds_titles_misspelled_in_their_first_characters(document_store_actions):
+  '''
+  Given the titles "Mars" and "Earth"
+  When we ask for close titles of "Nars" and "aerth"
+  Then we expect "Mars" and "Earth" even though the first characters differ
+  '''
+
+  assert document_store_actions.title_index.did_you_mean("Nars") == ["Mars"]
+  assert document_store_actions.title_index.did_you_mean("aerth") == ["Earth"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_did_you_mean_finds_long_titles_misspelled_near_their_end(document_store_actions):
+  '''
+  Given "List of rivers" among a hundred other titles starting with "List of"
+  When we ask for close titles of "List of rivrs"
+  Then we expect "List of rivers" first
+  '''
+
+  title_index = document_store_actions.title_index
+  title_index.load()
+  for number in range(100):
+    title_index.add(f"List of river{number:03}")
+  title_index.add("List of rivers")
+
+  assert title_index.did_you_mean("List of rivrs")[0] == "List of rivers"
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_title_index_refresh_adds_titles_saved_by_other_connections(document_store_actions):
+  '''
+  Given a loaded title index
+  When another connection saves a new title and the index is refreshed
+  Then we expect the new title to be suggested
+  '''
+
+  document_store_actions.title_index.load()
+  DatabaseManager(database_name).save_data_to_db("Venus", "2023-03-22 14:00:00.00", "About Venus")
+  document_store_actions.title_index.refresh()
+
+  assert document_store_actions.title_index.suggest("ve") == ["Venus"]
+  assert document_store_actions.title_index.did_you_mean("Vensu") == ["Venus"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_title_index_is_updated_when_a_title_is_saved(document_store_actions):
+  '''
+  Given a loaded title index
+  When a new title is saved through the store's data handler
+  Then we expect it to be suggested without reloading the index
+  '''
+
+  document_store_actions.suggest_titles("")
+  document_store_actions.data_handler.save_data_to_db("Venus", "2023-03-22 14:00:00.00", "About Venus")
+
+  assert document_store_actions.suggest_titles("ve")["suggestions"] == ["Venus"]
+
+@pytest.mark.usefixtures("setup_test_db_with_data")
+def test_title_not_found_suggests_close_titles(document_store_actions):
+  '''
+  Given the title "Earth"
+  When we request the latest revision of "Eatrh"
+  Then we expect TitleNotFound to suggest "Earth"
+  '''
+
+  with pytest.raises(TitleNotFound) as error:
+    document_store_actions.get_latest_document_revision("Eatrh")
+
+  assert "Did you mean: 'Earth'?" in str(error.value)